@@ -0,0 +1,137 @@
+"""
+Local stand-in for the Kubernetes API server, serving a SimulatedCluster over HTTP.
+
+Requests reading and patching individual HPAs can be slowed down and rejected (409, 429) at configurable rates,
+reproducing a busy API server. Requests are counted by method and resource, exposed at /fake/stats for the benchmark
+to measure the API calls klutch makes.
+"""
+import http.server
+import json
+import random
+import threading
+import time
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+from klutch.config import KlutchConfig
+from klutch.simulation import SimulatedCluster
+
+STATS_PATH = "/fake/stats"
+
+
+class FakeApiServer:
+
+    """
+    SimulatedCluster served in a thread of its own once started.
+
+    - hpas: Number of klutch-enabled HPAs, spread over namespaces of hpas_per_namespace each
+    - latency: Seconds added to every request
+    - conflict_rate: Fraction of HPA patches rejected as conflicting (409)
+    - throttle_rate: Fraction of HPA reads and patches rejected as overloaded (429), with retry_after
+    """
+
+    def __init__(
+        self,
+        config: KlutchConfig,
+        hpas: int,
+        hpas_per_namespace: int = 100,
+        latency: float = 0.0,
+        conflict_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: int = 1,
+        seed: int = 0,
+    ):
+        self.cluster = SimulatedCluster(config)
+        self.latency = latency
+        self.conflict_rate = conflict_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        for i in range(hpas):
+            self.cluster.add_hpa(f"ns-{i // hpas_per_namespace}", f"hpa-{i}")
+        self._httpd: Optional[http.server.ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, address: str = "127.0.0.1", port: int = 0):
+        server = self
+
+        class Handler(_Handler):
+            fake = server
+
+        self._httpd = http.server.ThreadingHTTPServer((address, port), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def handle(self, method: str, path: str, query: Dict[str, str], body: Any) -> Tuple[int, bytes]:
+        """Handle request, returning status code and JSON encoded body."""
+        if path == STATS_PATH:
+            return 200, json.dumps(dict(self.cluster.counts)).encode()
+        if self.latency:
+            time.sleep(self.latency)
+        route = self.cluster.route(path)
+        if route is not None and route[0] == "horizontalpodautoscalers" and route[2] is not None:
+            rejected = self._reject(method)
+            if rejected is not None:
+                self.cluster.count(method, route[0])
+                return rejected
+        return self.cluster.handle(method, path, query, body)
+
+    def _reject(self, method: str) -> Optional[Tuple[int, bytes]]:
+        with self._lock:
+            draw = self._random.random()
+        if draw < self.throttle_rate:
+            return 429, json.dumps({"kind": "Status", "code": 429, "message": "Too many requests"}).encode()
+        if method == "PATCH" and draw < self.throttle_rate + self.conflict_rate:
+            return 409, json.dumps({"kind": "Status", "code": 409, "message": "Object has been modified"}).encode()
+        return None
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    fake: FakeApiServer
+
+    protocol_version = "HTTP/1.1"
+    # Headers and body are written separately, which Nagle's algorithm would delay until acknowledged
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self._handle()
+
+    def do_POST(self):
+        self._handle()
+
+    def do_PATCH(self):
+        self._handle()
+
+    def do_DELETE(self):
+        self._handle()
+
+    def _handle(self):
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        code, data = self.fake.handle(self.command, url.path, query, body)
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if code == 429:
+            self.send_header("Retry-After", str(self.fake.retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,206 @@
+"""
+Benchmark scaling sequences against a local FakeApiServer, for increasing numbers of HPAs.
+
+For each number of HPAs, a worker process runs a scaling sequence of ProcessScaler (scale up, reconcile once, revert),
+measuring:
+
+- time_to_first_patch_seconds / time_to_overdrive_seconds: From trigger until the first and last HPA was scaled up
+- reconcile_seconds / reconcile_api_calls: Duration and number of API requests of a single reconcile
+- revert_seconds: Duration of reverting all HPAs at the end of the sequence
+- peak_rss_mib: Peak resident memory of the worker process, not including the fake API server
+
+Usage (from the repository root):
+
+    python -m benchmarks.run --hpas 100,1000,10000 --output results.json
+    python -m benchmarks.run --baseline results.json  # Exits 1 if a measurement regressed beyond --tolerance
+"""
+import io
+import json
+import logging
+import resource
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from argparse import ArgumentParser
+from argparse import Namespace
+from collections import Counter
+from queue import SimpleQueue
+from typing import Any
+from typing import Dict
+from typing import List
+
+from kubernetes import client  # type: ignore
+from nx_config import fill_config  # type: ignore
+from nx_config.format import Format  # type: ignore
+
+from benchmarks.fake_api import FakeApiServer
+from benchmarks.fake_api import STATS_PATH
+from klutch import actions
+from klutch import metrics
+from klutch.config import create_api_client
+from klutch.config import KlutchConfig
+from klutch.ratelimit import RateLimiter
+from klutch.threads import ProcessScaler
+
+# Measurements compared against a baseline. Lower is better for all of them
+COMPARED = (
+    "time_to_first_patch_seconds",
+    "time_to_overdrive_seconds",
+    "reconcile_seconds",
+    "reconcile_api_calls",
+    "revert_seconds",
+    "peak_rss_mib",
+)
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--hpas", default="100,1000,10000", help="Comma separated numbers of HPAs to benchmark")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every API request")
+    parser.add_argument("--conflict-rate", type=float, default=0.0, help="Fraction of HPA patches failing (409)")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="Fraction of HPA requests throttled (429)")
+    parser.add_argument("--patch-concurrency", type=int, default=10)
+    parser.add_argument(
+        "--api-qps", type=float, default=0.0, help="Rate limit of klutch, 0 to disable. Needed to back off on 429"
+    )
+    parser.add_argument("--patch-without-read", choices=("true", "false"), default="true")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--baseline", help="Compare results to this JSON file, as written using --output")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed fraction of increase over baseline")
+    parser.add_argument("--worker", metavar="URL", help="Internal: Run a single benchmark against API server at URL")
+    args = parser.parse_args()
+
+    if args.worker:
+        # Last line of output, as klutch may print while configuring
+        print(json.dumps(run_worker(args)))
+        return
+
+    results = {}
+    for hpas in [int(n) for n in args.hpas.split(",")]:
+        results[str(hpas)] = run_benchmark(hpas, args)
+        print_result(hpas, results[str(hpas)])
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+
+def run_benchmark(hpas: int, args: Namespace) -> Dict[str, Any]:
+    """Start FakeApiServer having hpas HPAs, and benchmark klutch against it in a worker process."""
+    server = FakeApiServer(
+        benchmark_config(args),
+        hpas,
+        latency=args.latency,
+        conflict_rate=args.conflict_rate,
+        throttle_rate=args.throttle_rate,
+    )
+    server.start()
+    try:
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.run", "--worker", server.url, "--hpas", str(hpas)]
+            + ["--patch-concurrency", str(args.patch_concurrency), "--api-qps", str(args.api_qps)]
+            + ["--patch-without-read", args.patch_without_read],
+            stdout=subprocess.PIPE,
+            check=True,
+            text=True,
+        )
+    finally:
+        server.stop()
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def run_worker(args: Namespace) -> Dict[str, Any]:
+    """Run a scaling sequence against the API server at args.worker, returning measurements."""
+    logging.basicConfig(level=logging.ERROR)
+    config = benchmark_config(args)
+    configuration = client.Configuration()
+    configuration.host = args.worker
+    client.Configuration.set_default(configuration)
+    actions.set_api_client(create_api_client(config))
+    if config.common.api_qps > 0:
+        actions.set_rate_limiter(RateLimiter(config.common.api_qps, config.common.api_burst))
+
+    scaler = ProcessScaler(SimpleQueue(), threading.Event(), config)
+    scaler.logger.setLevel(logging.ERROR)
+    result: Dict[str, Any] = {"hpas": int(args.hpas)}
+
+    triggered_at = time.monotonic()
+    scaler._start_sequence(triggered_at)
+    result["time_to_overdrive_seconds"] = time.monotonic() - triggered_at
+    result["time_to_first_patch_seconds"] = metrics.TRIGGER_TO_FIRST_PATCH.sum()
+    result["scaled_up"] = len(scaler.sequence_status.status_list)
+
+    before = _api_calls(args.worker)
+    started_at = time.monotonic()
+    scaler._continue_sequence()
+    result["reconcile_seconds"] = time.monotonic() - started_at
+    calls = _api_calls(args.worker) - before
+    result["reconcile_api_calls"] = sum(calls.values())
+    result["reconcile_api_calls_by_request"] = dict(calls)
+
+    started_at = time.monotonic()
+    scaler._end_sequence()
+    result["revert_seconds"] = time.monotonic() - started_at
+
+    # Kilobytes on Linux
+    result["peak_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return result
+
+
+def benchmark_config(args: Namespace) -> KlutchConfig:
+    config = KlutchConfig()
+    fill_config(
+        config,
+        stream=io.StringIO(
+            "\n".join(
+                [
+                    "common:",
+                    "  klutch_namespace: klutch",
+                    f"  patch_concurrency: {args.patch_concurrency}",
+                    f"  patch_without_read: {args.patch_without_read}",
+                    f"  api_qps: {args.api_qps}",
+                    f"  api_connection_pool_size: {args.patch_concurrency + 10}",
+                ]
+            )
+        ),
+        fmt=Format.yaml,
+    )
+    return config
+
+
+def compare(baseline: Dict[str, Dict[str, Any]], results: Dict[str, Dict[str, Any]], tolerance: float) -> List[str]:
+    """Return description of each measurement exceeding its baseline value by more than tolerance."""
+    regressions = []
+    for hpas, result in results.items():
+        for key in COMPARED:
+            expected = baseline.get(hpas, {}).get(key)
+            if expected is not None and result[key] > expected * (1 + tolerance):
+                regressions.append(f"{hpas} HPAs: {key} {result[key]:.3f} exceeds baseline {expected:.3f}")
+    return regressions
+
+
+def print_result(hpas: int, result: Dict[str, Any]):
+    print(
+        f"{hpas:>6} HPAs: scaled up {result['scaled_up']}, "
+        f"first patch {result['time_to_first_patch_seconds']:.3f}s, "
+        f"overdrive {result['time_to_overdrive_seconds']:.3f}s, "
+        f"reconcile {result['reconcile_seconds']:.3f}s ({result['reconcile_api_calls']} calls), "
+        f"revert {result['revert_seconds']:.3f}s, "
+        f"peak RSS {result['peak_rss_mib']:.1f} MiB"
+    )
+
+
+def _api_calls(url: str) -> Counter:
+    with urllib.request.urlopen(url + STATS_PATH) as resp:
+        return Counter(json.load(resp))
+
+
+if __name__ == "__main__":
+    main()
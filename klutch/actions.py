@@ -1,52 +1,154 @@
 import json
 import logging
 import math
-from datetime import datetime
+from dataclasses import replace
+from functools import partial
+from typing import Any
+from typing import Callable
+from typing import Dict
 from typing import Iterable
+from typing import Iterator
 from typing import List
+from typing import Optional
+from typing import Set
 from typing import Tuple
+from typing import TypeVar
 
 from kubernetes import client  # type: ignore
+from kubernetes import watch  # type: ignore
 
+from klutch import clock
+from klutch import protobuf
+from klutch.cache import AnyHpaCache
 from klutch.config import KlutchConfig
+from klutch.metrics import RECONCILE_DRIFT
+from klutch.metrics import timed
+from klutch.models import HorizontalPodAutoscaler
+from klutch.models import hpa_from_dict
+from klutch.models import hpa_list_from_dict
+from klutch.models import ObjectList
+from klutch.models import partial_object_metadata_list_from_dict
+from klutch.plan import ScaleTarget
+from klutch.pool import map_concurrently
+from klutch.ratelimit import RateLimiter
 from klutch.status import create_hpa_status
+from klutch.status import encode_status_list
 from klutch.status import HpaStatus
 
 logger = logging.getLogger(__name__)
 
+T = TypeVar("T")
 
-def find_cm_triggers(config: KlutchConfig) -> List[client.models.v1_config_map.V1ConfigMap]:
-    """Find any configmap labeled as trigger and return it. Recent first."""
-    resp = client.CoreV1Api().list_namespaced_config_map(
-        config.common.namespace,
-        label_selector="{}={}".format(
-            config.trigger_config_map.cm_trigger_label_key,
-            config.trigger_config_map.cm_trigger_label_value,
-        ),
-    )
-    return sorted(
+# Number of times listing is started when continue token expires while paging
+LIST_MAX_ATTEMPTS = 3
+# Number of times a rate limited request is made when the API server responds it is overloaded
+REQUEST_MAX_ATTEMPTS = 5
+
+HPA_PATH = "/apis/autoscaling/v1/horizontalpodautoscalers"
+NAMESPACED_HPA_PATH = "/apis/autoscaling/v1/namespaces/{namespace}/horizontalpodautoscalers"
+NAMESPACED_CM_PATH = "/api/v1/namespaces/{namespace}/configmaps"
+# Has API server return metadata of objects only
+CONTENT_TYPE_PARTIAL_METADATA_LIST = "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+# AppsV1Api methods patching the scale subresource, by apiVersion and kind of scaleTargetRef
+SCALE_TARGET_PATCH_METHODS = {
+    ("apps/v1", "Deployment"): "patch_namespaced_deployment_scale",
+    ("apps/v1", "StatefulSet"): "patch_namespaced_stateful_set_scale",
+    ("apps/v1", "ReplicaSet"): "patch_namespaced_replica_set_scale",
+}
+
+# ApiClient shared by all actions, set using set_api_client. If None, each API call creates its own ApiClient
+_api_client: Optional[client.ApiClient] = None
+# RateLimiter shared by all actions, set using set_rate_limiter. If None, requests are not limited
+_rate_limiter: Optional[RateLimiter] = None
+
+
+def set_api_client(api_client: Optional[client.ApiClient]):
+    """Set ApiClient to be used by all actions, reusing its pooled connections."""
+    global _api_client
+    _api_client = api_client
+
+
+def set_rate_limiter(rate_limiter: Optional[RateLimiter]):
+    """Set RateLimiter limiting requests reading and patching individual HPAs, as made in bulk by all actions."""
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+@timed
+def list_cm_triggers(config: KlutchConfig) -> Tuple[List[client.models.v1_config_map.V1ConfigMap], str]:
+    """Find any configmap labeled as trigger. Recent first, along with the resourceVersion of the list."""
+    resp = _list_config_maps(config, _cm_trigger_label_selector(config))
+    items = sorted(
         resp.items,
         key=lambda n: n.metadata.creation_timestamp.timestamp(),
         reverse=True,
     )
+    return items, resp.metadata.resource_version
+
+
+@timed
+def find_cm_triggers(config: KlutchConfig) -> List[client.models.v1_config_map.V1ConfigMap]:
+    """Find any configmap labeled as trigger and return it. Recent first."""
+    items, _ = list_cm_triggers(config)
+    return items
+
+
+def watch_cm_triggers(
+    config: KlutchConfig, resource_version: str, timeout_seconds: int
+) -> Iterable[Tuple[str, Optional[client.models.v1_config_map.V1ConfigMap], str]]:
+    """
+    Watch configmaps labeled as trigger, starting at resource_version.
+
+    Yields tuples of event type, ConfigMap (None for bookmarks) and resourceVersion.
+    Raises ApiException having status 410 if resource_version is too old, requiring a relist.
+    """
+    if _use_protobuf(config):
+        yield from _watch_protobuf(
+            NAMESPACED_CM_PATH,
+            {"namespace": config.common.namespace},
+            {
+                "labelSelector": _cm_trigger_label_selector(config),
+                "resourceVersion": resource_version,
+                "timeoutSeconds": timeout_seconds,
+            },
+            protobuf.decode_config_map,
+        )
+        return
+    w = watch.Watch()
+    for event in w.stream(
+        client.CoreV1Api(_api_client).list_namespaced_config_map,
+        config.common.namespace,
+        label_selector=_cm_trigger_label_selector(config),
+        resource_version=resource_version,
+        timeout_seconds=timeout_seconds,
+        allow_watch_bookmarks=True,
+    ):
+        if event["type"] == "BOOKMARK":
+            yield event["type"], None, event["raw_object"]["metadata"]["resourceVersion"]
+        else:
+            yield event["type"], event["object"], event["object"].metadata.resource_version
 
 
 def validate_cm_trigger(config: KlutchConfig, trigger: client.models.v1_config_map.V1ConfigMap) -> bool:
     """Evaluate trigger ConfigMap age, returning True if valid."""
     cm_ts = trigger.metadata.creation_timestamp.timestamp()
-    now = datetime.now().timestamp()
+    now = clock.time()
     return cm_ts + config.trigger_config_map.max_age >= now
 
 
+@timed
 def delete_cm_trigger(trigger: client.models.v1_config_map.V1ConfigMap):
-    return client.CoreV1Api().delete_namespaced_config_map(trigger.metadata.name, trigger.metadata.namespace)
+    return client.CoreV1Api(_api_client).delete_namespaced_config_map(
+        trigger.metadata.name, trigger.metadata.namespace
+    )
 
 
+@timed
 def find_cm_status(config: KlutchConfig) -> List[client.models.v1_config_map.V1ConfigMap]:
     """Find any ConfigMap labeled as status and return it. Recent first."""
-    resp = client.CoreV1Api().list_namespaced_config_map(
-        config.common.namespace,
-        label_selector="{}={}".format(
+    resp = _list_config_maps(
+        config,
+        "{}={}".format(
             config.common.cm_status_label_key,
             config.common.cm_status_label_value,
         ),
@@ -58,111 +160,371 @@ def find_cm_status(config: KlutchConfig) -> List[client.models.v1_config_map.V1C
     )
 
 
+@timed
 def create_cm_status(config: KlutchConfig, status_list: List[HpaStatus]) -> client.models.v1_config_map.V1ConfigMap:
-    config_map = client.models.v1_config_map.V1ConfigMap(
-        data={"status": json.dumps([s.dict() for s in status_list])},
-        metadata=client.models.V1ObjectMeta(
-            name=config.common.cm_status_name,
-            labels={config.common.cm_status_label_key: config.common.cm_status_label_value},
-        ),
-    )
-    return client.CoreV1Api().create_namespaced_config_map(config.common.namespace, config_map)
+    """
+    Create status ConfigMap, storing status_list compactly. Returns the first shard.
+
+    Lists exceeding common.cm_status_shard_size are stored in multiple ConfigMaps (shards), named after the first.
+    """
+    shards = _status_shards(config, status_list)
+    created = [
+        client.CoreV1Api(_api_client).create_namespaced_config_map(
+            config.common.namespace, _status_config_map(config, index, shard)
+        )
+        for index, shard in enumerate(shards)
+    ]
+    return created[0]
 
 
+@timed
+def update_cm_status(config: KlutchConfig, status_list: List[HpaStatus], start: int = 0):
+    """
+    Update status ConfigMap, e.g. when HPAs were added to the ongoing scaling sequence.
+
+    Only writes shards holding status_list[start:], as status_list is only appended to. Creates shards as needed.
+    """
+    shard_size = config.common.cm_status_shard_size
+    for index, shard in enumerate(_status_shards(config, status_list)):
+        if (index + 1) * shard_size <= start:
+            continue
+        config_map = _status_config_map(config, index, shard)
+        try:
+            client.CoreV1Api(_api_client).patch_namespaced_config_map(
+                config_map.metadata.name,
+                config.common.namespace,
+                # Drops status as written by earlier versions of klutch, which may not coexist in data
+                {"data": None, "binaryData": config_map.binary_data},
+            )
+        except client.exceptions.ApiException as e:
+            if e.status != 404:
+                raise
+            client.CoreV1Api(_api_client).create_namespaced_config_map(config.common.namespace, config_map)
+
+
+@timed
 def delete_cm_status(config: KlutchConfig, logger: logging.Logger):
     """Delete any ConfigMap labeled as status."""
     status_cm_list = find_cm_status(config)
     for cm in status_cm_list:
         try:
-            client.CoreV1Api().delete_namespaced_config_map(cm.metadata.name, cm.metadata.namespace)
+            client.CoreV1Api(_api_client).delete_namespaced_config_map(cm.metadata.name, cm.metadata.namespace)
         except client.exceptions.ApiException:
             logger.exception("Error deleting status ConfigMap")
 
 
-def find_hpas(
+@timed
+def find_namespaces(config: KlutchConfig) -> Optional[List[str]]:
+    """
+    Return namespaces to discover HPAs in, or None if discovering in all namespaces.
+
+    Combines common.namespaces with namespaces matching common.namespace_label_selector, leaving out
+    common.exclude_namespaces.
+    """
+    if not config.common.namespaces and not config.common.namespace_label_selector:
+        return None
+    namespaces = list(config.common.namespaces)
+    if config.common.namespace_label_selector:
+        resp = client.CoreV1Api(_api_client).list_namespace(label_selector=config.common.namespace_label_selector)
+        namespaces.extend(n.metadata.name for n in resp.items if n.metadata.name not in namespaces)
+    return [n for n in namespaces if n not in config.common.exclude_namespaces]
+
+
+@timed
+def list_hpas(
     config: KlutchConfig,
-) -> Iterable[client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler]:
-    """Find any HorizontalPodAutoscaler having klutch annotation."""
-    resp = client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces()
-    k = config.common.hpa_annotation_enabled_key
-    v = config.common.hpa_annotation_enabled_value
-    return filter(lambda h: h.metadata.annotations.get(k, None) == v, resp.items)
+    predicate: Callable[[HorizontalPodAutoscaler], bool] = lambda h: True,
+    namespace: Optional[str] = None,
+    metadata_only: bool = False,
+) -> Tuple[List[HorizontalPodAutoscaler], str]:
+    """
+    List all HorizontalPodAutoscalers matching predicate, returning them along with the resourceVersion of the list.
 
+    Lists in all namespaces, unless namespace is provided.
+    Non-matching HPAs are dropped page by page. Relists if continue token expired while listing.
+    If metadata_only, returns PartialObjectMetadata having only the metadata of each HPA.
+    """
+    for attempt in range(1, LIST_MAX_ATTEMPTS + 1):
+        hpas = []
+        resource_version = None
+        try:
+            for page in _list_hpa_pages(config, namespace, metadata_only):
+                hpas.extend(h for h in page.items if predicate(h))
+                resource_version = resource_version or page.metadata.resource_version
+            return hpas, resource_version
+        except client.exceptions.ApiException as e:
+            if e.status != 410 or attempt == LIST_MAX_ATTEMPTS:
+                raise
+            logger.warning("Continue token expired while listing HorizontalPodAutoscalers. Relisting.")
+    raise RuntimeError("Unreachable")  # pragma: no cover
+
+
+def iter_hpas(
+    config: KlutchConfig,
+    namespaces: Optional[List[str]] = None,
+    metadata_only: bool = False,
+) -> Iterator[HorizontalPodAutoscaler]:
+    """
+    Yield all HorizontalPodAutoscalers, fetching next page only when needed. See list_hpas for metadata_only.
 
-def scale_hpa(
+    If the continue token expires while the consumer is busy with a page, listing restarts,
+    skipping HPAs already yielded. The resulting list is not a consistent snapshot in that case.
+
+    If namespaces are provided, lists those namespaces concurrently instead, yielding HPAs per namespace.
+    """
+    if namespaces is not None:
+        yield from _iter_namespaced_hpas(config, namespaces, metadata_only)
+        return
+
+    seen: Set[Tuple[str, str]] = set()
+    for attempt in range(1, LIST_MAX_ATTEMPTS + 1):
+        try:
+            for page in _list_hpa_pages(config, metadata_only=metadata_only):
+                for hpa in page.items:
+                    key = (hpa.metadata.namespace, hpa.metadata.name)
+                    if key not in seen:
+                        seen.add(key)
+                        yield hpa
+            return
+        except client.exceptions.ApiException as e:
+            if e.status != 410 or attempt == LIST_MAX_ATTEMPTS:
+                raise
+            logger.warning("Continue token expired while listing HorizontalPodAutoscalers. Relisting.")
+
+
+def watch_hpas(
+    config: KlutchConfig, resource_version: str, timeout_seconds: int, namespace: Optional[str] = None
+) -> Iterable[Tuple[str, Optional[HorizontalPodAutoscaler], str]]:
+    """
+    Watch HorizontalPodAutoscalers in all namespaces, or in namespace if provided, starting at resource_version.
+
+    Yields tuples of event type, HPA (None for bookmarks) and resourceVersion.
+    Raises ApiException having status 410 if resource_version is too old, requiring a relist.
+    """
+    if _use_protobuf(config):
+        yield from _watch_protobuf(
+            *_hpa_path(namespace),
+            {
+                "labelSelector": _hpa_label_selector(config),
+                "resourceVersion": resource_version,
+                "timeoutSeconds": timeout_seconds,
+            },
+            protobuf.decode_hpa,
+        )
+        return
+    w = watch.Watch()
+    # Wrapped in partial, hiding the return type from Watch: Leaves events undeserialized, decoded using hpa_from_dict
+    if namespace is None:
+        func = partial(client.AutoscalingV1Api(_api_client).list_horizontal_pod_autoscaler_for_all_namespaces)
+    else:
+        func = partial(client.AutoscalingV1Api(_api_client).list_namespaced_horizontal_pod_autoscaler, namespace)
+    for event in w.stream(
+        func,
+        label_selector=_hpa_label_selector(config),
+        resource_version=resource_version,
+        timeout_seconds=timeout_seconds,
+        allow_watch_bookmarks=True,
+    ):
+        if event["type"] == "BOOKMARK":
+            yield event["type"], None, event["raw_object"]["metadata"]["resourceVersion"]
+        else:
+            hpa = hpa_from_dict(event["raw_object"])
+            yield event["type"], hpa, hpa.metadata.resource_version
+
+
+def find_hpas(
     config: KlutchConfig,
-    hpa: client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler,
-    logger: logging.Logger,
-) -> Tuple[HpaStatus, client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler]:
+    hpa_cache: Optional[AnyHpaCache] = None,
+    metadata_only: bool = False,
+) -> Iterable[HorizontalPodAutoscaler]:
     """
-    Scale up HPA. Return status as well as patched HPA.
+    Find any HorizontalPodAutoscaler opted in to klutch. Uses cache if available and synced.
+
+    Limited to namespaces returned by find_namespaces.
+    If metadata_only, callers only rely on metadata, allowing to list metadata only when not using the cache.
+    """
+    hpas: Iterable[HorizontalPodAutoscaler]
+    namespaces = find_namespaces(config)
+    if hpa_cache is not None and hpa_cache.is_synced():
+        hpas = hpa_cache.list()
+        if namespaces is not None:
+            hpas = [h for h in hpas if h.metadata.namespace in namespaces]
+    else:
+        hpas = iter_hpas(config, namespaces, metadata_only)
+    return filter(lambda h: is_enabled_hpa(config, h), hpas)
+
+
+def is_enabled_hpa(config: KlutchConfig, hpa: HorizontalPodAutoscaler) -> bool:
+    """
+    Return True if HPA opted in to klutch, via annotation and/or label depending on common.hpa_opt_in.
+
+    HPAs in common.exclude_namespaces are never enabled.
+    """
+    if hpa.metadata.namespace in config.common.exclude_namespaces:
+        return False
+    has_annotation = (hpa.metadata.annotations or {}).get(
+        config.common.hpa_annotation_enabled_key, None
+    ) == config.common.hpa_annotation_enabled_value
+    has_label = (hpa.metadata.labels or {}).get(
+        config.common.hpa_label_enabled_key, None
+    ) == config.common.hpa_label_enabled_value
+    if config.common.hpa_opt_in == "label":
+        return has_label
+    if config.common.hpa_opt_in == "any":
+        return has_annotation or has_label
+    return has_annotation
+
+
+def priority_waves(
+    config: KlutchConfig, hpas: Iterable[HorizontalPodAutoscaler], logger: logging.Logger
+) -> List[Tuple[int, List[HorizontalPodAutoscaler]]]:
+    """
+    Group HPAs by priority, highest first. Returns tuples of priority and HPAs having it.
+
+    Priority is an integer annotated using common.hpa_annotation_priority, defaulting to 0 if missing or invalid.
+    """
+    waves: Dict[int, List[HorizontalPodAutoscaler]] = {}
+    for hpa in hpas:
+        value = (hpa.metadata.annotations or {}).get(config.common.hpa_annotation_priority)
+        try:
+            priority = 0 if value is None else int(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Ignoring invalid priority {value!r} of {hpa_repr(hpa)}")
+            priority = 0
+        waves.setdefault(priority, []).append(hpa)
+    return sorted(waves.items(), key=lambda w: -w[0])
+
+
+def plan_scale_hpa(config: KlutchConfig, hpa: HorizontalPodAutoscaler) -> ScaleTarget:
+    """
+    Calculate scale up of HPA, without patching it.
 
     Raises: ValueError, TypeError
     """
 
-    hpa_repr = _hpa_repr(hpa)
+    repr = hpa_repr(hpa)
     scale_perc_of_actual = int(hpa.metadata.annotations.get(config.common.hpa_annotation_scale_perc_of_actual))
 
     if hpa.metadata.annotations.get(config.common.hpa_annotation_status):
-        raise ValueError(f"Can not scale up {hpa_repr}. Already has been scaled up.")
+        raise ValueError(f"Can not scale up {repr}. Already has been scaled up.")
 
     spec_min_replicas = hpa.spec.min_replicas
     spec_max_replicas = hpa.spec.max_replicas
 
     # Calculate and validate scale target
-    scale_target_min_replicas = math.ceil(hpa.status.current_replicas * scale_perc_of_actual / 100)
+    intended_min_replicas = math.ceil(hpa.status.current_replicas * scale_perc_of_actual / 100)
+
+    if intended_min_replicas <= spec_min_replicas:
+        raise ValueError(f"Can not scale up {repr}: Would decrease minReplicas (deployment not correctly started?).")
+
+    hpa_status = create_hpa_status(min(intended_min_replicas, spec_max_replicas), hpa)
+    return ScaleTarget(
+        resource_version=hpa.metadata.resource_version,
+        hpa_status=hpa_status,
+        patch=_scale_patch(config, hpa_status),
+        intended_min_replicas=intended_min_replicas,
+    )
 
-    if scale_target_min_replicas <= spec_min_replicas:
-        raise ValueError(
-            f"Can not scale up {hpa_repr}: Would decrease minReplicas (deployment not correctly started?)."
-        )
 
-    if scale_target_min_replicas > spec_max_replicas:
+@timed
+def scale_hpa(
+    config: KlutchConfig,
+    hpa: HorizontalPodAutoscaler,
+    logger: logging.Logger,
+    target: Optional[ScaleTarget] = None,
+) -> Tuple[HpaStatus, HorizontalPodAutoscaler]:
+    """
+    Scale up HPA. Return status as well as patched HPA.
+
+    Uses target if provided (see ScalePlan), only updating the time it is applied at, else calculates it.
+
+    Raises: ValueError, TypeError
+    """
+
+    if target is None:
+        target = plan_scale_hpa(config, hpa)
+        hpa_status, patch = target.hpa_status, target.patch
+    else:
+        hpa_status = replace(target.hpa_status, status=replace(target.hpa_status.status, appliedAt=int(clock.time())))
+        patch = {**target.patch, "metadata": {"annotations": _status_annotation(config, hpa_status)}}
+
+    if target.intended_min_replicas > hpa_status.status.appliedMinReplicas:
         logger.warning(
-            f"Limiting minReplicas to maxReplicas value of {spec_max_replicas} instead of intended value {scale_target_min_replicas} for {hpa_repr})"
+            f"Limiting minReplicas to maxReplicas value of {hpa.spec.max_replicas} instead of intended value {target.intended_min_replicas} for {hpa_repr(hpa)})"
         )
-        scale_target_min_replicas = hpa.spec.max_replicas
 
     # Patch HPA with scale target and status data
-    hpa_status = create_hpa_status(scale_target_min_replicas, hpa)
-    patch = {
-        "metadata": {
-            "annotations": {config.common.hpa_annotation_status: json.dumps(hpa_status.dict().get("status"))}
-        },
-        "spec": {"minReplicas": scale_target_min_replicas},
-    }
-    patched_hpa = client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler(
-        hpa.metadata.name, hpa.metadata.namespace, patch
+    patched_hpa = _patch_hpa(hpa.metadata.name, hpa.metadata.namespace, patch)
+    logger.info(
+        f"Scaled minReplicas from {hpa.spec.min_replicas} to {hpa_status.status.appliedMinReplicas} for {hpa_repr(hpa)}"
     )
-    logger.info(f"Scaled minReplicas from {spec_min_replicas} to {scale_target_min_replicas} for {hpa_repr}")
 
-    return hpa_status, patched_hpa
+    if config.common.patch_scale_target:
+        try:
+            scale_target(hpa, hpa_status.status.appliedMinReplicas, logger)
+        except client.exceptions.ApiException as e:
+            # HPA controller will still scale up, once it syncs
+            logger.warning(f"Error scaling target of {hpa_repr(hpa)}: {e}")
 
+    return hpa_status, patched_hpa
 
-def revert_hpa(
-    config: KlutchConfig, hpa_status: HpaStatus, logger: logging.Logger
-) -> client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler:
-    """Restore minReplicas to original value and remove status annotation."""
 
-    # Load hpa first to determine if annotation hasn't been removed (e.g. by a deployment) which would cause patch to fail
-    hpa = client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler(hpa_status.name, hpa_status.namespace)
-    patch = [
-        {"op": "replace", "path": "/spec/minReplicas", "value": hpa_status.status.originalMinReplicas},
-    ]
-    if config.common.hpa_annotation_status in hpa.metadata.annotations:
-        patch.append(
-            {
-                "op": "remove",
-                "path": "/metadata/annotations/{}".format(config.common.hpa_annotation_status.replace("/", "~1")),
-            }
-        )
+@timed
+def scale_target(hpa: HorizontalPodAutoscaler, replicas: int, logger: logging.Logger) -> bool:
+    """
+    Scale workload targeted by HPA to replicas using its scale subresource. Returns True if patched.
 
-    patched_hpa = client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler(
-        hpa_status.name, hpa_status.namespace, patch
+    Only scales up: Skipped if the HPA reports the workload to have at least replicas already.
+    Skipped if the kind of workload is not supported, see SCALE_TARGET_PATCH_METHODS.
+    """
+    ref = hpa.spec.scale_target_ref
+    method = SCALE_TARGET_PATCH_METHODS.get((ref.api_version, ref.kind))
+    if method is None:
+        logger.debug(f"Not scaling target {ref.kind} ({ref.api_version}) of {hpa_repr(hpa)}: Not supported")
+        return False
+    if hpa.status.current_replicas >= replicas:
+        return False
+    _limited(
+        getattr(client.AppsV1Api(_api_client), method),
+        ref.name,
+        hpa.metadata.namespace,
+        {"spec": {"replicas": replicas}},
+        _preload_content=False,
     )
+    logger.info(f"Scaled {ref.kind} {ref.name} from {hpa.status.current_replicas} to {replicas} for {hpa_repr(hpa)}")
+    return True
+
+
+@timed
+def revert_hpa(config: KlutchConfig, hpa_status: HpaStatus, logger: logging.Logger) -> HorizontalPodAutoscaler:
+    """Restore minReplicas to original value and remove status annotation."""
+
+    patch: Any
+    if config.common.patch_without_read:
+        # Removing an annotation using a merge patch does not fail if it was removed already, no need to load hpa
+        patch = {
+            "metadata": {"annotations": {config.common.hpa_annotation_status: None}},
+            "spec": {"minReplicas": hpa_status.status.originalMinReplicas},
+        }
+    else:
+        # Load hpa first to determine if annotation hasn't been removed (e.g. by a deployment) which would cause
+        # patch to fail
+        hpa = _read_hpa(config, hpa_status.namespace, hpa_status.name)
+        patch = [
+            {"op": "replace", "path": "/spec/minReplicas", "value": hpa_status.status.originalMinReplicas},
+        ]
+        if config.common.hpa_annotation_status in (hpa.metadata.annotations or {}):
+            patch.append(
+                {
+                    "op": "remove",
+                    "path": "/metadata/annotations/{}".format(config.common.hpa_annotation_status.replace("/", "~1")),
+                }
+            )
+
+    patched_hpa = _patch_hpa(hpa_status.name, hpa_status.namespace, patch)
     logger.info(
         "Scaled minReplicas from {applied_min_replicas} to {original_min_replicas} for {repr})".format(
-            repr=_hpa_repr(patched_hpa),
+            repr=hpa_repr(patched_hpa),
             applied_min_replicas=hpa_status.status.appliedMinReplicas,
             original_min_replicas=hpa_status.status.originalMinReplicas,
         )
@@ -170,17 +532,45 @@ def revert_hpa(
     return patched_hpa
 
 
+@timed
+def step_down_hpa(
+    config: KlutchConfig, hpa_status: HpaStatus, min_replicas: int, logger: logging.Logger
+) -> HorizontalPodAutoscaler:
+    """Lower minReplicas while ramping down, keeping status annotation until reverted by revert_hpa."""
+    patched_hpa = _patch_hpa(hpa_status.name, hpa_status.namespace, {"spec": {"minReplicas": min_replicas}})
+    logger.info(
+        f"Stepped minReplicas down from {hpa_status.status.appliedMinReplicas} to {min_replicas} "
+        f"(original {hpa_status.status.originalMinReplicas}) for {hpa_repr(patched_hpa)}"
+    )
+    return patched_hpa
+
+
+@timed
 def reconcile_hpa(
-    config: KlutchConfig, hpa_status: HpaStatus, logger: logging.Logger
-) -> client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler:
-    """Examine HPA and ensure minReplicas has overdrive value and annotation is set."""
+    config: KlutchConfig,
+    hpa_status: HpaStatus,
+    logger: logging.Logger,
+    hpa: Optional[HorizontalPodAutoscaler] = None,
+) -> HorizontalPodAutoscaler:
+    """
+    Examine HPA and ensure minReplicas has overdrive value and annotation is set.
 
-    # Load hpa first to determine if annotation hasn't been removed (e.g. by a deployment) which would cause patch to fail
-    hpa = client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler(hpa_status.name, hpa_status.namespace)
-    repr = _hpa_repr(hpa)
+    If provided, examines hpa (e.g. obtained from cache) instead of loading it. Else, if common.patch_without_read,
+    patches without examining: The merge patch sets absolute values, so applying it to a reconciled HPA changes nothing.
+    """
+
+    if hpa is None and config.common.patch_without_read:
+        patched_hpa = _patch_hpa(hpa_status.name, hpa_status.namespace, _scale_patch(config, hpa_status))
+        logger.debug(f"Reconciled {hpa_repr(patched_hpa)}")
+        return patched_hpa
+    if hpa is None:
+        # Load hpa first to determine if annotation hasn't been removed (e.g. by a deployment),
+        # which would cause patch to fail
+        hpa = _read_hpa(config, hpa_status.namespace, hpa_status.name)
+    repr = hpa_repr(hpa)
     patch = []
 
-    if config.common.hpa_annotation_status not in hpa.metadata.annotations:
+    if config.common.hpa_annotation_status not in (hpa.metadata.annotations or {}):
         patch.append(
             {
                 "op": "add",
@@ -193,14 +583,250 @@ def reconcile_hpa(
     if not patch:
         logger.debug(f"No reconcile needed for {repr})")
         return hpa
-    patched_hpa = client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler(
-        hpa_status.name, hpa_status.namespace, patch
-    )
-    logger.info("Reconciled {repr}")
+    RECONCILE_DRIFT.inc()
+    patched_hpa = _patch_hpa(hpa_status.name, hpa_status.namespace, patch)
+    logger.info(f"Reconciled {repr}")
     return patched_hpa
 
 
-def _hpa_repr(hpa: client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler):
+def _iter_namespaced_hpas(
+    config: KlutchConfig, namespaces: List[str], metadata_only: bool = False
+) -> Iterator[HorizontalPodAutoscaler]:
+    """List HPAs in namespaces concurrently. Errors are logged, not affecting other namespaces."""
+    for namespace, result, exception in map_concurrently(
+        lambda n: list_hpas(config, namespace=n, metadata_only=metadata_only),
+        namespaces,
+        config.common.discovery_concurrency,
+    ):
+        if exception is not None:
+            logger.error(
+                f"Error listing HorizontalPodAutoscalers in namespace {namespace}: {exception}", exc_info=exception
+            )
+        else:
+            hpas, _ = result
+            yield from hpas
+
+
+def _list_hpa_pages(
+    config: KlutchConfig, namespace: Optional[str] = None, metadata_only: bool = False
+) -> Iterator[ObjectList[HorizontalPodAutoscaler]]:
+    """List HorizontalPodAutoscalers in pages of common.list_page_size, following continue tokens."""
+    _continue = None
+    while True:
+        kwargs = dict(
+            label_selector=_hpa_label_selector(config),
+            limit=config.common.list_page_size or None,
+            _continue=_continue,
+        )
+        query_params = {
+            "labelSelector": kwargs["label_selector"],
+            "limit": kwargs["limit"],
+            "continue": _continue,
+        }
+        if metadata_only and _use_protobuf(config):
+            page = protobuf.decode_partial_object_metadata_list(
+                _get_raw(*_hpa_path(namespace), query_params, protobuf.CONTENT_TYPE_PARTIAL_METADATA_LIST).data
+            )
+        elif metadata_only:
+            page = partial_object_metadata_list_from_dict(
+                json.loads(_get_raw(*_hpa_path(namespace), query_params, CONTENT_TYPE_PARTIAL_METADATA_LIST).data)
+            )
+        elif _use_protobuf(config):
+            page = protobuf.decode_hpa_list(_get_raw(*_hpa_path(namespace), query_params).data)
+        elif namespace is None:
+            page = hpa_list_from_dict(
+                _json(
+                    client.AutoscalingV1Api(_api_client).list_horizontal_pod_autoscaler_for_all_namespaces(
+                        **kwargs, _preload_content=False
+                    )
+                )
+            )
+        else:
+            page = hpa_list_from_dict(
+                _json(
+                    client.AutoscalingV1Api(_api_client).list_namespaced_horizontal_pod_autoscaler(
+                        namespace, **kwargs, _preload_content=False
+                    )
+                )
+            )
+        yield page
+        _continue = page.metadata._continue
+        if not _continue:
+            return
+
+
+def _scale_patch(config: KlutchConfig, hpa_status: HpaStatus) -> Dict[str, Any]:
+    return {
+        "metadata": {"annotations": _status_annotation(config, hpa_status)},
+        "spec": {"minReplicas": hpa_status.status.appliedMinReplicas},
+    }
+
+
+def _status_annotation(config: KlutchConfig, hpa_status: HpaStatus) -> Dict[str, str]:
+    return {config.common.hpa_annotation_status: json.dumps(hpa_status.dict().get("status"))}
+
+
+def _status_shards(config: KlutchConfig, status_list: List[HpaStatus]) -> List[List[HpaStatus]]:
+    shard_size = config.common.cm_status_shard_size
+    return [status_list[i : i + shard_size] for i in range(0, len(status_list), shard_size)] or [[]]
+
+
+def _status_config_map(
+    config: KlutchConfig, index: int, status_list: List[HpaStatus]
+) -> client.models.v1_config_map.V1ConfigMap:
+    return client.models.v1_config_map.V1ConfigMap(
+        binary_data={"status": encode_status_list(status_list)},
+        metadata=client.models.V1ObjectMeta(
+            name=config.common.cm_status_name if index == 0 else f"{config.common.cm_status_name}-{index}",
+            labels={config.common.cm_status_label_key: config.common.cm_status_label_value},
+            annotations={config.common.cm_status_shard_key: str(index)},
+        ),
+    )
+
+
+def _read_hpa(config: KlutchConfig, namespace: str, name: str) -> HorizontalPodAutoscaler:
+    if _use_protobuf(config):
+        path, path_params = _hpa_path(namespace)
+        return protobuf.decode_hpa(_limited(_get_raw, path + "/{name}", {**path_params, "name": name}, {}).data)
+    return hpa_from_dict(
+        _json(
+            _limited(
+                client.AutoscalingV1Api(_api_client).read_namespaced_horizontal_pod_autoscaler,
+                name,
+                namespace,
+                _preload_content=False,
+            )
+        )
+    )
+
+
+def _patch_hpa(name: str, namespace: str, patch: Any) -> HorizontalPodAutoscaler:
+    return hpa_from_dict(
+        _json(
+            _limited(
+                client.AutoscalingV1Api(_api_client).patch_namespaced_horizontal_pod_autoscaler,
+                name,
+                namespace,
+                patch,
+                _preload_content=False,
+            )
+        )
+    )
+
+
+def _limited(func: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Make API request calling func, once allowed by rate limiter (if set).
+
+    When the API server responds it is overloaded (429, 503), backs off and retries, honoring Retry-After.
+    """
+    if _rate_limiter is None:
+        return func(*args, **kwargs)
+    attempt = 1
+    while True:
+        _rate_limiter.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except client.exceptions.ApiException as e:
+            if e.status not in (429, 503) or attempt >= REQUEST_MAX_ATTEMPTS:
+                raise
+            logger.warning(f"API server overloaded ({e.status}), backing off.")
+            _rate_limiter.backoff(_retry_after(e))
+            attempt += 1
+            continue
+        _rate_limiter.success()
+        return result
+
+
+def _retry_after(e: client.exceptions.ApiException) -> Optional[float]:
+    """Return seconds of Retry-After header of response, None if absent or not in seconds."""
+    try:
+        return float((e.headers or {}).get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _json(resp) -> Any:
+    """Decode JSON body of urllib3 response, as returned by API methods called using _preload_content=False."""
+    return json.loads(resp.data)
+
+
+def _list_config_maps(config: KlutchConfig, label_selector: str) -> client.models.V1ConfigMapList:
+    """List ConfigMaps in klutch namespace matching label_selector."""
+    if _use_protobuf(config):
+        return protobuf.decode_config_map_list(
+            _get_raw(
+                NAMESPACED_CM_PATH, {"namespace": config.common.namespace}, {"labelSelector": label_selector}
+            ).data
+        )
+    return client.CoreV1Api(_api_client).list_namespaced_config_map(
+        config.common.namespace, label_selector=label_selector
+    )
+
+
+def _use_protobuf(config: KlutchConfig) -> bool:
+    return config.common.api_content_type == "protobuf"
+
+
+def _hpa_path(namespace: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    """Return path and path parameters to HPAs in all namespaces, or in namespace if provided."""
+    if namespace is None:
+        return HPA_PATH, {}
+    return NAMESPACED_HPA_PATH, {"namespace": namespace}
+
+
+def _get_raw(
+    path: str, path_params: Dict[str, str], query_params: Dict[str, Any], accept: str = protobuf.CONTENT_TYPE
+):
+    """
+    GET path, requesting accept content type (default protobuf). Returns the undecoded urllib3 response.
+
+    The generated API methods can not negotiate the content type, so the ApiClient is used directly.
+    Query parameters having value None are left out.
+    """
+    api_client = _api_client or client.ApiClient()
+    return api_client.call_api(
+        path,
+        "GET",
+        path_params=path_params,
+        query_params=[(k, v) for k, v in query_params.items() if v is not None],
+        header_params={"Accept": accept},
+        auth_settings=["BearerToken"],
+        _return_http_data_only=True,
+        _preload_content=False,
+    )
+
+
+def _watch_protobuf(
+    path: str, path_params: Dict[str, str], query_params: Dict[str, Any], decoder: Callable[[bytes], Any]
+) -> Iterator[Tuple[str, Any, str]]:
+    """Watch path using protobuf encoding, yielding tuples like watch_hpas and watch_cm_triggers."""
+    resp = _get_raw(path, path_params, {**query_params, "watch": "true", "allowWatchBookmarks": "true"})
+    try:
+        for frame in protobuf.iter_frames(resp.read):
+            event_type, obj, code = protobuf.decode_watch_event(frame, decoder)
+            if event_type == "ERROR":
+                raise client.exceptions.ApiException(status=code)
+            yield event_type, None if event_type == "BOOKMARK" else obj, obj.metadata.resource_version
+    finally:
+        resp.release_conn()
+
+
+def _hpa_label_selector(config: KlutchConfig) -> Optional[str]:
+    """Return label selector having API server only return klutch-enabled HPAs, if opting in by label only."""
+    if config.common.hpa_opt_in != "label":
+        return None
+    return "{}={}".format(config.common.hpa_label_enabled_key, config.common.hpa_label_enabled_value)
+
+
+def _cm_trigger_label_selector(config: KlutchConfig) -> str:
+    return "{}={}".format(
+        config.trigger_config_map.cm_trigger_label_key,
+        config.trigger_config_map.cm_trigger_label_value,
+    )
+
+
+def hpa_repr(hpa: HorizontalPodAutoscaler):
     """Return string representation of HPA for logging purposes."""
     name = hpa.metadata.name
     namespace = hpa.metadata.namespace
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import signal
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+from typing import List
+from typing import Optional
+
+from klutch.config import KlutchConfig
+from klutch.scheduler import jittered
+from klutch.threads import BaseThread
+
+
+class AsyncHandler:
+
+    """
+    Alternative to ThreadHandler, running components as tasks on a single asyncio event loop.
+
+    Components (BaseThread subclasses) are not started as threads. Instead their run_once is called
+    repeatedly, waiting on the event loop in between, so idle components do not hold a thread.
+    Like Scheduler, waits are interrupted by stop and by wake events of the component, and are jittered.
+    The kubernetes client is blocking, so set_up, run_once and tear_down run in a shared executor,
+    bounded by common.api_connection_pool_size.
+
+    - Traps SIGINT/SIGTERM and gracefully stops components before ending program
+    - Stops all components when one raises an unhandled exception, exiting with exit code 1
+    """
+
+    def __init__(self, config: KlutchConfig):
+        self.components: List[BaseThread] = []
+        self.timeout = 10
+        self.jitter = config.common.schedule_jitter
+        self.executor = ThreadPoolExecutor(
+            max_workers=config.common.api_connection_pool_size, thread_name_prefix="klutch-io"
+        )
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stopping: Optional[asyncio.Event] = None
+        self._wakeups: Dict[BaseThread, asyncio.Event] = {}
+
+    def add(self, component: BaseThread):
+        component.scheduler = self
+        self.components.append(component)
+
+    def start_all(self):
+        sys.exit(asyncio.run(self.run()))
+
+    async def run(self) -> int:
+        """Run all components until stopped. Returns exit code."""
+        loop = self._loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+        self._wakeups = {c: asyncio.Event() for c in self.components}
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, self.handle_signal, signum)
+
+        tasks = [asyncio.create_task(self._run_component(c), name=c.full_name) for c in self.components]
+        done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+        exit_code = 0
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                self.logger.error(f"Caught exception in task: {task.get_name()}", exc_info=task.exception())
+                exit_code = 1
+        if pending:
+            self.stop()
+            _, still_pending = await asyncio.wait(pending, timeout=self.timeout)
+            if still_pending:
+                self.logger.error("Tasks failed to stop within timeout. Aborting.")
+                exit_code = 1
+        if exit_code == 0:
+            self.logger.info("All tasks stopped. Exiting.")
+        self.executor.shutdown(wait=False)
+        return exit_code
+
+    def handle_signal(self, signum: int):
+        self.logger.info(
+            "Received termination signal {sig_name} ({signum})".format(
+                sig_name=signal.Signals(signum).name, signum=signum
+            )
+        )
+        self.stop()
+
+    def stop(self):
+        for c in self.components:
+            c.stop()
+        if self._stopping is not None:
+            self._stopping.set()
+        for wakeup in self._wakeups.values():
+            wakeup.set()
+
+    def wake(self, event: str):
+        """Run components having event in wake_events now, or as soon as their current run finishes. Thread-safe."""
+        for c in self.components:
+            if event in c.wake_events and c in self._wakeups:
+                self._loop.call_soon_threadsafe(self._wakeups[c].set)
+
+    async def _run_component(self, component: BaseThread):
+        loop = asyncio.get_running_loop()
+        wakeup = self._wakeups[component]
+        await loop.run_in_executor(self.executor, component.set_up)
+        try:
+            while not component.should_stop:
+                # Cleared before running, so waking while running causes the next run to start right away
+                wakeup.clear()
+                started = loop.time()
+                delay = await loop.run_in_executor(self.executor, component.run_once)
+                if delay is None:
+                    await self._stopping.wait()
+                    continue
+                remaining = started + jittered(delay, self.jitter) - loop.time()
+                if remaining > 0:
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), remaining)
+                    except asyncio.TimeoutError:
+                        pass
+            component.logger.info("Stopping")
+        finally:
+            await loop.run_in_executor(self.executor, component.tear_down)
+            component.logger.info("Stopped")
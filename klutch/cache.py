@@ -0,0 +1,111 @@
+import threading
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import Union
+
+from klutch.models import HorizontalPodAutoscaler
+
+
+class HpaCache:
+
+    """
+    Local store of HorizontalPodAutoscalers, kept in sync by the WatchHpas thread.
+
+    Follows the informer pattern: Filled by an initial list, after which watch events are applied.
+    Only HPAs matching predicate (typically: opted in to klutch) are stored, dropping them when no longer matching.
+    Holds HPAs of all namespaces, or of namespace if provided.
+    Readers should only rely on the contents when is_synced() returns True.
+    """
+
+    def __init__(
+        self,
+        predicate: Callable[[HorizontalPodAutoscaler], bool] = lambda h: True,
+        namespace: Optional[str] = None,
+    ):
+        self.predicate = predicate
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._synced = threading.Event()
+        self._items: Dict[Tuple[str, str], HorizontalPodAutoscaler] = {}
+        self.resource_version: Optional[str] = None
+
+    def replace(
+        self,
+        hpas: List[HorizontalPodAutoscaler],
+        resource_version: str,
+    ):
+        """Replace all contents with result of a list call."""
+        with self._lock:
+            self._items = {_key(h): h for h in hpas if self.predicate(h)}
+            self.resource_version = resource_version
+        self._synced.set()
+
+    def apply(
+        self,
+        event_type: str,
+        hpa: Optional[HorizontalPodAutoscaler],
+        resource_version: str,
+    ):
+        """Apply watch event."""
+        with self._lock:
+            if event_type in ("ADDED", "MODIFIED") and self.predicate(hpa):
+                self._items[_key(hpa)] = hpa
+            elif event_type in ("ADDED", "MODIFIED", "DELETED"):
+                self._items.pop(_key(hpa), None)
+            self.resource_version = resource_version
+
+    def invalidate(self):
+        """Mark contents as stale, requiring a relist."""
+        self._synced.clear()
+        with self._lock:
+            self.resource_version = None
+
+    def is_synced(self) -> bool:
+        return self._synced.is_set()
+
+    def list(self) -> List[HorizontalPodAutoscaler]:
+        with self._lock:
+            return list(self._items.values())
+
+    def get(self, namespace: str, name: str) -> Optional[HorizontalPodAutoscaler]:
+        with self._lock:
+            return self._items.get((namespace, name))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._items)
+
+
+class HpaCacheSet:
+
+    """
+    Combines HpaCaches of multiple namespaces, offering the reading methods of HpaCache.
+
+    Used when watching per namespace, each HpaCache kept in sync by its own WatchHpas thread.
+    """
+
+    def __init__(self, caches: List[HpaCache]):
+        self.caches = {c.namespace: c for c in caches}
+
+    def is_synced(self) -> bool:
+        return all(c.is_synced() for c in self.caches.values())
+
+    def list(self) -> List[HorizontalPodAutoscaler]:
+        return [h for c in self.caches.values() for h in c.list()]
+
+    def get(self, namespace: str, name: str) -> Optional[HorizontalPodAutoscaler]:
+        cache = self.caches.get(namespace)
+        return cache.get(namespace, name) if cache is not None else None
+
+    def __len__(self) -> int:
+        return sum(len(c) for c in self.caches.values())
+
+
+AnyHpaCache = Union[HpaCache, HpaCacheSet]
+
+
+def _key(hpa: HorizontalPodAutoscaler) -> Tuple[str, str]:
+    return hpa.metadata.namespace, hpa.metadata.name
@@ -0,0 +1,83 @@
+"""
+Time as used by klutch components, replaceable by a VirtualClock to simulate scaling sequences (see simulation).
+
+Components call the module functions time(), monotonic() and sleep() instead of the time module.
+"""
+import threading
+import time as _time
+from typing import Union
+
+
+class SystemClock:
+
+    """Actual time."""
+
+    def time(self) -> float:
+        return _time.time()
+
+    def monotonic(self) -> float:
+        return _time.monotonic()
+
+    def sleep(self, seconds: float):
+        _time.sleep(seconds)
+
+
+class VirtualClock:
+
+    """
+    Time only passing when advanced, e.g. by Simulation moving to the next scheduled run.
+
+    Sleeping advances the clock instead of blocking. Thread-safe, as components may run work concurrently.
+    """
+
+    def __init__(self, start: float = 0.0):
+        self._now = start
+        self._lock = threading.Lock()
+
+    def time(self) -> float:
+        with self._lock:
+            return self._now
+
+    def monotonic(self) -> float:
+        return self.time()
+
+    def sleep(self, seconds: float):
+        self.advance(seconds)
+
+    def advance(self, seconds: float):
+        with self._lock:
+            self._now += max(seconds, 0)
+
+    def advance_to(self, ts: float):
+        """Advance to ts, unless it has passed already."""
+        with self._lock:
+            self._now = max(self._now, ts)
+
+
+AnyClock = Union[SystemClock, VirtualClock]
+
+_clock: AnyClock = SystemClock()
+
+
+def set_clock(clock: AnyClock):
+    """Set clock used by all components, e.g. a VirtualClock. SystemClock is used by default."""
+    global _clock
+    _clock = clock
+
+
+def get_clock() -> AnyClock:
+    return _clock
+
+
+def time() -> float:
+    """Return seconds since the epoch, like time.time()."""
+    return _clock.time()
+
+
+def monotonic() -> float:
+    """Return seconds of a clock that never goes back, like time.monotonic()."""
+    return _clock.monotonic()
+
+
+def sleep(seconds: float):
+    _clock.sleep(seconds)
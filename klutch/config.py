@@ -1,12 +1,16 @@
 import logging
 import os
+import socket
 from datetime import timedelta
 from typing import Optional
+from typing import Tuple
 
+from kubernetes import client as kubernetes_client  # type: ignore
 from kubernetes import config as kubernetes_config  # type: ignore
 from nx_config import Config  # type: ignore
 from nx_config import ConfigSection  # type: ignore
 from nx_config import validate  # type: ignore
+from urllib3.connection import HTTPConnection  # type: ignore
 
 logger = logging.getLogger(__name__)
 
@@ -31,17 +35,86 @@ class CommonSection(CommonSectionMixin, ConfigSection):
     debug: bool = False
     # Period (seconds) after which to restore original values
     duration: int = 300
+    # Period (seconds) following duration, to step minReplicas down to original values in ramp_down_steps steps,
+    # staggered across HPAs. 0: Restore original values at once
+    ramp_down_duration: int = 0
+    ramp_down_steps: int = 4
     # Interval (seconds) used to reconcile hpa status or end scaling sequence
     reconcile_interval: int = 10
     # Interval (seconds) used to scan for orphans
     scan_orphans_interval: int = 600
     # Only needed when running out-of-cluster
     klutch_namespace: str = ""
+    # Namespaces to discover HPAs in, listing (and watching) per namespace. Empty: All namespaces.
+    # Allows running klutch with namespaced RBAC
+    namespaces: Tuple[str, ...] = ()
+    # Label selector on Namespace objects to discover HPAs in, in addition to namespaces. Requires listing namespaces
+    namespace_label_selector: str = ""
+    # Namespaces to never discover HPAs in
+    exclude_namespaces: Tuple[str, ...] = ()
+    # Number of namespaces listed in parallel
+    discovery_concurrency: int = 10
+    # Max number of connections to the API server kept open and reused by all threads.
+    # Should exceed patch_concurrency and discovery_concurrency, and account for one connection per watch
+    api_connection_pool_size: int = 20
+    # Max rate (requests per second) and burst of requests reading and patching individual HPAs, shared by all threads.
+    # Lowered automatically while the API server responds it is overloaded (429, 503). Set api_qps to 0 to disable
+    api_qps: float = 50.0
+    api_burst: int = 100
+    # Enable TCP keep-alive on API server connections, preventing idle pooled connections being dropped
+    api_tcp_keepalive: bool = True
+    # Encoding requested when listing, reading and watching HPAs and ConfigMaps: "json" or "protobuf".
+    # Using "protobuf" shrinks responses and decodes only the fields klutch uses, saving CPU on large clusters
+    api_content_type: str = "json"
+    # How components run: "threads" (one thread each) or "asyncio" (tasks on a single event loop, sharing
+    # a pool of api_connection_pool_size threads for blocking API calls)
+    runtime: str = "threads"
+    # Fraction of an interval randomly added to it, spreading periodic work
+    schedule_jitter: float = 0.1
+    # Keep a local cache of HPAs, using list followed by watch, so a scaling sequence needs no list call
+    hpa_cache_enabled: bool = True
+    # Keep scale targets of all cached HPAs calculated, so a trigger goes straight to patching. Requires hpa_cache_enabled
+    scale_plan_enabled: bool = True
+    # Interval (seconds) used to update the scale plan with changes of cached HPAs
+    scale_plan_interval: int = 5
+    # Timeout (seconds) of a single watch request. Bounds the time needed to stop watching threads
+    watch_timeout: int = 5
+    # Number of HPAs requested per page when listing. Bounds memory needed for listing. Set to 0 to disable paging.
+    # Keep small when patch_concurrency is low, as the continue token might expire while a page is being scaled up
+    list_page_size: int = 500
+    # Revert and reconcile (when not using the cache) HPAs using a single merge patch, instead of loading them first
+    patch_without_read: bool = True
+    # While scaling up, status ConfigMap is updated after every status_checkpoint_size HPAs or
+    # status_checkpoint_interval seconds, whichever comes first, allowing to resume after a restart
+    status_checkpoint_size: int = 100
+    status_checkpoint_interval: float = 1.0
+    # Max number of HPAs stored per status ConfigMap, storing more in additional ConfigMaps (shards).
+    # Keeps ConfigMaps well below the API server limit of 1 MiB
+    cm_status_shard_size: int = 10000
+    # Period (seconds) to retry failed scale ups and reverts, using exponential backoff.
+    # Reverts still failing are left to the orphan scan
+    retry_timeout: int = 60
+    # Number of HPAs patched in parallel when starting a scaling sequence or reconciling
+    patch_concurrency: int = 1
+    # When scaling up, also scale the workload targeted by the HPA (Deployment, StatefulSet or ReplicaSet)
+    # to the applied minReplicas using its scale subresource. Pods start right away, instead of once the HPA controller
+    # syncs. Requires RBAC allowing to patch the scale subresource
+    patch_scale_target: bool = False
 
-    # Should not typically need changing: Annotation names used to configure klutch to act on HPAs
+    # How HPAs opt in to klutch: "annotation", "label" or "any".
+    # Using "label", the API server only returns klutch-enabled HPAs.
+    # Use "any" while migrating from annotation to label.
+    # Note: Using "label", HPAs whose label is removed while scaled up are no longer found by the orphan scan
+    hpa_opt_in: str = "annotation"
+
+    # Should not typically need changing: Annotation and label names used to configure klutch to act on HPAs
     hpa_annotation_enabled_key: str = "klutch.it/enabled"
     hpa_annotation_enabled_value: str = "1"
+    hpa_label_enabled_key: str = "klutch.it/enabled"
+    hpa_label_enabled_value: str = "1"
     hpa_annotation_scale_perc_of_actual: str = "klutch.it/scale-percentage-of-actual"
+    # Integer priority of HPA (default 0). A scaling sequence scales up HPAs in waves by priority, highest first
+    hpa_annotation_priority: str = "klutch.it/priority"
 
     # Should not typically need changing: Annotation name used to store state data while scaling is in progress
     hpa_annotation_status: str = "klutch.it/status"
@@ -50,6 +123,8 @@ class CommonSection(CommonSectionMixin, ConfigSection):
     cm_status_name: str = "klutch-status"
     cm_status_label_key: str = "klutch.it/status"
     cm_status_label_value: str = "1"
+    # Annotation holding index of status ConfigMap, when sharded
+    cm_status_shard_key: str = "klutch.it/status-shard"
 
     @validate
     def validate_reconcile_interval(self):
@@ -57,6 +132,50 @@ class CommonSection(CommonSectionMixin, ConfigSection):
             raise ValueError("reconconcile_interval cannot be larger than duration")
         print(self._in_cluster_namespace)
 
+    @validate
+    def validate_ramp_down(self):
+        if self.ramp_down_duration < 0:
+            raise ValueError("ramp_down_duration should not be negative")
+        if self.ramp_down_steps < 1:
+            raise ValueError("ramp_down_steps should be at least 1")
+
+    @validate
+    def validate_hpa_opt_in(self):
+        if self.hpa_opt_in not in ("annotation", "label", "any"):
+            raise ValueError("hpa_opt_in should be one of: annotation, label, any")
+
+    @validate
+    def validate_runtime(self):
+        if self.runtime not in ("threads", "asyncio"):
+            raise ValueError("runtime should be one of: threads, asyncio")
+
+    @validate
+    def validate_api_content_type(self):
+        if self.api_content_type not in ("json", "protobuf"):
+            raise ValueError("api_content_type should be one of: json, protobuf")
+
+    @validate
+    def validate_api_qps(self):
+        if self.api_qps < 0:
+            raise ValueError("api_qps should not be negative")
+        if self.api_burst < 1:
+            raise ValueError("api_burst should be at least 1")
+
+    @validate
+    def validate_cm_status_shard_size(self):
+        if self.cm_status_shard_size < 1:
+            raise ValueError("cm_status_shard_size should be at least 1")
+
+    @validate
+    def validate_discovery_concurrency(self):
+        if self.discovery_concurrency < 1:
+            raise ValueError("discovery_concurrency should be at least 1")
+
+    @validate
+    def validate_patch_concurrency(self):
+        if self.patch_concurrency < 1:
+            raise ValueError("patch_concurrency should be at least 1")
+
     @validate
     def validate_klutch_namespace(self):
         try:
@@ -75,6 +194,10 @@ class TriggerWebHookSection(ConfigSection):
 
 class TriggerConfigMapSection(ConfigSection):
     enabled: bool = True
+    # Watch for trigger configmaps, acting on them immediately. When disabled, or after watch failure, scan is used
+    watch: bool = True
+    # Period (seconds) to fall back to scanning after watch failure, before attempting to watch again
+    watch_retry_interval: int = 60
     # Interval (seconds) used to scan for trigger configmap
     scan_interval: int = 10
     # Max age (seconds) of configmap trigger before it's ignored and cleaned up
@@ -84,10 +207,18 @@ class TriggerConfigMapSection(ConfigSection):
     cm_trigger_label_value: str = "1"
 
 
+class MetricsSection(ConfigSection):
+    # Serve metrics in Prometheus text format at /metrics
+    enabled: bool = True
+    address: str = "0.0.0.0"
+    port: int = 8124
+
+
 class KlutchConfig(Config):
     common: CommonSection
     trigger_web_hook: TriggerWebHookSection
     trigger_config_map: TriggerConfigMapSection
+    metrics: MetricsSection
 
 
 config = KlutchConfig()
@@ -104,3 +235,23 @@ def configure_kubernetes():
         # For that reason evaluating here and passing in via config_file.
         kubernetes_config.load_kube_config(config_file=os.environ.get("KUBECONFIG"))
         logger.info("Configured kube_client from config file")
+
+
+def create_api_client(config: KlutchConfig) -> kubernetes_client.ApiClient:
+    """
+    Create ApiClient to be shared by all actions, using configuration set by configure_kubernetes.
+
+    Sharing a single ApiClient allows connections (and their TLS sessions) to be reused.
+    """
+    configuration = kubernetes_client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = config.common.api_connection_pool_size
+    api_client = kubernetes_client.ApiClient(configuration)
+    if config.common.api_tcp_keepalive:
+        socket_options = [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            socket_options.append((socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, 30))
+        # Applies to connection pools created from here on, which is all of them as no request has been made yet
+        pool_kw = api_client.rest_client.pool_manager.connection_pool_kw
+        pool_kw["socket_options"] = HTTPConnection.default_socket_options + socket_options
+    logger.info(f"Created ApiClient having connection pool size {configuration.connection_pool_maxsize}")
+    return api_client
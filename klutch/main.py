@@ -2,21 +2,34 @@ import logging
 import signal
 import sys
 import threading
-import time
 import traceback
 from argparse import ArgumentParser
 from queue import SimpleQueue
+from typing import Callable
+from typing import Optional
 
 from nx_config import add_cli_options  # type: ignore
 from nx_config import fill_config_from_path  # type: ignore
 from nx_config import resolve_config_path  # type: ignore
 
+from klutch import actions
+from klutch import metrics
+from klutch.aio import AsyncHandler
+from klutch.cache import HpaCache
+from klutch.cache import HpaCacheSet
 from klutch.config import config
 from klutch.config import configure_kubernetes
+from klutch.config import create_api_client
+from klutch.plan import ScalePlan
+from klutch.ratelimit import RateLimiter
+from klutch.scheduler import Scheduler
+from klutch.threads import MetricsServer
+from klutch.threads import PlanScale
 from klutch.threads import ProcessOrphans
 from klutch.threads import ProcessScaler
 from klutch.threads import TriggerConfigMap
 from klutch.threads import TriggerWebHook
+from klutch.threads import WatchHpas
 
 
 class ThreadHandler:
@@ -24,27 +37,39 @@ class ThreadHandler:
     """
     ThreadHandler.
 
-    - Starts multiple threads
-    - Traps SIGINT/SIGTERM and gracefully stops threads before ending program
+    - Registers components with a Scheduler, running their work in worker threads at their deadlines
+    - Traps SIGINT/SIGTERM and gracefully stops components before ending program
     - Registers exception_hook to attempt graceful shutdown when unhandled exception is raised in thread
     """
 
-    def __init__(self):
+    def __init__(self, jitter: float = 0.0):
         self.threads = []
         self.timeout = 10
+        self.scheduler = Scheduler(jitter)
         self.logger = logging.getLogger(self.__class__.__name__)
         signal.signal(signal.SIGINT, self.handle_signal)
         signal.signal(signal.SIGTERM, self.handle_signal)
         self._setup_excepthook()
 
     def add(self, thread):
+        thread.scheduler = self.scheduler
         self.threads.append(thread)
 
     def start_all(self):
         for t in self.threads:
-            t.start()
+            self.scheduler.add(t.full_name, self._job(t), t.wake_events)
+        finished = self.scheduler.run(self.timeout)
         for t in self.threads:
-            t.join()
+            try:
+                t.tear_down()
+            except Exception:
+                self.logger.exception(f"Error stopping {t.full_name}")
+            t.logger.info("Stopped")
+        if not finished:
+            self.logger.error("Threads failed or did not stop within timeout. Aborting.")
+            sys.exit(1)
+        self.logger.info("All threads stopped. Exiting.")
+        sys.exit(0)
 
     def handle_signal(self, signum, frame):
         self.logger.info(
@@ -55,25 +80,27 @@ class ThreadHandler:
         self._stop_program()
 
     def _stop_program(self):
-        """
-        Will stop all threads gracefully.
-
-        If one of threads raised an exception caught by excepthook, this thread will
-        not join, remain alive and program will exit with exit code 1.
-        """
+        """Stop all threads gracefully. start_all exits the program once running work has finished."""
         for t in self.threads:
             t.stop()
-        while True:
-            if not any(t.is_alive() for t in self.threads):
-                self.logger.info("All threads stopped. Exiting.")
-                sys.exit(0)
-            if self.timeout > 0:
-                self.logger.debug("Waiting for threads to stop.")
-                self.timeout -= 1
-                time.sleep(1)
-            else:
-                self.logger.error("Threads failed to stop within timeout. Aborting.")
-                sys.exit(1)
+        self.scheduler.stop()
+
+    @staticmethod
+    def _job(thread) -> Callable[[], Optional[float]]:
+        """Return Scheduler job setting up thread on first run, then calling its run_once until stopping."""
+        is_set_up = False
+
+        def job() -> Optional[float]:
+            nonlocal is_set_up
+            if thread.should_stop:
+                thread.logger.info("Stopping")
+                return None
+            if not is_set_up:
+                thread.set_up()
+                is_set_up = True
+            return thread.run_once()
+
+        return job
 
     def _setup_excepthook(self):
         _self = self
@@ -120,15 +147,43 @@ def main():
     logger = logging.getLogger(__name__)
     logger.info(f"Config: {config}")
     configure_kubernetes()
+    actions.set_api_client(create_api_client(config))
+    if config.common.api_qps > 0:
+        actions.set_rate_limiter(RateLimiter(config.common.api_qps, config.common.api_burst))
     logger.info(f"Initializing")
 
     trigger_queue = SimpleQueue()
     is_active_event = threading.Event()
-    threads = ThreadHandler()
-    threads.add(ProcessScaler(trigger_queue, is_active_event, config))
-    threads.add(ProcessOrphans(trigger_queue, is_active_event, config))
+    if config.common.runtime == "asyncio":
+        handler = AsyncHandler(config)
+    else:
+        handler = ThreadHandler(config.common.schedule_jitter)
+    hpa_cache = None
+    scale_plan = None
+    if config.common.hpa_cache_enabled:
+        predicate = lambda h: actions.is_enabled_hpa(config, h)  # noqa: E731
+        if config.common.namespaces and not config.common.namespace_label_selector:
+            # Watch per namespace, not requiring cluster-wide RBAC
+            namespaces = [n for n in config.common.namespaces if n not in config.common.exclude_namespaces]
+            caches = [HpaCache(predicate, namespace=n) for n in namespaces]
+            hpa_cache = HpaCacheSet(caches)
+        else:
+            caches = [HpaCache(predicate)]
+            hpa_cache = caches[0]
+        for cache in caches:
+            handler.add(WatchHpas(trigger_queue, is_active_event, config, hpa_cache=cache))
+        if config.common.scale_plan_enabled:
+            scale_plan = ScalePlan()
+            metrics.SCALE_PLAN_SIZE.set_function(scale_plan.__len__)
+            metrics.SCALE_PLAN_AGE.set_function(scale_plan.age)
+            handler.add(PlanScale(trigger_queue, is_active_event, config, hpa_cache=hpa_cache, scale_plan=scale_plan))
+    handler.add(ProcessScaler(trigger_queue, is_active_event, config, hpa_cache=hpa_cache, scale_plan=scale_plan))
+    handler.add(ProcessOrphans(trigger_queue, is_active_event, config, hpa_cache=hpa_cache))
     if config.trigger_web_hook.enabled:
-        threads.add(TriggerWebHook(trigger_queue, is_active_event, config))
+        handler.add(TriggerWebHook(trigger_queue, is_active_event, config))
     if config.trigger_config_map.enabled:
-        threads.add(TriggerConfigMap(trigger_queue, is_active_event, config))
-    threads.start_all()
+        handler.add(TriggerConfigMap(trigger_queue, is_active_event, config))
+    if config.metrics.enabled:
+        metrics.TRIGGER_QUEUE_DEPTH.set_function(trigger_queue.qsize)
+        handler.add(MetricsServer(trigger_queue, is_active_event, config))
+    handler.start_all()
@@ -0,0 +1,205 @@
+"""
+Metrics in Prometheus text exposition format, served by the MetricsServer thread.
+
+Implements the few metric types klutch needs, not requiring the prometheus_client package.
+"""
+import functools
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+F = TypeVar("F", bound=Callable)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Upper bounds (seconds) of histogram buckets, suiting API requests as well as scaling sequences
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+class Metric:
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def expose(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"] + self._samples()
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _format_labels(self, key: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{n}="{_escape(v)}"' for n, v in zip(self.labelnames, key)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter(Metric):
+
+    type = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Exposed as 0 before being incremented, unless labeled
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._format_labels(k)} {_format(v)}" for k, v in self._values.items()]
+
+
+class Gauge(Metric):
+
+    """Gauge without labels, either set, or obtained from function when exposed."""
+
+    type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._value = 0.0
+        self._function: Optional[Callable[[], Optional[float]]] = None
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = value
+
+    def set_function(self, function: Callable[[], Optional[float]]):
+        """Obtain value from function. Not exposed while it returns None."""
+        self._function = function
+
+    def _samples(self) -> List[str]:
+        value = self._function() if self._function is not None else self._value
+        return [] if value is None else [f"{self.name} {_format(value)}"]
+
+
+class Histogram(Metric):
+
+    type = "histogram"
+
+    def __init__(self, *args, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(buckets) + (math.inf,)
+        # Per label values: count per bucket (not cumulative), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * len(self.buckets), 0.0)
+            counts[next(i for i, b in enumerate(self.buckets) if value <= b)] += 1
+            self._values[key] = counts, total + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe duration of block."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started, **labels)
+
+    def count(self, **labels: str) -> int:
+        with self._lock:
+            counts, _ = self._values.get(self._key(labels)) or ([0], 0.0)
+            return sum(counts)
+
+    def sum(self, **labels: str) -> float:
+        with self._lock:
+            _, total = self._values.get(self._key(labels)) or ([0], 0.0)
+            return total
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                cumulative = 0
+                for bound, count in zip(self.buckets, counts):
+                    cumulative += count
+                    le = 'le="{}"'.format("+Inf" if bound == math.inf else _format(bound))
+                    lines.append(f"{self.name}_bucket{self._format_labels(key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{self._format_labels(key)} {_format(total)}")
+                lines.append(f"{self.name}_count{self._format_labels(key)} {cumulative}")
+        return lines
+
+
+REGISTRY: List[Metric] = []
+
+
+def expose() -> str:
+    """Return all metrics in Prometheus text exposition format."""
+    return "\n".join(line for m in REGISTRY for line in m.expose()) + "\n"
+
+
+def timed(func: F) -> F:
+    """Decorate action, observing its duration and counting errors, labeled by its name."""
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with ACTION_DURATION.time(action=func.__name__):
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                ACTION_ERRORS.inc(action=func.__name__)
+                raise
+
+    return wrapper  # type: ignore
+
+
+def _format(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+ACTION_DURATION = Histogram(
+    "klutch_action_duration_seconds", "Duration of actions, including the API requests they make.", ("action",)
+)
+ACTION_ERRORS = Counter("klutch_action_errors_total", "Number of actions raising an exception.", ("action",))
+TRIGGER_TO_FIRST_PATCH = Histogram(
+    "klutch_trigger_to_first_patch_seconds", "Time from trigger until the first HPA was scaled up."
+)
+TRIGGER_TO_LAST_PATCH = Histogram(
+    "klutch_trigger_to_last_patch_seconds", "Time from trigger until the last HPA was scaled up."
+)
+TRIGGER_TO_WAVE_PATCHED = Histogram(
+    "klutch_trigger_to_wave_patched_seconds",
+    "Time from trigger until all HPAs of a priority wave were scaled up.",
+    ("priority",),
+)
+RECONCILE_DRIFT = Counter(
+    "klutch_reconcile_drift_total", "Number of examined HPAs found to differ from the sequence status."
+)
+ORPHAN_SCAN_DURATION = Histogram("klutch_orphan_scan_duration_seconds", "Duration of scans for orphaned HPAs.")
+TRIGGER_QUEUE_DEPTH = Gauge("klutch_trigger_queue_depth", "Number of triggers waiting to be processed.")
+SCALE_PLAN_SIZE = Gauge("klutch_scale_plan_targets", "Number of HPAs having a precalculated scale target.")
+SCALE_PLAN_AGE = Gauge("klutch_scale_plan_age_seconds", "Time since the scale plan was updated.")
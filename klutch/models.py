@@ -0,0 +1,164 @@
+"""
+Lightweight representations of the Kubernetes objects klutch uses.
+
+Only contain the fields klutch reads. Attribute names match those of the kubernetes client models,
+so both can be used interchangeably.
+
+Classes are slotted, as caches may hold thousands of HPAs. Objects are decoded from raw JSON
+(the *_from_dict functions) or protobuf (klutch.protobuf), bypassing kubernetes.client deserialization.
+"""
+from dataclasses import dataclass
+from dataclasses import field
+from dataclasses import fields
+from datetime import datetime
+from datetime import timezone
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import Generic
+from typing import List
+from typing import Optional
+from typing import TypeVar
+
+C = TypeVar("C")
+T = TypeVar("T")
+
+
+def slotted(cls: C) -> C:
+    """Recreate dataclass cls having __slots__, like dataclass(slots=True) does on Python 3.10+."""
+    field_names = tuple(f.name for f in fields(cls))
+    namespace = {k: v for k, v in cls.__dict__.items() if k not in field_names + ("__dict__", "__weakref__")}
+    namespace["__slots__"] = field_names
+    return type(cls)(cls.__name__, cls.__bases__, namespace)  # type: ignore
+
+
+@slotted
+@dataclass
+class ObjectMeta:
+    name: str = ""
+    namespace: str = ""
+    uid: str = ""
+    resource_version: str = ""
+    creation_timestamp: Optional[datetime] = None
+    labels: Dict[str, str] = field(default_factory=dict)
+    annotations: Dict[str, str] = field(default_factory=dict)
+
+
+@slotted
+@dataclass
+class ListMeta:
+    resource_version: str = ""
+    _continue: Optional[str] = None
+
+
+@slotted
+@dataclass
+class CrossVersionObjectReference:
+    kind: str = ""
+    name: str = ""
+    api_version: str = ""
+
+
+@slotted
+@dataclass
+class HorizontalPodAutoscalerSpec:
+    scale_target_ref: CrossVersionObjectReference = field(default_factory=CrossVersionObjectReference)
+    min_replicas: int = 1
+    max_replicas: int = 0
+
+
+@slotted
+@dataclass
+class HorizontalPodAutoscalerStatus:
+    current_replicas: int = 0
+    desired_replicas: int = 0
+
+
+@slotted
+@dataclass
+class HorizontalPodAutoscaler:
+    metadata: ObjectMeta = field(default_factory=ObjectMeta)
+    spec: HorizontalPodAutoscalerSpec = field(default_factory=HorizontalPodAutoscalerSpec)
+    status: HorizontalPodAutoscalerStatus = field(default_factory=HorizontalPodAutoscalerStatus)
+
+
+@slotted
+@dataclass
+class PartialObjectMetadata:
+    metadata: ObjectMeta = field(default_factory=ObjectMeta)
+
+
+@slotted
+@dataclass
+class ConfigMap:
+    metadata: ObjectMeta = field(default_factory=ObjectMeta)
+    data: Dict[str, str] = field(default_factory=dict)
+    binary_data: Dict[str, bytes] = field(default_factory=dict)
+
+
+@slotted
+@dataclass
+class ObjectList(Generic[T]):
+    metadata: ListMeta = field(default_factory=ListMeta)
+    items: List[T] = field(default_factory=list)
+
+
+def hpa_from_dict(data: Dict[str, Any]) -> HorizontalPodAutoscaler:
+    """Create HorizontalPodAutoscaler from JSON decoded autoscaling/v1 HorizontalPodAutoscaler."""
+    spec = data.get("spec") or {}
+    ref = spec.get("scaleTargetRef") or {}
+    status = data.get("status") or {}
+    return HorizontalPodAutoscaler(
+        metadata=_object_meta_from_dict(data.get("metadata") or {}),
+        spec=HorizontalPodAutoscalerSpec(
+            scale_target_ref=CrossVersionObjectReference(
+                kind=ref.get("kind", ""), name=ref.get("name", ""), api_version=ref.get("apiVersion", "")
+            ),
+            min_replicas=spec.get("minReplicas", 1),
+            max_replicas=spec.get("maxReplicas", 0),
+        ),
+        status=HorizontalPodAutoscalerStatus(
+            current_replicas=status.get("currentReplicas", 0),
+            desired_replicas=status.get("desiredReplicas", 0),
+        ),
+    )
+
+
+def hpa_list_from_dict(data: Dict[str, Any]) -> ObjectList[HorizontalPodAutoscaler]:
+    """Create ObjectList from JSON decoded HorizontalPodAutoscalerList."""
+    return _object_list_from_dict(data, hpa_from_dict)
+
+
+def partial_object_metadata_list_from_dict(data: Dict[str, Any]) -> ObjectList[PartialObjectMetadata]:
+    """Create ObjectList from JSON decoded PartialObjectMetadataList."""
+    return _object_list_from_dict(
+        data, lambda i: PartialObjectMetadata(metadata=_object_meta_from_dict(i.get("metadata") or {}))
+    )
+
+
+def _object_list_from_dict(data: Dict[str, Any], item_from_dict: Callable[[Dict[str, Any]], T]) -> ObjectList[T]:
+    list_meta = data.get("metadata") or {}
+    return ObjectList(
+        metadata=ListMeta(
+            resource_version=list_meta.get("resourceVersion", ""),
+            _continue=list_meta.get("continue") or None,
+        ),
+        items=[item_from_dict(i) for i in data.get("items") or []],
+    )
+
+
+def _object_meta_from_dict(data: Dict[str, Any]) -> ObjectMeta:
+    creation_timestamp = data.get("creationTimestamp")
+    return ObjectMeta(
+        name=data.get("name", ""),
+        namespace=data.get("namespace", ""),
+        uid=data.get("uid", ""),
+        resource_version=data.get("resourceVersion", ""),
+        creation_timestamp=(
+            datetime.strptime(creation_timestamp, "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc)
+            if creation_timestamp
+            else None
+        ),
+        labels=data.get("labels") or {},
+        annotations=data.get("annotations") or {},
+    )
@@ -0,0 +1,67 @@
+import threading
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import Optional
+from typing import Tuple
+
+from klutch import clock
+from klutch.models import HorizontalPodAutoscaler
+from klutch.status import HpaStatus
+
+
+@dataclass
+class ScaleTarget:
+
+    """Precomputed scale up of a single HPA, valid as long as the HPA has resource_version."""
+
+    __slots__ = ("resource_version", "hpa_status", "patch", "intended_min_replicas")
+
+    resource_version: str
+    hpa_status: HpaStatus
+    # Body of the merge patch scaling up the HPA
+    patch: Dict[str, Any]
+    # minReplicas according to scale percentage, before limiting it to maxReplicas
+    intended_min_replicas: int
+
+
+class ScalePlan:
+
+    """
+    Scale targets of all HPAs opted in to klutch, kept up to date by the PlanScale thread.
+
+    Allows a scaling sequence to start patching right away, instead of first calculating scale targets.
+    A target is only used if the HPA has not changed since it was calculated, see get().
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._targets: Dict[Tuple[str, str], ScaleTarget] = {}
+        self._updated_at: Optional[float] = None
+
+    def replace(self, targets: Dict[Tuple[str, str], ScaleTarget]):
+        """Replace all targets, by namespace and name of their HPA."""
+        with self._lock:
+            self._targets = targets
+            self._updated_at = clock.monotonic()
+
+    def get(self, hpa: HorizontalPodAutoscaler) -> Optional[ScaleTarget]:
+        """Return target of hpa, None if missing or calculated for a different resourceVersion of it."""
+        with self._lock:
+            target = self._targets.get((hpa.metadata.namespace, hpa.metadata.name))
+        if target is None or target.resource_version != hpa.metadata.resource_version:
+            return None
+        return target
+
+    def targets(self) -> Dict[Tuple[str, str], ScaleTarget]:
+        with self._lock:
+            return dict(self._targets)
+
+    def age(self) -> Optional[float]:
+        """Return seconds since last update, None if never updated."""
+        with self._lock:
+            return None if self._updated_at is None else clock.monotonic() - self._updated_at
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._targets)
@@ -0,0 +1,64 @@
+from concurrent.futures import Future
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from typing import Callable
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+def map_concurrently(
+    func: Callable[[T], R], items: Iterable[T], concurrency: int
+) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+    """
+    Apply func to items using at most `concurrency` threads. Yield tuples of item, result and exception as completed.
+
+    Items are consumed lazily, having no more than `concurrency` items in flight. Exceptions raised by func
+    are yielded instead of raised, so a failing item does not affect others. Exceptions raised while
+    obtaining items are raised, after yielding results of items in flight.
+    """
+    if concurrency <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
+
+    iterator = iter(items)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        in_flight: Dict[Future, T] = {}
+        while True:
+            # Only take next item when a worker is available
+            if len(in_flight) >= concurrency:
+                yield from _pop_completed(in_flight)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                break
+            except Exception:
+                # Source of items failed: Yield results of items in flight before raising
+                while in_flight:
+                    yield from _pop_completed(in_flight)
+                raise
+            in_flight[executor.submit(func, item)] = item
+        while in_flight:
+            yield from _pop_completed(in_flight)
+
+
+def _pop_completed(in_flight: Dict[Future, T]) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+    for future in done:
+        item = in_flight.pop(future)
+        exception = future.exception()
+        if exception is not None:
+            yield item, None, exception  # type: ignore
+        else:
+            yield item, future.result(), None
@@ -0,0 +1,297 @@
+"""
+Minimal decoder of the Kubernetes protobuf encoding (application/vnd.kubernetes.protobuf).
+
+Decodes only the fields klutch uses into klutch.models, skipping everything else without
+deserializing it. Field numbers are those of the generated.proto files of k8s.io/api and
+k8s.io/apimachinery.
+
+Reference: https://kubernetes.io/docs/reference/using-api/api-concepts/#protobuf-encoding
+"""
+import struct
+from datetime import datetime
+from datetime import timezone
+from typing import Callable
+from typing import Dict
+from typing import Iterator
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+from typing import Union
+
+from klutch.models import ConfigMap
+from klutch.models import CrossVersionObjectReference
+from klutch.models import HorizontalPodAutoscaler
+from klutch.models import HorizontalPodAutoscalerSpec
+from klutch.models import HorizontalPodAutoscalerStatus
+from klutch.models import ListMeta
+from klutch.models import ObjectList
+from klutch.models import ObjectMeta
+from klutch.models import PartialObjectMetadata
+
+CONTENT_TYPE = "application/vnd.kubernetes.protobuf"
+CONTENT_TYPE_PARTIAL_METADATA_LIST = f"{CONTENT_TYPE};as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+MAGIC = b"k8s\x00"
+
+WIRE_VARINT = 0
+WIRE_FIXED64 = 1
+WIRE_LENGTH_DELIMITED = 2
+WIRE_FIXED32 = 5
+
+T = TypeVar("T")
+
+
+def decode_hpa(data: bytes) -> HorizontalPodAutoscaler:
+    return _decode_hpa(unwrap(data))
+
+
+def decode_hpa_list(data: bytes) -> ObjectList[HorizontalPodAutoscaler]:
+    return _decode_list(unwrap(data), _decode_hpa)
+
+
+def decode_config_map(data: bytes) -> ConfigMap:
+    return _decode_config_map(unwrap(data))
+
+
+def decode_config_map_list(data: bytes) -> ObjectList[ConfigMap]:
+    return _decode_list(unwrap(data), _decode_config_map)
+
+
+def decode_partial_object_metadata_list(data: bytes) -> ObjectList[PartialObjectMetadata]:
+    return _decode_list(unwrap(data), _decode_partial_object_metadata)
+
+
+def decode_watch_event(frame: bytes, decoder: Callable[[bytes], T]) -> Tuple[str, Optional[T], Optional[int]]:
+    """
+    Decode watch event, using decoder for the contained object.
+
+    Returns tuple of event type, object and status code. For ERROR events object is None and status code is set.
+    """
+    if frame.startswith(MAGIC):
+        frame = unwrap(frame)
+    event_type = ""
+    raw = b""
+    for number, _, value in iter_fields(frame):
+        if number == 1:
+            event_type = _str(value)
+        elif number == 2:
+            # RawExtension
+            raw = _bytes(_field(value, 1, b""))
+    if event_type == "ERROR":
+        return event_type, None, _decode_status_code(raw)
+    return event_type, decoder(raw), None
+
+
+def unwrap(data: bytes) -> bytes:
+    """Return raw object of runtime.Unknown envelope, as prefixed by magic number."""
+    if not data.startswith(MAGIC):
+        raise ValueError("Data is not protobuf encoded Kubernetes object")
+    return _bytes(_field(data[len(MAGIC) :], 2, b""))
+
+
+def iter_frames(read: Callable[[int], bytes]) -> Iterator[bytes]:
+    """Yield length-prefixed frames of a protobuf watch stream, using read to obtain bytes."""
+    while True:
+        header = _read_exact(read, 4)
+        if not header:
+            return
+        (length,) = struct.unpack(">I", header)
+        yield _read_exact(read, length)
+
+
+def iter_fields(data: bytes) -> Iterator[Tuple[int, int, Union[int, bytes]]]:
+    """Yield field number, wire type and value of each field in message."""
+    pos = 0
+    end = len(data)
+    while pos < end:
+        key, pos = _read_varint(data, pos)
+        number, wire_type = key >> 3, key & 7
+        value: Union[int, bytes]
+        if wire_type == WIRE_VARINT:
+            value, pos = _read_varint(data, pos)
+        elif wire_type == WIRE_LENGTH_DELIMITED:
+            length, pos = _read_varint(data, pos)
+            value = data[pos : pos + length]
+            pos += length
+        elif wire_type == WIRE_FIXED64:
+            value = data[pos : pos + 8]
+            pos += 8
+        elif wire_type == WIRE_FIXED32:
+            value = data[pos : pos + 4]
+            pos += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wire_type}")
+        yield number, wire_type, value
+
+
+def _decode_list(data: bytes, decoder: Callable[[bytes], T]) -> ObjectList[T]:
+    object_list: ObjectList[T] = ObjectList()
+    for number, _, value in iter_fields(data):
+        if number == 1:
+            object_list.metadata = _decode_list_meta(_bytes(value))
+        elif number == 2:
+            object_list.items.append(decoder(_bytes(value)))
+    return object_list
+
+
+def _decode_list_meta(data: bytes) -> ListMeta:
+    list_meta = ListMeta()
+    for number, _, value in iter_fields(data):
+        if number == 2:
+            list_meta.resource_version = _str(value)
+        elif number == 3:
+            list_meta._continue = _str(value) or None
+    return list_meta
+
+
+def _decode_object_meta(data: bytes) -> ObjectMeta:
+    meta = ObjectMeta()
+    for number, _, value in iter_fields(data):
+        if number == 1:
+            meta.name = _str(value)
+        elif number == 3:
+            meta.namespace = _str(value)
+        elif number == 5:
+            meta.uid = _str(value)
+        elif number == 6:
+            meta.resource_version = _str(value)
+        elif number == 8:
+            meta.creation_timestamp = _decode_time(_bytes(value))
+        elif number == 11:
+            key, val = _decode_map_entry(_bytes(value))
+            meta.labels[key] = _str(val)
+        elif number == 12:
+            key, val = _decode_map_entry(_bytes(value))
+            meta.annotations[key] = _str(val)
+    return meta
+
+
+def _decode_partial_object_metadata(data: bytes) -> PartialObjectMetadata:
+    return PartialObjectMetadata(metadata=_decode_object_meta(_bytes(_field(data, 1, b""))))
+
+
+def _decode_hpa(data: bytes) -> HorizontalPodAutoscaler:
+    hpa = HorizontalPodAutoscaler()
+    for number, _, value in iter_fields(data):
+        if number == 1:
+            hpa.metadata = _decode_object_meta(_bytes(value))
+        elif number == 2:
+            hpa.spec = _decode_hpa_spec(_bytes(value))
+        elif number == 3:
+            hpa.status = _decode_hpa_status(_bytes(value))
+    return hpa
+
+
+def _decode_hpa_spec(data: bytes) -> HorizontalPodAutoscalerSpec:
+    spec = HorizontalPodAutoscalerSpec()
+    for number, _, value in iter_fields(data):
+        if number == 1:
+            spec.scale_target_ref = _decode_cross_version_object_reference(_bytes(value))
+        elif number == 2:
+            spec.min_replicas = _int(value)
+        elif number == 3:
+            spec.max_replicas = _int(value)
+    return spec
+
+
+def _decode_cross_version_object_reference(data: bytes) -> CrossVersionObjectReference:
+    ref = CrossVersionObjectReference()
+    for number, _, value in iter_fields(data):
+        if number == 1:
+            ref.kind = _str(value)
+        elif number == 2:
+            ref.name = _str(value)
+        elif number == 3:
+            ref.api_version = _str(value)
+    return ref
+
+
+def _decode_hpa_status(data: bytes) -> HorizontalPodAutoscalerStatus:
+    status = HorizontalPodAutoscalerStatus()
+    for number, _, value in iter_fields(data):
+        if number == 3:
+            status.current_replicas = _int(value)
+        elif number == 4:
+            status.desired_replicas = _int(value)
+    return status
+
+
+def _decode_config_map(data: bytes) -> ConfigMap:
+    config_map = ConfigMap()
+    for number, _, value in iter_fields(data):
+        if number == 1:
+            config_map.metadata = _decode_object_meta(_bytes(value))
+        elif number == 2:
+            key, val = _decode_map_entry(_bytes(value))
+            config_map.data[key] = _str(val)
+        elif number == 3:
+            key, val = _decode_map_entry(_bytes(value))
+            config_map.binary_data[key] = val
+    return config_map
+
+
+def _decode_status_code(data: bytes) -> int:
+    """Return code of (enveloped) meta/v1 Status."""
+    if data.startswith(MAGIC):
+        data = unwrap(data)
+    return _int(_field(data, 6, 0))
+
+
+def _decode_time(data: bytes) -> datetime:
+    seconds = _int(_field(data, 1, 0))
+    return datetime.fromtimestamp(seconds, tz=timezone.utc)
+
+
+def _decode_map_entry(data: bytes) -> Tuple[str, bytes]:
+    fields: Dict[int, Union[int, bytes]] = {number: value for number, _, value in iter_fields(data)}
+    return _str(fields.get(1, b"")), _bytes(fields.get(2, b""))
+
+
+def _field(data: bytes, wanted: int, default: Union[int, bytes]) -> Union[int, bytes]:
+    """Return value of last occurrence of field number in message."""
+    found = default
+    for number, _, value in iter_fields(data):
+        if number == wanted:
+            found = value
+    return found
+
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    result = 0
+    shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if not byte & 0x80:
+            return result, pos
+        shift += 7
+
+
+def _read_exact(read: Callable[[int], bytes], length: int) -> bytes:
+    chunks = []
+    remaining = length
+    while remaining:
+        chunk = read(remaining)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        remaining -= len(chunk)
+    data = b"".join(chunks)
+    if data and len(data) != length:
+        raise ValueError("Protobuf watch stream ended mid-frame")
+    return data
+
+
+def _int(value: Union[int, bytes]) -> int:
+    assert isinstance(value, int)
+    # int32 values are encoded as 64 bit two's complement
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def _bytes(value: Union[int, bytes]) -> bytes:
+    assert isinstance(value, bytes)
+    return value
+
+
+def _str(value: Union[int, bytes]) -> str:
+    return _bytes(value).decode("utf-8")
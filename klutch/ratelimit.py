@@ -0,0 +1,61 @@
+import threading
+from typing import Optional
+
+from klutch import clock
+
+
+class RateLimiter:
+
+    """
+    Token bucket limiting the rate of API requests, shared by all threads.
+
+    Allows bursts of up to burst requests, refilling at qps tokens per second. Adapts to the API server:
+    When it rejects requests as overloaded, backoff halves the rate and pauses all requests,
+    after which every successful request raises the rate again by a twentieth of qps.
+    """
+
+    def __init__(self, qps: float, burst: int):
+        self.qps = qps
+        self.burst = burst
+        # Current rate, lowered by backoff
+        self.rate = qps
+        self._tokens = float(burst)
+        self._updated_at = clock.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be made."""
+        while True:
+            with self._lock:
+                now = clock.monotonic()
+                self._refill(now)
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            clock.sleep(wait)
+
+    def backoff(self, retry_after: Optional[float] = None):
+        """
+        Slow down after the API server rejected a request as overloaded.
+
+        Pauses requests for retry_after seconds if provided (Retry-After header), else for one token interval.
+        """
+        with self._lock:
+            now = clock.monotonic()
+            self._refill(now)
+            self.rate = max(self.rate / 2, self.qps / 100)
+            self._tokens = min(self._tokens, 0)
+            pause = retry_after if retry_after is not None else 1 / self.rate
+            self._paused_until = max(self._paused_until, now + pause)
+
+    def success(self):
+        """Raise rate again after a successful request."""
+        with self._lock:
+            if self.rate < self.qps:
+                self.rate = min(self.rate + self.qps / 20, self.qps)
+
+    def _refill(self, now: float):
+        self._tokens = min(self._tokens + (now - self._updated_at) * self.rate, self.burst)
+        self._updated_at = now
@@ -0,0 +1,79 @@
+from dataclasses import dataclass
+from typing import Dict
+from typing import Generic
+from typing import Hashable
+from typing import List
+from typing import Optional
+from typing import Tuple
+from typing import TypeVar
+
+from klutch import clock
+
+T = TypeVar("T")
+
+
+@dataclass
+class RetryEntry(Generic[T]):
+
+    __slots__ = ("item", "attempt", "next_at", "deadline")
+
+    item: T
+    # Number of failed attempts
+    attempt: int
+    # Monotonic times of next attempt, and after which to give up
+    next_at: float
+    deadline: float
+
+
+class RetryQueue(Generic[T]):
+
+    """
+    Failed operations to retry, using exponential backoff until their deadline.
+
+    Operations are identified by key, so each is queued at most once. Not thread-safe: Meant to be owned by a single
+    thread, which calls due() to find operations to retry, done() when one succeeded and add() when one failed.
+    """
+
+    def __init__(self, initial_delay: float = 1, max_delay: float = 30):
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self._entries: Dict[Hashable, RetryEntry[T]] = {}
+
+    def add(self, key: Hashable, item: T, timeout: float) -> bool:
+        """
+        Add failed operation, or register another failed attempt of it, doubling the delay before retrying.
+
+        Gives up after timeout (seconds) since the operation was first added, returning False.
+        """
+        now = clock.monotonic()
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = RetryEntry(item, attempt=0, next_at=now, deadline=now + timeout)
+        entry.item = item
+        entry.next_at = now + min(self.initial_delay * 2**entry.attempt, self.max_delay)
+        entry.attempt += 1
+        if entry.next_at > entry.deadline:
+            del self._entries[key]
+            return False
+        return True
+
+    def due(self) -> List[Tuple[Hashable, T]]:
+        """Return operations to retry now, as (key, item). They stay queued until done() or add() is called."""
+        now = clock.monotonic()
+        return [(key, e.item) for key, e in self._entries.items() if e.next_at <= now]
+
+    def done(self, key: Hashable):
+        """Remove operation, e.g. after it succeeded."""
+        self._entries.pop(key, None)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._entries)
+
+    def next_delay(self) -> Optional[float]:
+        """Return seconds until the next retry, None if none queued."""
+        if not self._entries:
+            return None
+        return max(min(e.next_at for e in self._entries.values()) - clock.monotonic(), 0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
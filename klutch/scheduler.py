@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+logger = logging.getLogger(__name__)
+
+# Event fired when a scaling sequence is triggered
+TRIGGER = "trigger"
+
+
+def jittered(delay: float, jitter: float) -> float:
+    """Return delay extended by a random fraction of at most jitter, spreading wakeups of periodic jobs."""
+    return delay + random.uniform(0, jitter * delay)
+
+
+class Job:
+    def __init__(self, name: str, func: Callable[[], Optional[float]], events: Tuple[str, ...]):
+        self.name = name
+        self.func = func
+        self.events = events
+        # Monotonic time job is scheduled to run at, None if not scheduled
+        self.deadline: Optional[float] = None
+        self.running = False
+        self.wake_pending = False
+
+
+class Scheduler:
+
+    """
+    Runs jobs at deadlines, replacing a sleep loop per thread.
+
+    A job is a function returning the number of seconds after which to run it again, or None if done.
+    The next deadline is based on the start of the previous run, extended by jitter, so periodic jobs do not drift.
+    A single thread (the one calling run) waits for the nearest deadline. Due jobs run in worker threads,
+    as jobs like watches block, each job running at most once at a time.
+
+    Waits are interruptible: stop() ends run immediately, wake(event) runs jobs registered for event right away.
+    """
+
+    def __init__(self, jitter: float = 0.0):
+        self.jitter = jitter
+        self.failed = False
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._sequence = itertools.count()
+        self._cond = threading.Condition()
+        self._stopped = False
+        self._running = 0
+
+    def add(self, name: str, func: Callable[[], Optional[float]], events: Tuple[str, ...] = (), delay: float = 0):
+        """Register job, first running it after delay."""
+        with self._cond:
+            job = Job(name, func, events)
+            self._jobs[name] = job
+            self._schedule(job, time.monotonic() + delay)
+
+    def wake(self, event: str):
+        """Run jobs registered for event now, or as soon as their current run finishes."""
+        with self._cond:
+            for job in self._jobs.values():
+                if event not in job.events:
+                    continue
+                if job.running:
+                    job.wake_pending = True
+                elif job.deadline is not None:
+                    self._schedule(job, time.monotonic())
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def run(self, timeout: float = 10) -> bool:
+        """
+        Run jobs until stopped, then wait for running jobs to finish.
+
+        Returns False if a job raised an exception (which stops the scheduler), or running jobs
+        did not finish within timeout after stopping.
+        """
+        executor = ThreadPoolExecutor(max_workers=max(len(self._jobs), 1), thread_name_prefix="klutch")
+        try:
+            with self._cond:
+                while not self._stopped:
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    deadline, _, job = self._heap[0]
+                    if deadline != job.deadline:
+                        # Rescheduled since
+                        heapq.heappop(self._heap)
+                        continue
+                    now = time.monotonic()
+                    if deadline > now:
+                        self._cond.wait(deadline - now)
+                        continue
+                    heapq.heappop(self._heap)
+                    job.deadline = None
+                    job.running = True
+                    self._running += 1
+                    executor.submit(self._run_job, job)
+                finished = self._cond.wait_for(lambda: self._running == 0, timeout)
+        finally:
+            executor.shutdown(wait=False)
+        return finished and not self.failed
+
+    def _run_job(self, job: Job):
+        started = time.monotonic()
+        delay = None
+        try:
+            delay = job.func()
+        except Exception:
+            logger.exception(f"Caught exception in {job.name}. Stopping.")
+            with self._cond:
+                self.failed = True
+                self._stopped = True
+        with self._cond:
+            job.running = False
+            self._running -= 1
+            if delay is not None and not self._stopped:
+                if job.wake_pending:
+                    self._schedule(job, time.monotonic())
+                else:
+                    self._schedule(job, started + jittered(delay, self.jitter))
+            job.wake_pending = False
+            self._cond.notify_all()
+
+    def _schedule(self, job: Job, deadline: float):
+        job.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._sequence), job))
+        self._cond.notify_all()
@@ -0,0 +1,486 @@
+"""
+Deterministic simulation of klutch against an in-memory cluster, in virtual time.
+
+Simulation runs the components of klutch the way Scheduler does, but in a single thread, moving a VirtualClock
+straight to the next deadline instead of waiting for it. Components talk to a SimulatedCluster through
+SimulatedApiClient, which answers requests in-process. A full scaling sequence (trigger, scale up, reconcile,
+revert) of common.duration seconds thereby takes milliseconds, allowing capacity planning experiments and stress
+tests of many sequences:
+
+    python -m klutch.simulation --config-path=dev.yaml --hpas=1000 --sequences=100
+
+Limitations: Watches are not simulated, so HPAs are not cached and trigger ConfigMaps are only found by scanning
+(trigger_config_map.watch disabled). API requests take no virtual time. Only JSON is served (api_content_type json).
+"""
+import heapq
+import itertools
+import json
+import logging
+import re
+import threading
+import time
+from argparse import ArgumentParser
+from collections import Counter
+from datetime import datetime
+from datetime import timezone
+from queue import SimpleQueue
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from kubernetes import client  # type: ignore
+from nx_config import add_cli_options  # type: ignore
+from nx_config import fill_config_from_path  # type: ignore
+from nx_config import resolve_config_path  # type: ignore
+
+from klutch import actions
+from klutch import clock
+from klutch.clock import VirtualClock
+from klutch.config import KlutchConfig
+from klutch.scheduler import Job
+from klutch.scheduler import TRIGGER
+from klutch.threads import BaseThread
+from klutch.threads import ProcessOrphans
+from klutch.threads import ProcessScaler
+from klutch.threads import TriggerConfigMap
+
+logger = logging.getLogger(__name__)
+
+# Virtual time (seconds since the epoch) simulations start at by default
+SIMULATION_START_TS = 1600000000.0
+
+HPA_RE = re.compile(
+    r"^/apis/autoscaling/v1/(?:namespaces/(?P<namespace>[^/]+)/)?horizontalpodautoscalers(?:/(?P<name>[^/]+))?$"
+)
+CM_RE = re.compile(r"^/api/v1/namespaces/(?P<namespace>[^/]+)/configmaps(?:/(?P<name>[^/]+))?$")
+NAMESPACES_PATH = "/api/v1/namespaces"
+
+
+class SimulatedCluster:
+
+    """
+    In-memory stand-in for the Kubernetes API server, serving the requests klutch makes on HPAs, ConfigMaps and
+    Namespaces. Objects are kept as JSON decoded dicts, timestamped using the clock.
+
+    Requests are counted by method and resource (e.g. "PATCH horizontalpodautoscalers"), see counts.
+    """
+
+    def __init__(self, config: KlutchConfig):
+        self.config = config
+        self.counts: Counter = Counter()
+        self._lock = threading.Lock()
+        self._resource_version = 0
+        # Objects by resource, then by (namespace, name)
+        self._objects: Dict[str, Dict[Tuple[Optional[str], str], Dict[str, Any]]] = {
+            "horizontalpodautoscalers": {},
+            "configmaps": {},
+        }
+
+    def add_hpa(
+        self,
+        namespace: str,
+        name: str,
+        min_replicas: int = 2,
+        max_replicas: int = 20,
+        current_replicas: int = 4,
+        scale_percentage: int = 200,
+        priority: Optional[int] = None,
+    ):
+        """Add HPA opted in to klutch (using both annotation and label), scaling up to scale_percentage."""
+        common = self.config.common
+        hpa = {
+            "kind": "HorizontalPodAutoscaler",
+            "apiVersion": "autoscaling/v1",
+            "metadata": {
+                "name": name,
+                "annotations": {
+                    common.hpa_annotation_enabled_key: common.hpa_annotation_enabled_value,
+                    common.hpa_annotation_scale_perc_of_actual: str(scale_percentage),
+                },
+                "labels": {common.hpa_label_enabled_key: common.hpa_label_enabled_value},
+            },
+            "spec": {
+                "scaleTargetRef": {"kind": "Deployment", "name": name, "apiVersion": "apps/v1"},
+                "minReplicas": min_replicas,
+                "maxReplicas": max_replicas,
+            },
+            "status": {"currentReplicas": current_replicas, "desiredReplicas": current_replicas},
+        }
+        if priority is not None:
+            hpa["metadata"]["annotations"][common.hpa_annotation_priority] = str(priority)
+        with self._lock:
+            self._create("horizontalpodautoscalers", namespace, hpa)
+
+    def add_trigger(self, name: str = "klutch-trigger"):
+        """Add trigger ConfigMap in the klutch namespace."""
+        section = self.config.trigger_config_map
+        config_map = {
+            "kind": "ConfigMap",
+            "apiVersion": "v1",
+            "metadata": {"name": name, "labels": {section.cm_trigger_label_key: section.cm_trigger_label_value}},
+        }
+        with self._lock:
+            self._create("configmaps", self.config.common.namespace, config_map)
+
+    def patch_hpa(self, namespace: str, name: str, patch: Dict[str, Any]):
+        """Change HPA like another client would, e.g. a deployment resetting minReplicas."""
+        with self._lock:
+            hpa = self._objects["horizontalpodautoscalers"][(namespace, name)]
+            _merge_patch(hpa, patch)
+            hpa["metadata"]["resourceVersion"] = self._next_resource_version()
+
+    def hpa(self, namespace: str, name: str) -> Dict[str, Any]:
+        with self._lock:
+            return json.loads(json.dumps(self._objects["horizontalpodautoscalers"][(namespace, name)]))
+
+    def hpas(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return json.loads(json.dumps(list(self._objects["horizontalpodautoscalers"].values())))
+
+    @staticmethod
+    def route(path: str) -> Optional[Tuple[str, Optional[str], Optional[str]]]:
+        """Return resource, namespace and name requested by path, None if not served."""
+        if path == NAMESPACES_PATH:
+            return "namespaces", None, None
+        for resource, pattern in (("horizontalpodautoscalers", HPA_RE), ("configmaps", CM_RE)):
+            match = pattern.match(path)
+            if match:
+                return resource, match.group("namespace"), match.group("name")
+        return None
+
+    def count(self, method: str, resource: str):
+        with self._lock:
+            self.counts[f"{method} {resource}"] += 1
+
+    def handle(self, method: str, path: str, query: Dict[str, Any], body: Any) -> Tuple[int, bytes]:
+        """Handle request, returning status code and JSON encoded response."""
+        route = self.route(path)
+        if route is None:
+            return 404, _encode(_status(404, f"{path} not found"))
+        resource, namespace, name = route
+        self.count(method, resource)
+        if str(query.get("watch", "")).lower() == "true":
+            return 400, _encode(_status(400, "Watching is not simulated"))
+        with self._lock:
+            # Encoded while locked, as objects may be changed concurrently
+            return _encode_response(self._apply(method, resource, namespace, name, query, body))
+
+    def _apply(
+        self,
+        method: str,
+        resource: str,
+        namespace: Optional[str],
+        name: Optional[str],
+        query: Dict[str, Any],
+        body: Any,
+    ) -> Tuple[int, Any]:
+        if resource == "namespaces":
+            namespaces = sorted({n for n, _ in self._objects["horizontalpodautoscalers"]})
+            return 200, _list([{"metadata": {"name": n}} for n in namespaces], str(self._resource_version))
+        objects = self._objects[resource]
+        if method == "GET" and name is None:
+            items = [o for (n, _), o in objects.items() if namespace is None or n == namespace]
+            if query.get("labelSelector"):
+                key, _, value = str(query["labelSelector"]).partition("=")
+                items = [o for o in items if (o["metadata"].get("labels") or {}).get(key) == value]
+            # Continue token is the offset of the next page
+            start = int(query.get("continue") or 0)
+            limit = int(query.get("limit") or 0) or len(items)
+            more = start + limit < len(items)
+            page = _list(items[start : start + limit], str(self._resource_version))
+            page["metadata"]["continue"] = str(start + limit) if more else ""
+            return 200, page
+        if method == "POST" and name is None:
+            if (namespace, body["metadata"]["name"]) in objects:
+                return 409, _status(409, f'{resource} "{body["metadata"]["name"]}" already exists')
+            return 201, self._create(resource, namespace, body)
+        key = (namespace, name)
+        if key not in objects:
+            return 404, _status(404, f'{resource} "{name}" not found')
+        if method == "GET":
+            return 200, objects[key]
+        if method == "PATCH":
+            if isinstance(body, list):
+                _json_patch(objects[key], body)
+            else:
+                _merge_patch(objects[key], body)
+            objects[key]["metadata"]["resourceVersion"] = self._next_resource_version()
+            return 200, objects[key]
+        if method == "DELETE":
+            del objects[key]
+            return 200, _status(200, "Success")
+        return 405, _status(405, f"{method} not allowed")
+
+    def _create(self, resource: str, namespace: str, obj: Dict[str, Any]) -> Dict[str, Any]:
+        metadata = obj.setdefault("metadata", {})
+        metadata.update(
+            namespace=namespace,
+            uid=f"uid-{namespace}-{metadata['name']}",
+            resourceVersion=self._next_resource_version(),
+            creationTimestamp=datetime.fromtimestamp(int(clock.time()), timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        )
+        self._objects[resource][(namespace, metadata["name"])] = obj
+        return obj
+
+    def _next_resource_version(self) -> str:
+        self._resource_version += 1
+        return str(self._resource_version)
+
+
+class SimulatedResponse:
+
+    """Response of SimulatedApiClient, providing what actions and ApiException use of a urllib3 response."""
+
+    def __init__(self, status: int, data: bytes):
+        self.status = status
+        self.reason = "OK" if status < 400 else "Error"
+        self.data = data
+
+    def getheaders(self) -> Dict[str, str]:
+        return {"Content-Type": "application/json"}
+
+    def getheader(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.getheaders().get(name, default)
+
+    def release_conn(self):
+        pass
+
+
+class SimulatedApiClient(client.ApiClient):
+
+    """ApiClient answering requests of all API methods using SimulatedCluster, instead of making HTTP requests."""
+
+    def __init__(self, cluster: SimulatedCluster):
+        super().__init__(client.Configuration())
+        self.cluster = cluster
+
+    def call_api(
+        self,
+        resource_path,
+        method,
+        path_params=None,
+        query_params=None,
+        header_params=None,
+        body=None,
+        post_params=None,
+        files=None,
+        response_type=None,
+        auth_settings=None,
+        async_req=None,
+        _return_http_data_only=None,
+        collection_formats=None,
+        _preload_content=True,
+        _request_timeout=None,
+        _host=None,
+    ):
+        if "protobuf" in (header_params or {}).get("Accept", ""):
+            raise client.exceptions.ApiException(status=406, reason="Protobuf is not simulated")
+        path = resource_path.format(**(path_params or {}))
+        code, data = self.cluster.handle(
+            method, path, dict(query_params or []), self.sanitize_for_serialization(body)
+        )
+        response = SimulatedResponse(code, data)
+        if code >= 400:
+            raise client.exceptions.ApiException(http_resp=response)
+        if not _preload_content:
+            result = response
+        else:
+            result = self.deserialize(response, response_type) if response_type else None
+        if _return_http_data_only:
+            return result
+        return result, code, response.getheaders()
+
+
+class Simulation:
+
+    """
+    Runs klutch components against a SimulatedCluster in virtual time.
+
+    Like Scheduler, runs run_once of each component at the deadline it returned, right away on wake events, and
+    external events (see at) at their time. Virtual time moves straight to the next deadline. Single-threaded and
+    without jitter, so runs are deterministic.
+
+    Use as context manager: While entered, the VirtualClock and SimulatedApiClient are used by all components.
+    """
+
+    def __init__(
+        self, config: KlutchConfig, cluster: Optional[SimulatedCluster] = None, start: float = SIMULATION_START_TS
+    ):
+        self.config = config
+        self.cluster = cluster or SimulatedCluster(config)
+        self.clock = VirtualClock(start)
+        self.queue: SimpleQueue = SimpleQueue()
+        self.is_active_event = threading.Event()
+        self.components: List[BaseThread] = []
+        self._jobs: Dict[str, Job] = {}
+        self._heap: List[Tuple[float, int, Job]] = []
+        self._sequence = itertools.count()
+        self._running: Optional[Job] = None
+        self._previous_clock = None
+
+    def __enter__(self) -> "Simulation":
+        self._previous_clock = clock.get_clock()
+        clock.set_clock(self.clock)
+        actions.set_api_client(SimulatedApiClient(self.cluster))
+        return self
+
+    def __exit__(self, *exc_info):
+        actions.set_api_client(None)
+        clock.set_clock(self._previous_clock)
+
+    def add_components(self):
+        """
+        Add the components of klutch not needing watches: ProcessScaler, ProcessOrphans and TriggerConfigMap if scanning.
+
+        Scaling sequences are triggered using trigger(), or by adding a trigger ConfigMap to the cluster.
+        """
+        args = (self.queue, self.is_active_event, self.config)
+        self.add(ProcessScaler(*args))
+        self.add(ProcessOrphans(*args))
+        if self.config.trigger_config_map.enabled and not self.config.trigger_config_map.watch:
+            self.add(TriggerConfigMap(*args))
+
+    def add(self, component: BaseThread):
+        """Add component, first running its set_up and run_once now."""
+        component.scheduler = self
+        self.components.append(component)
+        is_set_up = False
+
+        def job() -> Optional[float]:
+            nonlocal is_set_up
+            if not is_set_up:
+                component.set_up()
+                is_set_up = True
+            return component.run_once()
+
+        self._jobs[component.full_name] = job_ = Job(component.full_name, job, component.wake_events)
+        self._schedule(job_, self.clock.monotonic())
+
+    def at(self, delay: float, func: Callable[[], Any]):
+        """Call func after delay (virtual seconds), e.g. changing the cluster."""
+
+        def job() -> None:
+            func()
+
+        self._schedule(Job(f"event-{next(self._sequence)}", job, ()), self.clock.monotonic() + delay)
+
+    def trigger(self, source: str = "simulation"):
+        """Trigger scaling sequence now, like TriggerWebHook does."""
+        self.queue.put((source, self.clock.monotonic()))
+        self.wake(TRIGGER)
+
+    def wake(self, event: str):
+        for job in self._jobs.values():
+            if event not in job.events:
+                continue
+            if job is self._running:
+                job.wake_pending = True
+            elif job.deadline is not None:
+                self._schedule(job, self.clock.monotonic())
+
+    def run(self, duration: float):
+        """Run jobs due within duration (virtual seconds), then move the clock to its end."""
+        end = self.clock.monotonic() + duration
+        while self._heap and self._heap[0][0] <= end:
+            deadline, _, job = heapq.heappop(self._heap)
+            if deadline != job.deadline:
+                # Rescheduled since
+                continue
+            self.clock.advance_to(deadline)
+            job.deadline = None
+            self._running = job
+            try:
+                delay = job.func()
+            finally:
+                self._running = None
+            if delay is not None:
+                self._schedule(job, self.clock.monotonic() if job.wake_pending else deadline + delay)
+            job.wake_pending = False
+        self.clock.advance_to(end)
+
+    def tear_down(self):
+        for component in self.components:
+            component.tear_down()
+
+    def _schedule(self, job: Job, deadline: float):
+        job.deadline = deadline
+        heapq.heappush(self._heap, (deadline, next(self._sequence), job))
+
+
+def _status(code: int, message: str) -> Dict[str, Any]:
+    return {"kind": "Status", "apiVersion": "v1", "code": code, "message": message}
+
+
+def _list(items: List[Dict[str, Any]], resource_version: str) -> Dict[str, Any]:
+    return {"kind": "List", "apiVersion": "v1", "metadata": {"resourceVersion": resource_version}, "items": items}
+
+
+def _encode(obj: Any) -> bytes:
+    return json.dumps(obj).encode()
+
+
+def _encode_response(response: Tuple[int, Any]) -> Tuple[int, bytes]:
+    code, obj = response
+    return code, _encode(obj)
+
+
+def _merge_patch(target: Dict[str, Any], patch: Dict[str, Any]):
+    """Apply JSON merge patch (RFC 7386), also used for strategic merge patches as klutch patches no lists."""
+    for key, value in patch.items():
+        if value is None:
+            target.pop(key, None)
+        elif isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge_patch(target[key], value)
+        else:
+            target[key] = value
+
+
+def _json_patch(target: Dict[str, Any], operations: List[Dict[str, Any]]):
+    """Apply JSON patch (RFC 6902), supporting the add, replace and remove operations klutch uses."""
+    for operation in operations:
+        *parents, last = [p.replace("~1", "/").replace("~0", "~") for p in operation["path"].split("/")[1:]]
+        parent = target
+        for p in parents:
+            parent = parent.setdefault(p, {})
+        if operation["op"] == "remove":
+            parent.pop(last, None)
+        else:
+            parent[last] = operation["value"]
+
+
+def main():
+    """Simulate scaling sequences of a cluster having --hpas HPAs, reporting API requests and run time."""
+    parser = ArgumentParser(description=main.__doc__)
+    parser.add_argument("--hpas", type=int, default=100)
+    parser.add_argument("--hpas-per-namespace", type=int, default=100)
+    parser.add_argument("--sequences", type=int, default=1)
+    add_cli_options(parser, config_t=KlutchConfig)
+    args = parser.parse_args()
+
+    config = KlutchConfig()
+    fill_config_from_path(config, path=resolve_config_path(cli_args=args))
+    logging.basicConfig(format="%(levelname)s %(name)s: %(message)s", level=logging.WARNING)
+
+    started_at = time.monotonic()
+    with Simulation(config) as simulation:
+        for i in range(args.hpas):
+            simulation.cluster.add_hpa(f"ns-{i // args.hpas_per_namespace}", f"hpa-{i}")
+        simulation.add_components()
+        for _ in range(args.sequences):
+            simulation.trigger()
+            # Past the end of the sequence, which is noticed within reconcile_interval
+            simulation.run(config.common.duration + config.common.reconcile_interval)
+        simulation.tear_down()
+    virtual = args.sequences * (config.common.duration + config.common.reconcile_interval)
+    print(
+        f"Simulated {args.sequences} sequences of {args.hpas} HPAs ({virtual}s) in {time.monotonic() - started_at:.2f}s"
+    )
+    for request, count in sorted(simulation.cluster.counts.items()):
+        print(f"{request}: {count} ({count / args.sequences:.1f} per sequence)")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,17 @@
+import base64
+import gzip
 import json
 from dataclasses import asdict
 from dataclasses import dataclass
-from datetime import datetime
 from typing import Dict
 from typing import List
+from typing import Union
 
 from kubernetes import client  # type: ignore
 
+from klutch import clock
 from klutch.config import KlutchConfig
+from klutch.models import HorizontalPodAutoscaler
 
 
 @dataclass
@@ -15,6 +19,8 @@ class StatusData:
 
     """Representation of scaling status, as added to HPA annotation."""
 
+    __slots__ = ("originalMinReplicas", "originalCurrentReplicas", "appliedMinReplicas", "appliedAt")
+
     originalMinReplicas: int
     originalCurrentReplicas: int
     appliedMinReplicas: int
@@ -26,6 +32,8 @@ class HpaStatus:
 
     """Representation of scaled status, as present in status ConfigMap."""
 
+    __slots__ = ("name", "namespace", "status")
+
     name: str
     namespace: str
     status: StatusData
@@ -43,9 +51,7 @@ class SequenceStatus:
     status_list: List[HpaStatus]
 
 
-def create_hpa_status(
-    scale_target_min_replicas: int, hpa: client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler
-) -> HpaStatus:
+def create_hpa_status(scale_target_min_replicas: int, hpa: HorizontalPodAutoscaler) -> HpaStatus:
     return HpaStatus(
         name=hpa.metadata.name,
         namespace=hpa.metadata.namespace,
@@ -53,25 +59,75 @@ def create_hpa_status(
             originalMinReplicas=hpa.spec.min_replicas,
             originalCurrentReplicas=hpa.status.current_replicas,
             appliedMinReplicas=scale_target_min_replicas,
-            appliedAt=int(datetime.now().timestamp()),
+            appliedAt=int(clock.time()),
         ),
     )
 
 
+def encode_status_list(status_list: List[HpaStatus]) -> str:
+    """
+    Encode status_list compactly, as value of ConfigMap binaryData (base64).
+
+    Each HpaStatus is encoded as JSON array [namespace, name, originalMinReplicas, originalCurrentReplicas,
+    appliedMinReplicas, appliedAt], the list being gzip compressed.
+    """
+    rows = [
+        [
+            s.namespace,
+            s.name,
+            s.status.originalMinReplicas,
+            s.status.originalCurrentReplicas,
+            s.status.appliedMinReplicas,
+            s.status.appliedAt,
+        ]
+        for s in status_list
+    ]
+    compressed = gzip.compress(json.dumps(rows, separators=(",", ":")).encode(), mtime=0)
+    return base64.b64encode(compressed).decode()
+
+
+def decode_status_list(value: Union[str, bytes]) -> List[HpaStatus]:
+    """Decode result of encode_status_list. Accepts raw bytes as well, as decoded from protobuf."""
+    compressed = base64.b64decode(value) if isinstance(value, str) else value
+    return [
+        HpaStatus(name=name, namespace=namespace, status=StatusData(*status))
+        for namespace, name, *status in json.loads(gzip.decompress(compressed))
+    ]
+
+
 def sequence_status_from_cm(status_cm: client.models.v1_config_map.V1ConfigMap) -> SequenceStatus:
+    """
+    Create SequenceStatus from status ConfigMap.
+
+    Reads compact status (binaryData), as well as JSON status (data) as written by earlier versions of klutch.
+    """
     cm_ts = status_cm.metadata.creation_timestamp.timestamp()
+    compact = (status_cm.binary_data or {}).get("status")
+    if compact is not None:
+        return SequenceStatus(started_at_ts=cm_ts, status_list=decode_status_list(compact))
     hpa_status_list = []
-    for s in json.loads(status_cm.data.get("status")):
+    for s in json.loads((status_cm.data or {}).get("status")):
         hpa_status_list.append(
             HpaStatus(name=s.get("name"), namespace=s.get("namespace"), status=StatusData(**s.get("status")))
         )
     return SequenceStatus(started_at_ts=cm_ts, status_list=hpa_status_list)
 
 
-def hpa_status_from_annotated_hpa(
-    config: KlutchConfig, hpa: client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler
-) -> HpaStatus:
-    data = json.loads(hpa.metadata.annotations.get(config.common.hpa_annotation_status))
+def sequence_status_from_cms(
+    config: KlutchConfig, status_cms: List[client.models.v1_config_map.V1ConfigMap]
+) -> SequenceStatus:
+    """Create SequenceStatus from shards of status, ordered by their shard annotation. Started when shard 0 was."""
+    shards = sorted(
+        status_cms, key=lambda cm: int((cm.metadata.annotations or {}).get(config.common.cm_status_shard_key, 0))
+    )
+    sequence_status = sequence_status_from_cm(shards[0])
+    for shard in shards[1:]:
+        sequence_status.status_list.extend(sequence_status_from_cm(shard).status_list)
+    return sequence_status
+
+
+def hpa_status_from_annotated_hpa(config: KlutchConfig, hpa: HorizontalPodAutoscaler) -> HpaStatus:
+    data = json.loads((hpa.metadata.annotations or {}).get(config.common.hpa_annotation_status))
     return HpaStatus(
         name=hpa.metadata.name,
         namespace=hpa.metadata.namespace,
@@ -1,27 +1,61 @@
 import http.server
 import logging
+import math
 import threading
-import time
-from datetime import datetime
 from queue import Empty
 from queue import SimpleQueue
+from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Tuple
+from typing import Type
+from typing import Union
 
 from kubernetes import client  # type: ignore
 
 from klutch import actions
+from klutch import clock
+from klutch import metrics
+from klutch.cache import AnyHpaCache
 from klutch.config import KlutchConfig
+from klutch.metrics import ORPHAN_SCAN_DURATION
+from klutch.metrics import TRIGGER_TO_FIRST_PATCH
+from klutch.metrics import TRIGGER_TO_LAST_PATCH
+from klutch.metrics import TRIGGER_TO_WAVE_PATCHED
+from klutch.models import HorizontalPodAutoscaler
+from klutch.plan import ScalePlan
+from klutch.pool import map_concurrently
+from klutch.retry import RetryQueue
+from klutch.scheduler import TRIGGER
+from klutch.status import HpaStatus
 from klutch.status import hpa_status_from_annotated_hpa
 from klutch.status import sequence_status_from_cm
+from klutch.status import sequence_status_from_cms
 from klutch.status import SequenceStatus
 
 
 class BaseThread(threading.Thread):
 
-    tick_interval = 1
+    """
+    Component of klutch, performing its work in run_once.
+
+    Can run as a thread of its own (start), or be driven by ThreadHandler's Scheduler or AsyncHandler,
+    which set scheduler to themselves. The scheduler runs run_once again immediately on any of wake_events.
+    """
 
-    def __init__(self, queue: SimpleQueue, is_active_event: threading.Event, config: KlutchConfig, *args, **kwargs):
+    tick_interval = 1
+    wake_events: Tuple[str, ...] = ()
+
+    def __init__(
+        self,
+        queue: SimpleQueue,
+        is_active_event: threading.Event,
+        config: KlutchConfig,
+        *args,
+        hpa_cache: Optional[AnyHpaCache] = None,
+        scale_plan: Optional[ScalePlan] = None,
+        **kwargs,
+    ):
         super().__init__(*args, **kwargs)
 
         self.full_name = "{cls} ({thr})".format(cls=self.__class__.__name__, thr=self.name)
@@ -29,27 +63,53 @@ class BaseThread(threading.Thread):
         self.queue = queue
         self.is_active_event = is_active_event
         self.config = config
+        self.hpa_cache = hpa_cache
+        self.scale_plan = scale_plan
+        # Object having method wake(event), e.g. Scheduler
+        self.scheduler = None
+        self._stop_event = threading.Event()
         self.logger = logging.getLogger(self.full_name)
         self.logger.info(f"Started")
 
     def run(self):
+        self.set_up()
         try:
             while True:
                 if self.should_stop:
                     self.logger.info("Stopping")
                     return
-                self.logger.debug("Running")
-                time.sleep(self.tick_interval)
+                # Interrupted by stop
+                self._stop_event.wait(self.run_once())
         finally:
+            self.tear_down()
             self.logger.info("Stopped")
 
+    def set_up(self):
+        """Prepare before first run_once."""
+
+    def run_once(self) -> Optional[float]:
+        """
+        Perform a single iteration of work.
+
+        Returns number of seconds to wait before the next iteration, None if only waiting for stop.
+        """
+        self.logger.debug("Running")
+        return self.tick_interval
+
+    def tear_down(self):
+        """Clean up after stopping."""
+
     def stop(self):
         self.logger.info("Received stop")
         self.should_stop = True
+        self._stop_event.set()
 
     def _trigger(self):
         self.logger.info("Triggering")
-        self.queue.put(self.full_name)
+        # Time of trigger allows measuring time until scaled up
+        self.queue.put((self.full_name, clock.monotonic()))
+        if self.scheduler is not None:
+            self.scheduler.wake(TRIGGER)
 
     def _is_active(self) -> bool:
         """Return True if a scaling sequence is active."""
@@ -61,7 +121,7 @@ class ProcessScaler(BaseThread):
     """
     Main process.
 
-    Responds to trigger, scales up. Scales down after certain duration,
+    Responds to trigger, scales up. Scales down after certain duration, optionally ramping down in steps,
     On startup will scan for status configmap which indicates klutch restart (e.g. re-scheduled)
     while in midst of scale-up/down cycle.
     """
@@ -70,35 +130,52 @@ class ProcessScaler(BaseThread):
 
     sequence_status: Optional[SequenceStatus]
 
+    wake_events = (TRIGGER,)
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.queue_wait = 5
+        # Interval to check for triggers while idle. Only a fallback, as triggers wake ProcessScaler
+        self.queue_wait = 60
         self.scale_duration = self.config.common.duration
         self.reconcile_interval = self.config.common.reconcile_interval
-
-    def run(self):
+        self.sequence_status = None
+        # resourceVersion of HPAs, by namespace and name, known to match the sequence status
+        self.reconciled_versions: Dict[Tuple[str, str], str] = {}
+        self.checkpointed = 0
+        # Time of last checkpoint while scaling up
+        self.checkpointed_at = 0.0
+        # Ramp down steps applied, by namespace and name of HPA. Reverted HPAs have common.ramp_down_steps
+        self.ramp_down_steps: Dict[Tuple[str, str], int] = {}
+        # Failed scale ups and reverts, by ("scale" or "revert", namespace, name)
+        self.retry_queue: RetryQueue[Union[HorizontalPodAutoscaler, HpaStatus]] = RetryQueue()
+
+    def set_up(self):
         self._start_up()
-        try:
-            while True:
-                if self._is_active():
-                    if self._is_status_duration_expired():
-                        self._end_sequence()
-                    else:
-                        self._continue_sequence()
-                    time.sleep(self.reconcile_interval)
-                else:
-                    try:
-                        payload = self.queue.get(block=True, timeout=self.queue_wait)
-                        self.logger.info(f"Received trigger {payload}")
-                        self._start_sequence()
-                    except Empty:
-                        self.logger.debug("No trigger fired, starting next cycle.")
 
-                if self.should_stop:
-                    self.logger.info("Stopping")
-                    return
-        finally:
-            self.logger.info("Stopped")
+    def run_once(self) -> float:
+        self._retry_failed()
+        delay = self._process()
+        retry_delay = self.retry_queue.next_delay()
+        return delay if retry_delay is None else min(delay, retry_delay)
+
+    def _process(self) -> float:
+        """Start, continue or end scaling sequence. Returns number of seconds to wait before next run."""
+        if self._is_active():
+            if not self._is_status_duration_expired():
+                self._continue_sequence()
+            elif self._is_ramping_down():
+                return self._ramp_down()
+            else:
+                self._end_sequence()
+            return self.reconcile_interval
+        try:
+            source, triggered_at = self.queue.get(block=False)
+        except Empty:
+            self.logger.debug("No trigger fired, starting next cycle.")
+            return self.queue_wait
+        self.logger.info(f"Received trigger {source}")
+        self._start_sequence(triggered_at)
+        return self.reconcile_interval
 
     def _start_up(self):
         """Startup: Find any scaling status ConfigMap that might exist and resume if found."""
@@ -106,116 +183,467 @@ class ProcessScaler(BaseThread):
         if not status_cm_list:
             self.logger.info("Startup: No status for ongoing scaling sequence found.")
             return
-        status_cm = status_cm_list.pop(0)
 
-        # Store retrieved status
+        # Store retrieved status, reassembled from its shards
+        self._set_active(sequence_status_from_cms(self.config, status_cm_list))
+        self.logger.info(
+            f"Startup: Found status for ongoing scaling sequence in {len(status_cm_list)} ConfigMaps. Resuming."
+        )
+        self._recover_unrecorded()
+
+    def _start_sequence(self, triggered_at: Optional[float] = None):
+        """
+        Start scaling sequence: Write status, find HPAs and scale up, in waves by priority (highest first).
+
+        Each wave is scaled up concurrently, and completed before starting the next one.
+        Status is written before scaling up, and updated in batches (checkpoints) while scaling up. After a restart,
+        _start_up resumes the sequence, only needing to recover HPAs scaled up since the last checkpoint.
+        """
+        status_cm = actions.create_cm_status(self.config, [])
         self._set_active(sequence_status_from_cm(status_cm))
-        self.logger.info("Startup: Found status for ongoing scaling sequence. Resuming.")
-
-        # cleanup excess statuses (should not happen)
-        if status_cm_list:
-            self.logger.warning(
-                "Startup: Found multiple statuses for ongoing scaling sequence. Deleting all but newest."
+        status_list = self.sequence_status.status_list
+        self.checkpointed_at = clock.monotonic()
+        failed = 0
+        try:
+            # Ordering by priority requires all HPAs to be found before scaling up
+            waves = actions.priority_waves(self.config, actions.find_hpas(self.config, self.hpa_cache), self.logger)
+        except Exception:
+            self.logger.exception("Error finding HorizontalPodAutoscalers")
+            waves = []
+        scale_plan = self.scale_plan
+        if scale_plan is not None and scale_plan.age() is not None:
+            self.logger.info(
+                f"Using scale plan having {len(scale_plan)} targets, updated {scale_plan.age():.1f}s ago."
             )
-            for s in status_cm_list:
-                actions.delete_cm_status(s)
-
-    def _start_sequence(self):
-        """Start scaling sequence: Find HPAs, scale up and write status."""
-        status_list = []
-        hpas = actions.find_hpas(self.config)
-        for hpa in hpas:
-            try:
-                hpa_status, patched_hpa = actions.scale_hpa(self.config, hpa, self.logger)
+        for priority, hpas in waves:
+            started_at = clock.monotonic()
+            scaled_up = len(status_list)
+            failed_in_wave = self._scale_up_wave(hpas, scale_plan, triggered_at)
+            failed += failed_in_wave
+            if triggered_at is not None:
+                TRIGGER_TO_WAVE_PATCHED.observe(clock.monotonic() - triggered_at, priority=str(priority))
+            if len(waves) > 1:
+                self.logger.info(
+                    f"Scaled up wave of priority {priority}: {len(status_list) - scaled_up} HorizontalPodAutoscalers, "
+                    f"{failed_in_wave} failed, in {clock.monotonic() - started_at:.2f}s."
+                )
+        self.logger.info(f"Scaled up {len(status_list)} HorizontalPodAutoscalers, {failed} failed.")
+        if status_list and triggered_at is not None:
+            TRIGGER_TO_LAST_PATCH.observe(clock.monotonic() - triggered_at)
+        if len(status_list) > self.checkpointed:
+            self._checkpoint()
+
+    def _scale_up_wave(
+        self,
+        hpas: List[HorizontalPodAutoscaler],
+        scale_plan: Optional[ScalePlan],
+        triggered_at: Optional[float],
+    ) -> int:
+        """Scale up HPAs concurrently, adding them to the sequence status. Returns number of HPAs failing."""
+        status_list = self.sequence_status.status_list
+        failed = 0
+        for hpa, result, exception in map_concurrently(
+            lambda h: actions.scale_hpa(
+                self.config, h, self.logger, scale_plan.get(h) if scale_plan is not None else None
+            ),
+            hpas,
+            self.config.common.patch_concurrency,
+        ):
+            if isinstance(exception, (ValueError, TypeError)):
+                # Validation error, e.g. already scaled up or improper annotation
+                failed += 1
+                self.logger.warning(f"Not scaling up {actions.hpa_repr(hpa)}: {exception}")
+            elif exception is not None:
+                failed += 1
+                self.logger.error(f"Error scaling up {actions.hpa_repr(hpa)}: {exception}", exc_info=exception)
+                self._add_retry("scale", hpa.metadata.namespace, hpa.metadata.name, hpa, exception)
+            else:
+                hpa_status, patched_hpa = result
+                if not status_list and triggered_at is not None:
+                    TRIGGER_TO_FIRST_PATCH.observe(clock.monotonic() - triggered_at)
                 status_list.append(hpa_status)
-            except Exception as e:
-                self.logger.exception()
-        self._set_active(sequence_status_from_cm(status_cm))
-        status_cm = actions.create_cm_status(self.config, status_list)
+                # Patched HPA matches status, no need to reconcile until it changes
+                self.reconciled_versions[
+                    (hpa_status.namespace, hpa_status.name)
+                ] = patched_hpa.metadata.resource_version
+                if (
+                    len(status_list) - self.checkpointed >= self.config.common.status_checkpoint_size
+                    or clock.monotonic() - self.checkpointed_at >= self.config.common.status_checkpoint_interval
+                ):
+                    self._checkpoint()
+                    self.checkpointed_at = clock.monotonic()
+        return failed
+
+    def _checkpoint(self):
+        """Write HpaStatus added to ongoing sequence since last checkpoint to status ConfigMap."""
+        status_list = self.sequence_status.status_list
+        try:
+            actions.update_cm_status(self.config, status_list, self.checkpointed)
+        except Exception:
+            # HPAs are annotated, so will be reverted by orphan scan if status is lost
+            self.logger.exception("Error updating status ConfigMap")
+        else:
+            self.checkpointed = len(status_list)
+
+    def _recover_unrecorded(self):
+        """Add HPAs scaled up by the ongoing sequence, but not recorded in its status, e.g. when klutch crashed."""
+        recorded = {(s.namespace, s.name) for s in self.sequence_status.status_list}
+        recovered = []
+        try:
+            for hpa in actions.find_hpas(self.config, self.hpa_cache, metadata_only=True):
+                if self.config.common.hpa_annotation_status not in (hpa.metadata.annotations or {}):
+                    continue
+                if (hpa.metadata.namespace, hpa.metadata.name) in recorded:
+                    continue
+                hpa_status = hpa_status_from_annotated_hpa(self.config, hpa)
+                # Annotations of an earlier sequence are left to the orphan scan
+                if hpa_status.status.appliedAt >= self.sequence_status.started_at_ts:
+                    recovered.append(hpa_status)
+        except Exception:
+            # Unrecorded HPAs will be reverted by orphan scan
+            self.logger.exception("Startup: Error finding HorizontalPodAutoscalers scaled up since status.")
+        if recovered:
+            self.logger.info(f"Startup: Recovered {len(recovered)} HorizontalPodAutoscalers scaled up since status.")
+            self.sequence_status.status_list.extend(recovered)
+            self._checkpoint()
 
     def _continue_sequence(self):
         """While active: Clear any additional triggers from queue, reconcile HPAs."""
         self.logger.debug(f"Continuing scaling sequence.")
+        to_reconcile = []
         for status in self.sequence_status.status_list:
-            actions.reconcile_hpa(self.config, status, self.logger)
+            hpa = None
+            if self.hpa_cache is not None and self.hpa_cache.is_synced():
+                hpa = self.hpa_cache.get(status.namespace, status.name)
+                key = (status.namespace, status.name)
+                if hpa is not None and self.reconciled_versions.get(key) == hpa.metadata.resource_version:
+                    continue
+            to_reconcile.append((status, hpa))
+
+        for (status, hpa), reconciled_hpa, exception in map_concurrently(
+            lambda s: actions.reconcile_hpa(self.config, s[0], self.logger, s[1]),
+            to_reconcile,
+            self.config.common.patch_concurrency,
+        ):
+            key = (status.namespace, status.name)
+            if exception is not None:
+                self.reconciled_versions.pop(key, None)
+                self.logger.error(
+                    "Error reconciling HorizontalPodAutoscaler (namespace={}, name={}): {}".format(
+                        status.namespace, status.name, exception
+                    ),
+                    exc_info=exception,
+                )
+            else:
+                self.reconciled_versions[key] = reconciled_hpa.metadata.resource_version
+        self._clear_all_triggers()
+
+    def _ramp_down(self) -> float:
+        """
+        Step minReplicas of HPAs down towards original values, reverting them at the last step.
+
+        Starts once duration expired, taking common.ramp_down_steps steps over common.ramp_down_duration. Steps of
+        HPAs are staggered over a step interval, stepping down HPAs scaled up first (highest priority) last.
+        Failed steps are retried by the next run. Returns number of seconds to wait before the next step.
+        """
+        steps = self.config.common.ramp_down_steps
+        interval = self.config.common.ramp_down_duration / steps
+        started_at = self.sequence_status.started_at_ts + self.config.common.duration
+        status_list = self.sequence_status.status_list
+        now = clock.time()
+        next_step_at = started_at + self.config.common.ramp_down_duration
+        due = []
+        for i, status in enumerate(status_list):
+            offset = interval * (len(status_list) - 1 - i) / len(status_list)
+            elapsed = now - started_at - offset
+            step = 0 if elapsed < 0 else min(int(elapsed // interval) + 1, steps)
+            if step < steps:
+                next_step_at = min(next_step_at, started_at + offset + step * interval)
+            if step > self.ramp_down_steps.get((status.namespace, status.name), 0):
+                due.append((status, step))
+
+        for (status, step), _, exception in map_concurrently(
+            lambda d: self._step_down(*d), due, self.config.common.patch_concurrency
+        ):
+            if exception is not None:
+                self.logger.error(
+                    "Error ramping down HorizontalPodAutoscaler (namespace={}, name={}): {}".format(
+                        status.namespace, status.name, exception
+                    ),
+                    exc_info=exception,
+                )
+            else:
+                self.ramp_down_steps[(status.namespace, status.name)] = step
         self._clear_all_triggers()
+        return min(max(next_step_at - clock.time(), 0), self.reconcile_interval)
+
+    def _step_down(self, status: HpaStatus, step: int):
+        """Apply ramp down step to HPA, reverting it at the last step."""
+        steps = self.config.common.ramp_down_steps
+        if step >= steps:
+            actions.revert_hpa(self.config, status, self.logger)
+            return
+        original, applied = status.status.originalMinReplicas, status.status.appliedMinReplicas
+        min_replicas = original + math.ceil((applied - original) * (steps - step) / steps)
+        actions.step_down_hpa(self.config, status, min_replicas, self.logger)
 
     def _end_sequence(self):
-        """End sequence: Revert HPAs, clear status."""
+        """End sequence: Revert HPAs not reverted by ramp down yet, clear status."""
         self.logger.info(f"Ending scaling sequence.")
+        for key in self.retry_queue.keys():
+            if key[0] == "scale":
+                self.retry_queue.done(key)
         for status in self.sequence_status.status_list:
-            actions.revert_hpa(self.config, status, self.logger)
+            if self.ramp_down_steps.get((status.namespace, status.name), 0) >= self.config.common.ramp_down_steps:
+                continue
+            try:
+                actions.revert_hpa(self.config, status, self.logger)
+            except Exception as e:
+                self.logger.error(
+                    f"Error reverting HorizontalPodAutoscaler (namespace={status.namespace}, name={status.name}): {e}",
+                    exc_info=e,
+                )
+                self._add_retry("revert", status.namespace, status.name, status, e)
         self._clear_all_triggers()
         self._set_inactive()
 
+    def _retry_failed(self):
+        """Retry failed scale ups (while active) and reverts that are due."""
+        scaled_up = []
+        for key, item in self.retry_queue.due():
+            operation, namespace, name = key
+            if operation == "scale" and (not self._is_active() or self._is_status_duration_expired()):
+                # Sequence ended, failed to start, or is ramping down
+                self.retry_queue.done(key)
+                continue
+            try:
+                if operation == "scale":
+                    scaled_up.append(actions.scale_hpa(self.config, item, self.logger))
+                else:
+                    actions.revert_hpa(self.config, item, self.logger)
+            except Exception as e:
+                self.logger.warning(f"Retry to {operation} HorizontalPodAutoscaler failed: {e}")
+                self._add_retry(operation, namespace, name, item, e)
+            else:
+                self.retry_queue.done(key)
+        if not scaled_up:
+            return
+        for hpa_status, patched_hpa in scaled_up:
+            self.sequence_status.status_list.append(hpa_status)
+            self.reconciled_versions[(hpa_status.namespace, hpa_status.name)] = patched_hpa.metadata.resource_version
+        self.logger.info(f"Scaled up {len(scaled_up)} HorizontalPodAutoscalers on retry.")
+        self._checkpoint()
+
+    def _add_retry(
+        self,
+        operation: str,
+        namespace: str,
+        name: str,
+        item: Union[HorizontalPodAutoscaler, HpaStatus],
+        exception: Exception,
+    ):
+        """Queue failed operation for retry, unless exception is not transient."""
+        repr = f"HorizontalPodAutoscaler (namespace={namespace}, name={name})"
+        if not _is_transient(exception):
+            self.retry_queue.done((operation, namespace, name))
+            if operation == "revert":
+                self.logger.warning(f"Not retrying to revert {repr}, leaving it to orphan scan.")
+        elif not self.retry_queue.add((operation, namespace, name), item, self.config.common.retry_timeout):
+            self.logger.error(f"Giving up retrying to {operation} {repr}.")
+
     def _is_status_duration_expired(self) -> bool:
         """Return True if duration of scaling sequence has expired."""
         if not self.sequence_status:
             return False
-        now = datetime.now().timestamp()
+        now = clock.time()
         return self.sequence_status.started_at_ts + self.config.common.duration < now
 
+    def _is_ramping_down(self) -> bool:
+        """Return True if duration expired less than common.ramp_down_duration ago."""
+        ends_at = (
+            self.sequence_status.started_at_ts + self.config.common.duration + self.config.common.ramp_down_duration
+        )
+        return clock.time() < ends_at
+
     def _clear_all_triggers(self):
         """Clear any triggers added to the queue."""
         while not self.queue.empty():
-            ignored_payload = self.queue.get(block=False)
-            self.logger.info(f"Ignoring trigger {ignored_payload} while scaling sequence is active.")
+            ignored_source, _ = self.queue.get(block=False)
+            self.logger.info(f"Ignoring trigger {ignored_source} while scaling sequence is active.")
 
-    def _set_active(self, sequence_status: SequenceStatus):
-        """Set global active flag and store HpaStatus list."""
+    def _set_active(
+        self, sequence_status: SequenceStatus, reconciled_versions: Optional[Dict[Tuple[str, str], str]] = None
+    ):
+        """Set global active flag and store HpaStatus list, along with resourceVersions known to match it."""
         self.is_active_event.set()
         self.sequence_status = sequence_status
+        self.reconciled_versions = reconciled_versions or {}
+        self.ramp_down_steps = {}
+        # Number of HpaStatus of sequence_status stored in status ConfigMap
+        self.checkpointed = len(sequence_status.status_list)
 
     def _set_inactive(self):
         """Clear global active flag and clear HpaStatus list."""
         self.is_active_event.clear()
         actions.delete_cm_status(self.config, self.logger)
         self.sequence_status = None
+        self.reconciled_versions = {}
+        self.ramp_down_steps = {}
+        self.checkpointed = 0
+
+
+def _is_transient(exception: Exception) -> bool:
+    """Return True if an operation failing with exception may succeed when retried."""
+    if isinstance(exception, client.exceptions.ApiException):
+        return exception.status in (409, 429) or exception.status >= 500
+    # Validation errors, e.g. already scaled up or improper annotation
+    return not isinstance(exception, (ValueError, TypeError))
+
+
+class PlanScale(BaseThread):
+
+    """
+    Keeps ScalePlan up to date with the HPA cache, so a scaling sequence does not need to calculate scale targets.
+
+    Only recalculates targets of HPAs that changed since the previous update.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tick_interval = self.config.common.scale_plan_interval
+
+    def run_once(self) -> float:
+        # While active, HPAs are scaled up, having no target
+        if self._is_active() or not self.hpa_cache.is_synced():
+            return self.tick_interval
+        previous = self.scale_plan.targets()
+        targets = {}
+        for hpa in self.hpa_cache.list():
+            key = (hpa.metadata.namespace, hpa.metadata.name)
+            target = previous.get(key)
+            if target is None or target.resource_version != hpa.metadata.resource_version:
+                try:
+                    target = actions.plan_scale_hpa(self.config, hpa)
+                except (ValueError, TypeError):
+                    # Can not be scaled up right now, scale_hpa will report why if triggered
+                    continue
+            targets[key] = target
+        self.scale_plan.replace(targets)
+        self.logger.debug(f"Updated scale plan having {len(targets)} targets.")
+        return self.tick_interval
 
 
 class TriggerConfigMap(BaseThread):
+
+    """
+    Trigger on ConfigMaps labeled as trigger.
+
+    Watches for trigger ConfigMaps, triggering as soon as one is added. Falls back to scanning every
+    scan_interval if watch is disabled, or for a period of watch_retry_interval after the watch failed.
+    """
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.tick_interval = self.config.trigger_config_map.scan_interval
+        self.watch_failed_at: Optional[float] = None
+        self.resource_version: Optional[str] = None
+
+    def run_once(self) -> float:
+        """Scan, or watch until the watch request times out."""
+        if not self._should_watch():
+            try:
+                self._scan()
+            except Exception:
+                self.logger.exception("Error scanning for trigger ConfigMap objects.")
+            return self.tick_interval
 
-    def run(self):
         try:
-            while True:
+            if self.resource_version is None:
+                self.resource_version = self._scan()
+            for event_type, trigger_cm, self.resource_version in actions.watch_cm_triggers(
+                self.config, self.resource_version, self.config.common.watch_timeout
+            ):
+                if event_type == "ADDED":
+                    self._process_watched_trigger(trigger_cm)
                 if self.should_stop:
-                    self.logger.info("Stopping")
-                    return
-
-                self.logger.debug("Looking for trigger ConfigMap objects.")
-                trigger_cm_list = actions.find_cm_triggers(self.config)
-
-                if trigger_cm_list:
-                    trigger_cm = trigger_cm_list.pop(0)
-                    # validate
-                    if actions.validate_cm_trigger(self.config, trigger_cm):
-                        self._trigger()
-                    else:
-                        self.logger.warning(
-                            "Trigger ConfigMap (name={}, uid={}) is not valid (expired) and has been deleted.".format(
-                                trigger_cm.metadata.name,
-                                trigger_cm.metadata.uid,
-                            )
-                        )
-                    # cleanup
-                    actions.delete_cm_trigger(trigger_cm)
-                    if trigger_cm_list:
-                        self.logger.warning("More than one trigger found. Using most recent. Removing others.")
-                        for t in trigger_cm_list:
-                            actions.delete_cm_trigger(t)
-                else:
-                    self.logger.debug("No triggers found")
+                    break
+        except client.exceptions.ApiException as e:
+            self.resource_version = None
+            if e.status == 410:
+                self.logger.info("Watch resourceVersion expired, rescanning.")
+            else:
+                self._set_watch_failed()
+        except Exception:
+            self.resource_version = None
+            self._set_watch_failed()
+        return 0
+
+    def _should_watch(self) -> bool:
+        if not self.config.trigger_config_map.watch:
+            return False
+        if self.watch_failed_at is None:
+            return True
+        if clock.monotonic() - self.watch_failed_at >= self.config.trigger_config_map.watch_retry_interval:
+            self.logger.info("Retrying watch for trigger ConfigMap objects.")
+            self.watch_failed_at = None
+            return True
+        return False
+
+    def _set_watch_failed(self):
+        self.logger.exception("Error watching trigger ConfigMap objects. Falling back to scanning.")
+        self.watch_failed_at = clock.monotonic()
+
+    def _scan(self) -> str:
+        """Look for trigger ConfigMaps and process them. Returns resourceVersion of the list."""
+        self.logger.debug("Looking for trigger ConfigMap objects.")
+        trigger_cm_list, resource_version = actions.list_cm_triggers(self.config)
+        self._process_triggers(trigger_cm_list)
+        return resource_version
+
+    def _process_watched_trigger(self, trigger_cm: client.models.v1_config_map.V1ConfigMap):
+        """Process trigger ConfigMap received from watch. Errors are logged, not affecting the watch."""
+        try:
+            self._process_triggers([trigger_cm])
+        except Exception:
+            self.logger.exception("Error processing trigger ConfigMap.")
+
+    def _process_triggers(self, trigger_cm_list: List[client.models.v1_config_map.V1ConfigMap]):
+        """Trigger if most recent trigger ConfigMap is valid. Delete all."""
+        if not trigger_cm_list:
+            self.logger.debug("No triggers found")
+            return
 
-                time.sleep(self.tick_interval)
-        finally:
-            self.logger.info("Stopped")
+        trigger_cm = trigger_cm_list.pop(0)
+        # validate
+        if actions.validate_cm_trigger(self.config, trigger_cm):
+            self._trigger()
+        else:
+            self.logger.warning(
+                "Trigger ConfigMap (name={}, uid={}) is not valid (expired) and has been deleted.".format(
+                    trigger_cm.metadata.name,
+                    trigger_cm.metadata.uid,
+                )
+            )
+        # cleanup
+        self._delete_trigger(trigger_cm)
+        if trigger_cm_list:
+            self.logger.warning("More than one trigger found. Using most recent. Removing others.")
+            for t in trigger_cm_list:
+                self._delete_trigger(t)
+
+    def _delete_trigger(self, trigger_cm: client.models.v1_config_map.V1ConfigMap):
+        """Delete trigger ConfigMap, tolerating it to be deleted already."""
+        try:
+            actions.delete_cm_trigger(trigger_cm)
+        except client.exceptions.ApiException as e:
+            if e.status == 404:
+                self.logger.debug(f"Trigger ConfigMap (name={trigger_cm.metadata.name}) already deleted.")
+            else:
+                self.logger.exception(f"Error deleting trigger ConfigMap (name={trigger_cm.metadata.name}).")
 
 
 class TriggerWebHook(BaseThread):
-    def run(self):
+    def set_up(self):
         _queue = self.queue
         _logger = self.logger
         _trigger = self._trigger
@@ -240,25 +668,64 @@ class TriggerWebHook(BaseThread):
                 self.logger.info(format % args)
 
         server_address = (self.config.trigger_web_hook.address, self.config.trigger_web_hook.port)
-        httpd = http.server.ThreadingHTTPServer(server_address, Handler)
+        self.httpd = _start_webserver(server_address, Handler, self.logger)
 
-        def start_threaded(httpd):
-            httpd.serve_forever()
+    def run_once(self) -> Optional[float]:
+        # Requests are handled by the webserver thread
+        return None
 
-        self.logger.info(f"Starting webserver at {server_address}")
-        thread = threading.Thread(target=start_threaded, args=(httpd,))
-        thread.start()
+    def tear_down(self):
+        self.httpd.shutdown()
 
-        try:
-            while True:
-                if self.should_stop:
-                    self.logger.info("Stopping")
-                    httpd.shutdown()
+
+class MetricsServer(BaseThread):
+
+    """Serve metrics in Prometheus text format at /metrics."""
+
+    def set_up(self):
+        _logger = self.logger
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            logger = _logger
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
                     return
-                self.logger.debug("Running")
-                time.sleep(self.tick_interval)
-        finally:
-            self.logger.info("Stopped")
+                body = metrics.expose().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-type", metrics.CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                self.logger.debug(format % args)
+
+        server_address = (self.config.metrics.address, self.config.metrics.port)
+        self.httpd = _start_webserver(server_address, Handler, self.logger)
+
+    def run_once(self) -> Optional[float]:
+        # Requests are handled by the webserver thread
+        return None
+
+    def tear_down(self):
+        self.httpd.shutdown()
+
+
+def _start_webserver(
+    server_address: Tuple[str, int], handler: Type[http.server.BaseHTTPRequestHandler], logger: logging.Logger
+) -> http.server.ThreadingHTTPServer:
+    """Start webserver in a thread of its own, returning it to allow shutting it down."""
+    httpd = http.server.ThreadingHTTPServer(server_address, handler)
+
+    def start_threaded(httpd):
+        httpd.serve_forever()
+
+    logger.info(f"Starting webserver at {server_address}")
+    thread = threading.Thread(target=start_threaded, args=(httpd,))
+    thread.start()
+    return httpd
 
 
 class ProcessOrphans(BaseThread):
@@ -270,28 +737,72 @@ class ProcessOrphans(BaseThread):
     are scaled up and revert them to their original state.
     """
 
-    def run(self):
-        elapsed = 0
-        tick = 3
-
-        while True:
-            if self.should_stop:
-                self.logger.info("Stopping")
-                return
-            if self._is_active():
-                elapsed = 0
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tick_interval = self.config.common.scan_orphans_interval
+        # Monotonic time of next scan. Postponed while a scaling sequence is active
+        self.next_scan_at = clock.monotonic() + self.tick_interval
+
+    def run_once(self) -> float:
+        now = clock.monotonic()
+        if self._is_active():
+            self.next_scan_at = now + self.tick_interval
+            return self.tick_interval
+        if now < self.next_scan_at:
+            return self.next_scan_at - now
+        self.next_scan_at = now + self.tick_interval
+        self.logger.info("Searching for orphan HorizontalPodAutoscalers that need to be reverted.")
+        with ORPHAN_SCAN_DURATION.time():
+            # Only annotations are needed to find orphans, revert_hpa loads the full HPA
+            hpas = actions.find_hpas(self.config, self.hpa_cache, metadata_only=True)
+            for hpa in hpas:
+                if self.config.common.hpa_annotation_status in (hpa.metadata.annotations or {}):
+                    self.logger.warning("Found {} having status annotation, reverting.".format(actions.hpa_repr(hpa)))
+                    # @TODO Needs error handling if annotation data not complete
+                    actions.revert_hpa(self.config, hpa_status_from_annotated_hpa(self.config, hpa), self.logger)
+        return self.tick_interval
+
+
+class WatchHpas(BaseThread):
+
+    """
+    Keep HpaCache in sync with the cluster.
+
+    Lists all HPAs once, then watches from the returned resourceVersion. Relists when the
+    resourceVersion has expired (410 Gone) or the watch failed otherwise.
+    Limited to a single namespace if the HpaCache is.
+    """
+
+    def run_once(self) -> float:
+        """List if needed, then watch until the watch request times out."""
+        try:
+            if not self.hpa_cache.is_synced():
+                hpas, resource_version = actions.list_hpas(
+                    self.config, self.hpa_cache.predicate, self.hpa_cache.namespace
+                )
+                self.hpa_cache.replace(hpas, resource_version)
+                self.logger.info(
+                    f"Listed {len(hpas)} HorizontalPodAutoscalers at {resource_version}, "
+                    f"cached {len(self.hpa_cache)} enabled ones"
+                )
+            for event_type, hpa, resource_version in actions.watch_hpas(
+                self.config,
+                self.hpa_cache.resource_version,
+                self.config.common.watch_timeout,
+                self.hpa_cache.namespace,
+            ):
+                self.hpa_cache.apply(event_type, hpa, resource_version)
+                if self.should_stop:
+                    break
+        except client.exceptions.ApiException as e:
+            self.hpa_cache.invalidate()
+            if e.status == 410:
+                self.logger.info("Watch resourceVersion expired, relisting.")
             else:
-                elapsed += tick
-                if elapsed >= self.config.common.scan_orphans_interval:
-                    self.logger.info("Searching for orphan HorizontalPodAutoscalers that need to be reverted.")
-                    hpas = actions.find_hpas(self.config)
-                    for hpa in hpas:
-                        if self.config.common.hpa_annotation_status in hpa.metadata.annotations:
-                            self.logger.warning(
-                                "Found {} having status annotation, reverting.".format(actions._hpa_repr(hpa))
-                            )
-                            # @TODO Needs error handling if annotation data not complete
-                            actions.revert_hpa(
-                                self.config, hpa_status_from_annotated_hpa(self.config, hpa), self.logger
-                            )
-            time.sleep(tick)
+                self.logger.exception("Error watching HorizontalPodAutoscalers, relisting.")
+                return self.tick_interval
+        except Exception:
+            self.logger.exception("Error watching HorizontalPodAutoscalers, relisting.")
+            self.hpa_cache.invalidate()
+            return self.tick_interval
+        return 0
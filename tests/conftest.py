@@ -6,6 +6,9 @@ from unittest.mock import Mock
 import pytest
 from kubernetes import client
 
+from klutch import clock
+from klutch.clock import SystemClock
+from klutch.clock import VirtualClock
 from klutch.config import config as klutch_config
 
 REFERENCE_TS = 1500000000
@@ -22,6 +25,21 @@ def mock_client(monkeypatch):
 def mock_config():
     mock_config = Mock(klutch_config)
     mock_config.common.namespace = "test-ns"
+    mock_config.common.namespaces = ()
+    mock_config.common.namespace_label_selector = ""
+    mock_config.common.exclude_namespaces = ()
+    mock_config.common.api_content_type = "json"
+    mock_config.common.schedule_jitter = 0.0
+    mock_config.common.patch_without_read = False
+    mock_config.common.retry_timeout = 60
+    mock_config.common.status_checkpoint_size = 100
+    mock_config.common.status_checkpoint_interval = 1.0
+    mock_config.common.cm_status_shard_size = 10000
+    mock_config.common.cm_status_shard_key = "klutch.it/status-shard"
+    mock_config.common.patch_scale_target = False
+    mock_config.common.ramp_down_duration = 0
+    mock_config.common.ramp_down_steps = 4
+    mock_config.common.hpa_annotation_priority = "klutch.it/priority"
     return mock_config
 
 
@@ -37,6 +55,15 @@ def frozen(freezer):
     return freezer
 
 
+@pytest.fixture
+def virtual_clock():
+    """Replace clock of all components by a VirtualClock, starting at REFERENCE_TS."""
+    virtual_clock = VirtualClock(REFERENCE_TS)
+    clock.set_clock(virtual_clock)
+    yield virtual_clock
+    clock.set_clock(SystemClock())
+
+
 @pytest.fixture
 def kubeconfig(tmpdir):
     """Write test kube config file and return it's location."""
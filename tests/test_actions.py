@@ -7,7 +7,18 @@ import pytest
 from kubernetes import client
 
 from .conftest import REFERENCE_TS
+from .test_protobuf import encode_config_map
+from .test_protobuf import encode_hpa
+from .test_protobuf import encode_list
+from .test_protobuf import encode_object_meta
+from .test_protobuf import encode_watch_frame
+from .test_protobuf import envelope
+from .test_protobuf import field
+from .test_protobuf import reader
 from klutch import actions
+from klutch.cache import HpaCache
+from klutch.ratelimit import RateLimiter
+from klutch.status import decode_status_list
 from klutch.status import HpaStatus
 from klutch.status import StatusData
 
@@ -24,6 +35,39 @@ def get_mock_hpa(name="test-hpa", namespace="test-ns", min_repl=2, max_repl=10,
     return mock_hpa
 
 
+def hpa_dict(
+    name="test-hpa",
+    namespace="test-ns",
+    min_repl=2,
+    max_repl=10,
+    current_repl=4,
+    annotations=None,
+    labels=None,
+    resource_version="1",
+):
+    """Return HPA as JSON decoded from API response."""
+    return {
+        "metadata": {
+            "name": name,
+            "namespace": namespace,
+            "resourceVersion": resource_version,
+            "annotations": annotations,
+            "labels": labels,
+        },
+        "spec": {"minReplicas": min_repl, "maxReplicas": max_repl},
+        "status": {"currentReplicas": current_repl},
+    }
+
+
+def mock_response(data):
+    """Return mock of urllib3 response having JSON body, as returned by API methods using _preload_content=False."""
+    return MagicMock(data=json.dumps(data).encode())
+
+
+def mock_hpa_list_response(hpas, _continue=None, resource_version="100"):
+    return mock_response({"metadata": {"resourceVersion": resource_version, "continue": _continue}, "items": hpas})
+
+
 def test_find_cm_triggers(mock_client, mock_config):
     mock_cm_new = MagicMock(spec=client.models.v1_config_map.V1ConfigMap)
     mock_cm_new.metadata.name = "new"
@@ -47,6 +91,24 @@ def test_find_cm_triggers(mock_client, mock_config):
     )
 
 
+def test_watch_cm_triggers(mock_client, mock_config, monkeypatch):
+    mock_config.trigger_config_map.cm_trigger_label_key = "test-trigger"
+    mock_config.trigger_config_map.cm_trigger_label_value = "yes"
+    mock_cm = MagicMock(spec=client.models.v1_config_map.V1ConfigMap)
+    mock_cm.metadata.resource_version = "101"
+    mock_watch = MagicMock()
+    mock_watch.Watch().stream.return_value = [{"type": "ADDED", "object": mock_cm, "raw_object": {}}]
+    monkeypatch.setattr("klutch.actions.watch", mock_watch)
+
+    events = list(actions.watch_cm_triggers(mock_config, "100", 5))
+
+    assert events == [("ADDED", mock_cm, "101")]
+    call = mock_watch.Watch().stream.call_args
+    assert call.args == (mock_client.CoreV1Api().list_namespaced_config_map, "test-ns")
+    assert call.kwargs["label_selector"] == "test-trigger=yes"
+    assert call.kwargs["resource_version"] == "100"
+
+
 @pytest.mark.parametrize(
     "creation_timestamp, trigger_max_age, expected",
     [
@@ -133,10 +195,46 @@ def test_create_cm_status(mock_client, mock_config):
     assert type(call_args[0].args[1]) == client.models.v1_config_map.V1ConfigMap
     assert call_args[0].args[1].metadata.name == "kl-status-name"
     assert call_args[0].args[1].metadata.labels.get("kl-status") == "yes"
-    assert json.loads(call_args[0].args[1].data.get("status")) == [s.dict() for s in status_list]
+    assert decode_status_list(call_args[0].args[1].binary_data.get("status")) == status_list
     assert resp is mock_response
 
 
+def test_create_cm_status_shards(mock_client, mock_config):
+    mock_config.common.cm_status_name = "kl-status-name"
+    mock_config.common.cm_status_shard_size = 2
+    mock_client.models = client.models
+    status_list = [HpaStatus(name=f"hpa-{i}", namespace="ns", status=StatusData(1, 2, 4, 0)) for i in range(5)]
+
+    actions.create_cm_status(mock_config, status_list)
+
+    created = [c.args[1] for c in mock_client.CoreV1Api().create_namespaced_config_map.call_args_list]
+    assert [c.metadata.name for c in created] == ["kl-status-name", "kl-status-name-1", "kl-status-name-2"]
+    assert [c.metadata.annotations["klutch.it/status-shard"] for c in created] == ["0", "1", "2"]
+    assert [s for c in created for s in decode_status_list(c.binary_data["status"])] == status_list
+
+
+def test_update_cm_status_writes_changed_shards(mock_client, mock_config):
+    mock_config.common.cm_status_name = "kl-status-name"
+    mock_config.common.cm_status_shard_size = 2
+    mock_client.models = client.models
+    mock_client.exceptions = client.exceptions
+    status_list = [HpaStatus(name=f"hpa-{i}", namespace="ns", status=StatusData(1, 2, 4, 0)) for i in range(5)]
+    # Third shard does not exist yet
+    mock_client.CoreV1Api().patch_namespaced_config_map.side_effect = [
+        None,
+        client.exceptions.ApiException(status=404),
+    ]
+
+    actions.update_cm_status(mock_config, status_list, 3)
+
+    patched = mock_client.CoreV1Api().patch_namespaced_config_map.call_args_list
+    assert [c.args[0] for c in patched] == ["kl-status-name-1", "kl-status-name-2"]
+    assert patched[0].args[2]["data"] is None
+    assert decode_status_list(patched[0].args[2]["binaryData"]["status"]) == status_list[2:4]
+    created = mock_client.CoreV1Api().create_namespaced_config_map.call_args.args[1]
+    assert created.metadata.name == "kl-status-name-2"
+
+
 def test_delete_cm_status(mock_client, mock_config, logger):
     mock_cm = MagicMock(spec=client.models.v1_config_map.V1ConfigMap)
     mock_cm.metadata.name = "foo-name"
@@ -161,25 +259,24 @@ def test_delete_cm_status(mock_client, mock_config, logger):
     ],
 )
 def test_find_hpas(mock_client, mock_config, annotation_key, annotation_value, should_be_included):
-    # This one should never be included
-    mock_hpa1 = MagicMock(spec=client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler)
-    mock_hpa1.metadata.annotations = {"proper_annotation_key": "1"}
-    # This one should be included based on test parameters
-    mock_hpa2 = MagicMock(spec=client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler)
-    mock_hpa2.metadata.annotations = {annotation_key: annotation_value}
-
+    mock_config.common.hpa_opt_in = "annotation"
     mock_config.common.hpa_annotation_enabled_key = "proper_annotation_key"
     mock_config.common.hpa_annotation_enabled_value = "1"
 
-    mock_hpa_list = MagicMock()
-    mock_hpa_list.items = [mock_hpa1, mock_hpa2]
-    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.return_value = mock_hpa_list
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.return_value = mock_hpa_list_response(
+        [
+            # This one should never be included
+            hpa_dict(name="hpa1", annotations={"proper_annotation_key": "1"}),
+            # This one should be included based on test parameters
+            hpa_dict(name="hpa2", annotations={annotation_key: annotation_value}),
+        ]
+    )
 
     found = actions.find_hpas(mock_config)
-    found = list(found)
+    found = [h.metadata.name for h in found]
 
-    assert mock_hpa1 in found
-    assert (mock_hpa2 in found) is should_be_included
+    assert "hpa1" in found
+    assert ("hpa2" in found) is should_be_included
 
 
 @pytest.mark.parametrize(
@@ -218,8 +315,9 @@ def test_scale_hpa_patches(
         current_repl=hpa_current_r,
         annotations={"kl-scale-to": hpa_scale_perc},
     )
-    mock_patched_hpa = get_mock_hpa()
-    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_patched_hpa
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
 
     expected_hpa_status = HpaStatus(
         name="test-hpa",
@@ -241,10 +339,39 @@ def test_scale_hpa_patches(
         returned_status, returned_hpa = actions.scale_hpa(mock_config, mock_original_hpa, logger)
 
         mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.assert_called_once_with(
-            "test-hpa", "test-ns", expected_patch_body
+            "test-hpa", "test-ns", expected_patch_body, _preload_content=False
         )
         assert returned_status == expected_hpa_status
-        assert returned_hpa is mock_patched_hpa
+        assert returned_hpa.metadata.resource_version == "2"
+
+
+def test_scale_hpa_uses_target(frozen, mock_client, mock_config):
+    mock_config.common.hpa_annotation_scale_perc_of_actual = "kl-scale-to"
+    mock_config.common.hpa_annotation_status = "kl-status"
+    mock_hpa = get_mock_hpa(min_repl=2, max_repl=10, current_repl=6, annotations={"kl-scale-to": "200"})
+    frozen.move_to(datetime.fromtimestamp(REFERENCE_TS - 100))
+    target = actions.plan_scale_hpa(mock_config, mock_hpa)
+    frozen.move_to(datetime.fromtimestamp(REFERENCE_TS))
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
+    mock_config.common.hpa_annotation_scale_perc_of_actual = None
+    mock_logger = MagicMock()
+
+    returned_status, _ = actions.scale_hpa(mock_config, mock_hpa, mock_logger, target)
+
+    # Not calculated again, but applied at current time
+    assert returned_status.status.appliedMinReplicas == 10
+    assert returned_status.status.appliedAt == REFERENCE_TS
+    assert target.hpa_status.status.appliedAt == REFERENCE_TS - 100
+    expected_patch_body = {
+        "metadata": {"annotations": {"kl-status": json.dumps(returned_status.dict().get("status"))}},
+        "spec": {"minReplicas": 10},
+    }
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.assert_called_once_with(
+        "test-hpa", "test-ns", expected_patch_body, _preload_content=False
+    )
+    assert "instead of intended value 12" in mock_logger.warning.call_args.args[0]
 
 
 def test_scale_hpa_raises_if_annotation_found(mock_client, mock_config, logger):
@@ -258,15 +385,76 @@ def test_scale_hpa_raises_if_annotation_found(mock_client, mock_config, logger):
         actions.scale_hpa(mock_config, mock_original_hpa, logger)
 
 
+@pytest.mark.parametrize(
+    "api_version, kind, current_repl, expected_method",
+    [
+        ("apps/v1", "Deployment", 4, "patch_namespaced_deployment_scale"),
+        ("apps/v1", "StatefulSet", 4, "patch_namespaced_stateful_set_scale"),
+        ("apps/v1", "ReplicaSet", 4, "patch_namespaced_replica_set_scale"),
+        # Limited to maxReplicas, which are running already
+        ("apps/v1", "Deployment", 10, None),
+        # Not supported
+        ("apps.example.com/v1", "Rollout", 4, None),
+    ],
+)
+def test_scale_hpa_patches_scale_target(
+    frozen, mock_client, mock_config, logger, api_version, kind, current_repl, expected_method
+):
+    mock_config.common.patch_scale_target = True
+    mock_config.common.hpa_annotation_scale_perc_of_actual = "kl-scale-to"
+    mock_hpa = get_mock_hpa(min_repl=2, current_repl=current_repl, annotations={"kl-scale-to": "200"})
+    mock_hpa.spec.scale_target_ref.api_version = api_version
+    mock_hpa.spec.scale_target_ref.kind = kind
+    mock_hpa.spec.scale_target_ref.name = "test-target"
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
+    mock_client.AppsV1Api.reset_mock()
+
+    returned_status, _ = actions.scale_hpa(mock_config, mock_hpa, logger)
+
+    assert returned_status.status.appliedMinReplicas == min(current_repl * 2, 10)
+    apps_api = mock_client.AppsV1Api()
+    for method in actions.SCALE_TARGET_PATCH_METHODS.values():
+        if method == expected_method:
+            getattr(apps_api, method).assert_called_once_with(
+                "test-target", "test-ns", {"spec": {"replicas": 8}}, _preload_content=False
+            )
+        else:
+            getattr(apps_api, method).assert_not_called()
+
+
+def test_scale_hpa_ignores_scale_target_error(frozen, mock_client, mock_config):
+    mock_client.exceptions = client.exceptions
+    mock_config.common.patch_scale_target = True
+    mock_config.common.hpa_annotation_scale_perc_of_actual = "kl-scale-to"
+    mock_hpa = get_mock_hpa(annotations={"kl-scale-to": "200"})
+    mock_hpa.spec.scale_target_ref.api_version = "apps/v1"
+    mock_hpa.spec.scale_target_ref.kind = "Deployment"
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
+    mock_client.AppsV1Api().patch_namespaced_deployment_scale.side_effect = client.exceptions.ApiException(status=403)
+    mock_logger = MagicMock()
+
+    _, returned_hpa = actions.scale_hpa(mock_config, mock_hpa, mock_logger)
+
+    # HPA scaled up nevertheless
+    assert returned_hpa.metadata.resource_version == "2"
+    assert "Error scaling target" in mock_logger.warning.call_args.args[0]
+
+
 @pytest.mark.parametrize("has_patch_annotation", [True, False])
 def test_revert_hpa_patches(mock_client, mock_config, logger, has_patch_annotation):
     mock_config.common.hpa_annotation_status = "kl/status"  # testing replacing of / by ~1
 
     hpa_annot = {"kl/status": "some-json"} if has_patch_annotation else None
-    mock_read_hpa = get_mock_hpa(annotations=hpa_annot)
-    mock_patched_hpa = get_mock_hpa()
-    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.return_value = mock_read_hpa
-    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_patched_hpa
+    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(annotations=hpa_annot)
+    )
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
 
     hpa_status = HpaStatus(
         name="test-name",
@@ -282,11 +470,11 @@ def test_revert_hpa_patches(mock_client, mock_config, logger, has_patch_annotati
 
     # should have loaded hpa using name and ns
     mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.assert_called_once_with(
-        "test-name", "test-ns"
+        "test-name", "test-ns", _preload_content=False
     )
     # should have patched hpa with proper patch
     assert len(mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.call_args_list) == 1
-    assert ret_value is mock_patched_hpa
+    assert ret_value.metadata.resource_version == "2"
     args = mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.call_args_list[0].args
     assert args[0] == "test-name"
     assert args[1] == "test-ns"
@@ -296,6 +484,49 @@ def test_revert_hpa_patches(mock_client, mock_config, logger, has_patch_annotati
         assert {"op": "remove", "path": "/metadata/annotations/kl~1status"} in args[2]
 
 
+def test_revert_hpa_without_read(mock_client, mock_config, logger):
+    mock_config.common.patch_without_read = True
+    mock_config.common.hpa_annotation_status = "kl/status"
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
+    hpa_status = HpaStatus(name="test-name", namespace="test-ns", status=StatusData(4, 5, 8, REFERENCE_TS))
+
+    ret_value = actions.revert_hpa(mock_config, hpa_status, logger)
+
+    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.assert_not_called()
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.assert_called_once_with(
+        "test-name",
+        "test-ns",
+        {"metadata": {"annotations": {"kl/status": None}}, "spec": {"minReplicas": 4}},
+        _preload_content=False,
+    )
+    assert ret_value.metadata.resource_version == "2"
+
+
+def test_reconcile_hpa_without_read(mock_client, mock_config, logger):
+    mock_config.common.patch_without_read = True
+    mock_config.common.hpa_annotation_status = "kl/status"
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
+    hpa_status = HpaStatus(name="test-name", namespace="test-ns", status=StatusData(4, 5, 8, REFERENCE_TS))
+
+    ret_value = actions.reconcile_hpa(mock_config, hpa_status, logger)
+
+    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.assert_not_called()
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.assert_called_once_with(
+        "test-name",
+        "test-ns",
+        {
+            "metadata": {"annotations": {"kl/status": json.dumps(hpa_status.dict().get("status"))}},
+            "spec": {"minReplicas": 8},
+        },
+        _preload_content=False,
+    )
+    assert ret_value.metadata.resource_version == "2"
+
+
 @pytest.mark.parametrize(
     "has_patch_annotation, hpa_min_replicas, should_patch",
     [
@@ -312,10 +543,12 @@ def test_reconcile_hpa_patches(
     mock_config.common.hpa_annotation_status = "kl/status"  # testing replacing of / by ~1
 
     hpa_annot = {"kl/status": "some-json"} if has_patch_annotation else None
-    mock_read_hpa = get_mock_hpa(annotations=hpa_annot, min_repl=hpa_min_replicas)
-    mock_patched_hpa = get_mock_hpa()
-    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.return_value = mock_read_hpa
-    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_patched_hpa
+    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(annotations=hpa_annot, min_repl=hpa_min_replicas, resource_version="1")
+    )
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
 
     hpa_status = HpaStatus(
         name="test-name",
@@ -334,10 +567,10 @@ def test_reconcile_hpa_patches(
 
     if not should_patch:
         mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.assert_not_called()
-        assert ret_value is mock_read_hpa
+        assert ret_value.metadata.resource_version == "1"
     else:
         assert len(mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.call_args_list) == 1
-        assert ret_value is mock_patched_hpa
+        assert ret_value.metadata.resource_version == "2"
         args = mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.call_args_list[0].args
         assert args[0] == "test-name"
         assert args[1] == "test-ns"
@@ -352,3 +585,498 @@ def test_reconcile_hpa_patches(
         if not (hpa_min_replicas == 4):
             assert patch_element_spec[0]["path"] == "/spec/minReplicas"
             assert patch_element_spec[0]["value"] == 4
+
+
+def test_find_hpas_uses_synced_cache(mock_client, mock_config):
+    mock_config.common.hpa_annotation_enabled_key = "proper_annotation_key"
+    mock_config.common.hpa_annotation_enabled_value = "1"
+    mock_hpa_enabled = get_mock_hpa(name="enabled", annotations={"proper_annotation_key": "1"})
+    mock_hpa_disabled = get_mock_hpa(name="disabled", annotations={"other": "1"})
+    hpa_cache = HpaCache()
+    hpa_cache.replace([mock_hpa_enabled, mock_hpa_disabled], "100")
+
+    found = list(actions.find_hpas(mock_config, hpa_cache))
+
+    assert found == [mock_hpa_enabled]
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.assert_not_called()
+
+
+def test_find_hpas_lists_if_cache_not_synced(mock_client, mock_config):
+    mock_config.common.hpa_annotation_enabled_key = "proper_annotation_key"
+    mock_config.common.hpa_annotation_enabled_value = "1"
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.return_value = (
+        mock_hpa_list_response([hpa_dict(annotations={"proper_annotation_key": "1"})])
+    )
+
+    found = list(actions.find_hpas(mock_config, HpaCache()))
+
+    assert [h.metadata.name for h in found] == ["test-hpa"]
+
+
+def test_iter_hpas_follows_pages(mock_client, mock_config):
+    mock_config.common.list_page_size = 2
+    mock_pages = [
+        mock_hpa_list_response([hpa_dict(name="a"), hpa_dict(name="b")], _continue="next-page"),
+        mock_hpa_list_response([hpa_dict(name="c")]),
+    ]
+    mock_list = mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces
+    mock_list.side_effect = mock_pages
+
+    hpas = actions.iter_hpas(mock_config)
+
+    assert next(hpas).metadata.name == "a"
+    assert next(hpas).metadata.name == "b"
+    # Second page is only fetched when needed
+    mock_list.assert_called_once_with(label_selector=None, limit=2, _continue=None, _preload_content=False)
+    assert next(hpas).metadata.name == "c"
+    mock_list.assert_called_with(label_selector=None, limit=2, _continue="next-page", _preload_content=False)
+    assert list(hpas) == []
+
+
+def test_iter_hpas_relists_on_expired_continue(mock_client, mock_config):
+    # Prevent exception caught in sut to be mock as well
+    mock_client.exceptions = client.exceptions
+    mock_config.common.list_page_size = 2
+    mock_pages = [
+        mock_hpa_list_response([hpa_dict(name="a"), hpa_dict(name="b")], _continue="next-page"),
+        mock_hpa_list_response([hpa_dict(name="b"), hpa_dict(name="c")]),
+    ]
+    mock_list = mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces
+    mock_list.side_effect = [mock_pages[0], client.exceptions.ApiException(status=410), mock_pages[1]]
+
+    hpas = list(actions.iter_hpas(mock_config))
+
+    # Already yielded HPAs are skipped after relisting
+    assert [h.metadata.name for h in hpas] == ["a", "b", "c"]
+    assert mock_list.call_args_list[2].kwargs["_continue"] is None
+
+
+def test_list_hpas_applies_predicate(mock_client, mock_config):
+    mock_config.common.list_page_size = 2
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.return_value = (
+        mock_hpa_list_response([hpa_dict(name="a"), hpa_dict(name="b")], resource_version="100")
+    )
+
+    hpas, resource_version = actions.list_hpas(mock_config, lambda h: h.metadata.name == "b")
+
+    assert [h.metadata.name for h in hpas] == ["b"]
+    assert resource_version == "100"
+
+
+def test_list_hpas(mock_client, mock_config):
+    mock_config.common.list_page_size = 0
+    mock_pages = [
+        mock_hpa_list_response([hpa_dict(name="a")], _continue="next-page", resource_version="100"),
+        mock_hpa_list_response([hpa_dict(name="b")], resource_version="100"),
+    ]
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.side_effect = mock_pages
+
+    hpas, resource_version = actions.list_hpas(mock_config)
+
+    assert [h.metadata.name for h in hpas] == ["a", "b"]
+    assert resource_version == "100"
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.assert_any_call(
+        label_selector=None, limit=None, _continue=None, _preload_content=False
+    )
+
+
+def test_watch_hpas(mock_client, mock_config, monkeypatch):
+    raw_hpa = hpa_dict(resource_version="101")
+    mock_watch = MagicMock()
+    mock_watch.Watch().stream.return_value = [
+        {"type": "MODIFIED", "object": raw_hpa, "raw_object": raw_hpa},
+        {"type": "BOOKMARK", "object": {}, "raw_object": {"metadata": {"resourceVersion": "102"}}},
+    ]
+    monkeypatch.setattr("klutch.actions.watch", mock_watch)
+
+    events = list(actions.watch_hpas(mock_config, "100", 5))
+
+    assert [(t, h and h.metadata.name, rv) for t, h, rv in events] == [
+        ("MODIFIED", "test-hpa", "101"),
+        ("BOOKMARK", None, "102"),
+    ]
+    call = mock_watch.Watch().stream.call_args
+    # Wrapped, so Watch does not deserialize events
+    assert call.args[0].func == mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces
+    assert call.kwargs["resource_version"] == "100"
+    assert call.kwargs["timeout_seconds"] == 5
+
+
+def test_reconcile_hpa_uses_provided_hpa(mock_client, mock_config, logger):
+    mock_config.common.hpa_annotation_status = "kl/status"
+    cached_hpa = get_mock_hpa(annotations={"kl/status": "some-json"}, min_repl=2)
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(
+        hpa_dict(resource_version="2")
+    )
+
+    hpa_status = HpaStatus(
+        name="test-name",
+        namespace="test-ns",
+        status=StatusData(
+            originalMinReplicas=2,
+            originalCurrentReplicas=2,
+            appliedMinReplicas=4,
+            appliedAt=REFERENCE_TS,
+        ),
+    )
+    ret_value = actions.reconcile_hpa(mock_config, hpa_status, logger, cached_hpa)
+
+    mock_client.AutoscalingV1Api().read_namespaced_horizontal_pod_autoscaler.assert_not_called()
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.assert_called_once_with(
+        "test-name", "test-ns", [{"op": "replace", "path": "/spec/minReplicas", "value": 4}], _preload_content=False
+    )
+    assert ret_value.metadata.resource_version == "2"
+
+
+@pytest.mark.parametrize(
+    "hpa_opt_in, annotations, labels, expected",
+    [
+        ("annotation", {"kl/enabled": "1"}, None, True),
+        ("annotation", None, {"kl/enabled": "1"}, False),
+        ("annotation", {"kl/enabled": "0"}, None, False),
+        ("label", None, {"kl/enabled": "1"}, True),
+        ("label", {"kl/enabled": "1"}, None, False),
+        ("label", None, {"kl/enabled": "0"}, False),
+        ("any", {"kl/enabled": "1"}, None, True),
+        ("any", None, {"kl/enabled": "1"}, True),
+        ("any", None, None, False),
+    ],
+)
+def test_is_enabled_hpa(mock_config, hpa_opt_in, annotations, labels, expected):
+    mock_config.common.hpa_opt_in = hpa_opt_in
+    mock_config.common.hpa_annotation_enabled_key = "kl/enabled"
+    mock_config.common.hpa_annotation_enabled_value = "1"
+    mock_config.common.hpa_label_enabled_key = "kl/enabled"
+    mock_config.common.hpa_label_enabled_value = "1"
+    mock_hpa = get_mock_hpa()
+    mock_hpa.metadata.annotations = annotations
+    mock_hpa.metadata.labels = labels
+
+    assert actions.is_enabled_hpa(mock_config, mock_hpa) is expected
+
+
+@pytest.mark.parametrize(
+    "hpa_opt_in, expected_label_selector",
+    [
+        ("annotation", None),
+        ("label", "klutch.it/enabled=1"),
+        ("any", None),
+    ],
+)
+def test_hpa_label_selector_passed_to_list_and_watch(
+    mock_client, mock_config, monkeypatch, hpa_opt_in, expected_label_selector
+):
+    mock_config.common.hpa_opt_in = hpa_opt_in
+    mock_config.common.hpa_label_enabled_key = "klutch.it/enabled"
+    mock_config.common.hpa_label_enabled_value = "1"
+    mock_config.common.list_page_size = 500
+    mock_list = mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces
+    mock_list.return_value = mock_hpa_list_response([])
+    mock_watch = MagicMock()
+    mock_watch.Watch().stream.return_value = []
+    monkeypatch.setattr("klutch.actions.watch", mock_watch)
+
+    actions.list_hpas(mock_config)
+    list(actions.watch_hpas(mock_config, "100", 5))
+
+    mock_list.assert_called_once_with(
+        label_selector=expected_label_selector, limit=500, _continue=None, _preload_content=False
+    )
+    assert mock_watch.Watch().stream.call_args.kwargs["label_selector"] == expected_label_selector
+
+
+def test_find_namespaces_all(mock_client, mock_config):
+    assert actions.find_namespaces(mock_config) is None
+    mock_client.CoreV1Api().list_namespace.assert_not_called()
+
+
+def test_find_namespaces(mock_client, mock_config):
+    mock_config.common.namespaces = ("ns-a", "ns-b", "ns-excluded")
+    mock_config.common.namespace_label_selector = "klutch=yes"
+    mock_config.common.exclude_namespaces = ("ns-excluded",)
+    mock_namespaces = [MagicMock(), MagicMock()]
+    mock_namespaces[0].metadata.name = "ns-b"
+    mock_namespaces[1].metadata.name = "ns-c"
+    mock_client.CoreV1Api().list_namespace.return_value.items = mock_namespaces
+
+    assert actions.find_namespaces(mock_config) == ["ns-a", "ns-b", "ns-c"]
+    mock_client.CoreV1Api().list_namespace.assert_called_once_with(label_selector="klutch=yes")
+
+
+def test_iter_hpas_per_namespace(mock_client, mock_config):
+    mock_config.common.list_page_size = 500
+    mock_config.common.discovery_concurrency = 2
+    mock_config.common.hpa_opt_in = "annotation"
+
+    def mock_list_namespaced(namespace, **kwargs):
+        if namespace == "ns-forbidden":
+            raise client.exceptions.ApiException(status=403)
+        return mock_hpa_list_response([hpa_dict(name="hpa", namespace=namespace)])
+
+    mock_client.AutoscalingV1Api().list_namespaced_horizontal_pod_autoscaler.side_effect = mock_list_namespaced
+
+    hpas = list(actions.iter_hpas(mock_config, ["ns-a", "ns-forbidden", "ns-b"]))
+
+    # Failing namespace does not affect others
+    assert sorted(h.metadata.namespace for h in hpas) == ["ns-a", "ns-b"]
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.assert_not_called()
+    mock_client.AutoscalingV1Api().list_namespaced_horizontal_pod_autoscaler.assert_any_call(
+        "ns-a", label_selector=None, limit=500, _continue=None, _preload_content=False
+    )
+
+
+def test_find_hpas_limits_cache_to_namespaces(mock_client, mock_config):
+    mock_config.common.namespaces = ("ns-a",)
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_config.common.hpa_annotation_enabled_key = "proper_annotation_key"
+    mock_config.common.hpa_annotation_enabled_value = "1"
+    mock_hpa_a = get_mock_hpa(namespace="ns-a", annotations={"proper_annotation_key": "1"})
+    mock_hpa_b = get_mock_hpa(namespace="ns-b", annotations={"proper_annotation_key": "1"})
+    hpa_cache = HpaCache()
+    hpa_cache.replace([mock_hpa_a, mock_hpa_b], "100")
+
+    assert list(actions.find_hpas(mock_config, hpa_cache)) == [mock_hpa_a]
+
+
+def test_is_enabled_hpa_excluded_namespace(mock_config):
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_config.common.hpa_annotation_enabled_key = "kl/enabled"
+    mock_config.common.hpa_annotation_enabled_value = "1"
+    mock_config.common.exclude_namespaces = ("kube-system",)
+
+    assert not actions.is_enabled_hpa(
+        mock_config, get_mock_hpa(namespace="kube-system", annotations={"kl/enabled": "1"})
+    )
+
+
+def test_priority_waves(mock_config):
+    hpas = {
+        name: get_mock_hpa(
+            name=name, annotations={"klutch.it/priority": priority} if priority is not None else {"other": "x"}
+        )
+        for name, priority in [("a", "10"), ("b", None), ("c", "-5"), ("d", "10"), ("e", "high")]
+    }
+    mock_logger = MagicMock()
+
+    waves = actions.priority_waves(mock_config, hpas.values(), mock_logger)
+
+    assert [(p, [h.metadata.name for h in w]) for p, w in waves] == [(10, ["a", "d"]), (0, ["b", "e"]), (-5, ["c"])]
+    assert "invalid priority 'high'" in mock_logger.warning.call_args.args[0]
+
+
+def test_watch_hpas_namespaced(mock_client, mock_config, monkeypatch):
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_watch = MagicMock()
+    mock_watch.Watch().stream.return_value = []
+    monkeypatch.setattr("klutch.actions.watch", mock_watch)
+
+    list(actions.watch_hpas(mock_config, "100", 5, "ns-a"))
+
+    func = mock_watch.Watch().stream.call_args.args[0]
+    assert func.func == mock_client.AutoscalingV1Api().list_namespaced_horizontal_pod_autoscaler
+    assert func.args == ("ns-a",)
+
+
+def test_set_api_client_shared_by_actions(mock_client, mock_config):
+    mock_api_client = MagicMock()
+    mock_config.common.list_page_size = 500
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.return_value = (
+        mock_hpa_list_response([])
+    )
+    actions.set_api_client(mock_api_client)
+    try:
+        actions.list_hpas(mock_config)
+        actions.delete_cm_trigger(MagicMock())
+    finally:
+        actions.set_api_client(None)
+
+    mock_client.AutoscalingV1Api.assert_called_with(mock_api_client)
+    mock_client.CoreV1Api.assert_called_with(mock_api_client)
+
+
+def test_list_hpas_protobuf(mock_client, mock_config):
+    mock_config.common.api_content_type = "protobuf"
+    mock_config.common.list_page_size = 1
+    mock_config.common.hpa_opt_in = "label"
+    mock_config.common.hpa_label_enabled_key = "kl/enabled"
+    mock_config.common.hpa_label_enabled_value = "1"
+    mock_call_api = mock_client.ApiClient().call_api
+    mock_call_api.side_effect = [
+        MagicMock(data=encode_list([encode_hpa("a")], resource_version="100", _continue="next-page")),
+        MagicMock(data=encode_list([encode_hpa("b")], resource_version="100")),
+    ]
+
+    hpas, resource_version = actions.list_hpas(mock_config, namespace="ns-a")
+
+    assert [h.metadata.name for h in hpas] == ["a", "b"]
+    assert resource_version == "100"
+    call = mock_call_api.call_args_list[1]
+    assert call.args == ("/apis/autoscaling/v1/namespaces/{namespace}/horizontalpodautoscalers", "GET")
+    assert call.kwargs["path_params"] == {"namespace": "ns-a"}
+    assert call.kwargs["query_params"] == [("labelSelector", "kl/enabled=1"), ("limit", 1), ("continue", "next-page")]
+    assert call.kwargs["header_params"] == {"Accept": "application/vnd.kubernetes.protobuf"}
+    assert call.kwargs["_preload_content"] is False
+
+
+def test_find_cm_status_protobuf(mock_client, mock_config):
+    mock_config.common.api_content_type = "protobuf"
+    mock_client.ApiClient().call_api.return_value.data = encode_list(
+        [encode_config_map("klutch-status", data={"status": "[]"})]
+    )
+
+    status_cms = actions.find_cm_status(mock_config)
+
+    assert status_cms[0].data == {"status": "[]"}
+    assert mock_client.ApiClient().call_api.call_args.kwargs["path_params"] == {"namespace": "test-ns"}
+
+
+def test_watch_hpas_protobuf(mock_client, mock_config):
+    mock_config.common.api_content_type = "protobuf"
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_client.exceptions = client.exceptions
+    stream = (
+        encode_watch_frame("MODIFIED", encode_hpa("a", resource_version="101"))
+        + encode_watch_frame("BOOKMARK", field(1, field(6, "102")))
+        + encode_watch_frame("ERROR", field(6, 410))
+    )
+    mock_resp = mock_client.ApiClient().call_api.return_value
+    mock_resp.read.side_effect = reader(stream)
+
+    events = []
+    with pytest.raises(client.exceptions.ApiException) as e:
+        for event in actions.watch_hpas(mock_config, "100", 5):
+            events.append(event)
+
+    assert e.value.status == 410
+    assert [(t, h and h.metadata.name, rv) for t, h, rv in events] == [
+        ("MODIFIED", "a", "101"),
+        ("BOOKMARK", None, "102"),
+    ]
+    query_params = dict(mock_client.ApiClient().call_api.call_args.kwargs["query_params"])
+    assert query_params == {
+        "resourceVersion": "100",
+        "timeoutSeconds": 5,
+        "watch": "true",
+        "allowWatchBookmarks": "true",
+    }
+    mock_resp.release_conn.assert_called_once()
+
+
+def test_revert_hpa_protobuf(mock_client, mock_config, logger):
+    mock_config.common.api_content_type = "protobuf"
+    mock_config.common.hpa_annotation_status = "kl/status"
+    mock_client.ApiClient().call_api.return_value.data = envelope(encode_hpa(annotations={"kl/status": "some-json"}))
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.return_value = mock_response(hpa_dict())
+    hpa_status = HpaStatus(
+        name="test-hpa",
+        namespace="test-ns",
+        status=StatusData(
+            originalMinReplicas=2, originalCurrentReplicas=4, appliedMinReplicas=5, appliedAt=REFERENCE_TS
+        ),
+    )
+
+    actions.revert_hpa(mock_config, hpa_status, logger)
+
+    call = mock_client.ApiClient().call_api.call_args
+    assert call.args[0] == "/apis/autoscaling/v1/namespaces/{namespace}/horizontalpodautoscalers/{name}"
+    assert call.kwargs["path_params"] == {"namespace": "test-ns", "name": "test-hpa"}
+    patch = mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.call_args.args[2]
+    assert {"op": "remove", "path": "/metadata/annotations/kl~1status"} in patch
+
+
+def test_find_hpas_metadata_only(mock_client, mock_config):
+    mock_config.common.list_page_size = 500
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_config.common.hpa_annotation_enabled_key = "kl/enabled"
+    mock_config.common.hpa_annotation_enabled_value = "1"
+    mock_client.ApiClient().call_api.return_value.data = json.dumps(
+        {
+            "kind": "PartialObjectMetadataList",
+            "metadata": {"resourceVersion": "100"},
+            "items": [
+                {
+                    "metadata": {
+                        "name": "a",
+                        "namespace": "test-ns",
+                        "creationTimestamp": "2017-07-14T02:40:00Z",
+                        "annotations": {"kl/enabled": "1", "kl/status": "some-json"},
+                    }
+                },
+                {"metadata": {"name": "b", "namespace": "test-ns"}},
+            ],
+        }
+    ).encode()
+
+    hpas = list(actions.find_hpas(mock_config, metadata_only=True))
+
+    assert [h.metadata.name for h in hpas] == ["a"]
+    assert hpas[0].metadata.annotations["kl/status"] == "some-json"
+    assert hpas[0].metadata.creation_timestamp.timestamp() == REFERENCE_TS
+    call = mock_client.ApiClient().call_api.call_args
+    assert call.args[0] == "/apis/autoscaling/v1/horizontalpodautoscalers"
+    assert call.kwargs["header_params"] == {
+        "Accept": "application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+    }
+    mock_client.AutoscalingV1Api().list_horizontal_pod_autoscaler_for_all_namespaces.assert_not_called()
+
+
+def test_list_hpas_metadata_only_protobuf(mock_client, mock_config):
+    mock_config.common.api_content_type = "protobuf"
+    mock_config.common.list_page_size = 500
+    mock_config.common.hpa_opt_in = "annotation"
+    mock_client.ApiClient().call_api.return_value.data = encode_list(
+        [field(1, encode_object_meta("a", "ns-a", annotations={"kl/status": "some-json"}))]
+    )
+
+    hpas, _ = actions.list_hpas(mock_config, namespace="ns-a", metadata_only=True)
+
+    assert hpas[0].metadata.annotations == {"kl/status": "some-json"}
+    assert mock_client.ApiClient().call_api.call_args.kwargs["header_params"] == {
+        "Accept": "application/vnd.kubernetes.protobuf;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1"
+    }
+
+
+def test_patch_retries_when_overloaded(mock_client, mock_config, logger, monkeypatch):
+    mock_client.exceptions = client.exceptions
+    limiter = MagicMock(spec=RateLimiter)
+    monkeypatch.setattr("klutch.actions._rate_limiter", limiter)
+    overloaded = client.exceptions.ApiException(status=429)
+    overloaded.headers = {"Retry-After": "2"}
+    mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler.side_effect = [
+        overloaded,
+        client.exceptions.ApiException(status=503),
+        mock_response(hpa_dict(resource_version="2")),
+    ]
+    hpa_status = HpaStatus(name="test-name", namespace="test-ns", status=StatusData(4, 5, 8, REFERENCE_TS))
+
+    assert actions.reconcile_hpa(mock_config, hpa_status, logger, get_mock_hpa()).metadata.resource_version == "2"
+
+    assert limiter.acquire.call_count == 3
+    assert [c.args for c in limiter.backoff.call_args_list] == [(2.0,), (None,)]
+    limiter.success.assert_called_once()
+
+
+def test_patch_gives_up_when_overloaded(mock_client, mock_config, logger, monkeypatch):
+    mock_client.exceptions = client.exceptions
+    monkeypatch.setattr("klutch.actions._rate_limiter", MagicMock(spec=RateLimiter))
+    patch = mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler
+    patch.side_effect = client.exceptions.ApiException(status=429)
+    hpa_status = HpaStatus(name="test-name", namespace="test-ns", status=StatusData(4, 5, 8, REFERENCE_TS))
+
+    with pytest.raises(client.exceptions.ApiException):
+        actions.reconcile_hpa(mock_config, hpa_status, logger, get_mock_hpa())
+    assert patch.call_count == actions.REQUEST_MAX_ATTEMPTS
+
+
+def test_patch_does_not_retry_other_errors(mock_client, mock_config, logger, monkeypatch):
+    mock_client.exceptions = client.exceptions
+    monkeypatch.setattr("klutch.actions._rate_limiter", MagicMock(spec=RateLimiter))
+    patch = mock_client.AutoscalingV1Api().patch_namespaced_horizontal_pod_autoscaler
+    patch.side_effect = client.exceptions.ApiException(status=404)
+    hpa_status = HpaStatus(name="test-name", namespace="test-ns", status=StatusData(4, 5, 8, REFERENCE_TS))
+
+    with pytest.raises(client.exceptions.ApiException):
+        actions.reconcile_hpa(mock_config, hpa_status, logger, get_mock_hpa())
+    assert patch.call_count == 1
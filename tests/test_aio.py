@@ -0,0 +1,102 @@
+import asyncio
+import threading
+from queue import SimpleQueue
+
+from klutch.aio import AsyncHandler
+from klutch.scheduler import TRIGGER
+from klutch.threads import BaseThread
+
+
+class CountingComponent(BaseThread):
+    def __init__(self, *args, runs=3, fail=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = runs
+        self.fail = fail
+        self.calls = []
+
+    def set_up(self):
+        self.calls.append("set_up")
+
+    def run_once(self):
+        self.calls.append(threading.current_thread().name)
+        if self.fail:
+            raise RuntimeError("failing component")
+        if len(self.calls) > self.runs:
+            self.stop()
+        return 0.01
+
+    def tear_down(self):
+        self.calls.append("tear_down")
+
+
+def test_runs_components_in_executor(mock_config):
+    mock_config.common.api_connection_pool_size = 2
+    handler = AsyncHandler(mock_config)
+    components = [CountingComponent(SimpleQueue(), threading.Event(), mock_config) for _ in range(3)]
+    for c in components:
+        handler.add(c)
+
+    assert asyncio.run(handler.run()) == 0
+
+    for c in components:
+        assert c.calls[0] == "set_up"
+        assert c.calls[-1] == "tear_down"
+        assert len(c.calls) == 5
+        assert all(name.startswith("klutch-io") for name in c.calls[1:-1])
+        # Never started as thread
+        assert not c.is_alive()
+
+
+def test_failing_component_stops_others(mock_config):
+    mock_config.common.api_connection_pool_size = 2
+    handler = AsyncHandler(mock_config)
+    failing = CountingComponent(SimpleQueue(), threading.Event(), mock_config, fail=True)
+    other = CountingComponent(SimpleQueue(), threading.Event(), mock_config, runs=1000)
+    handler.add(failing)
+    handler.add(other)
+
+    assert asyncio.run(handler.run()) == 1
+
+    assert failing.calls[-1] == "tear_down"
+    assert other.should_stop
+    assert other.calls[-1] == "tear_down"
+
+
+class WaitingComponent(BaseThread):
+    wake_events = (TRIGGER,)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.runs = 0
+
+    def run_once(self):
+        self.runs += 1
+        if self.runs > 1:
+            self.stop()
+        return 60
+
+
+class TriggeringComponent(BaseThread):
+    def run_once(self):
+        self._trigger()
+        return None
+
+
+def test_trigger_wakes_waiting_component(mock_config):
+    mock_config.common.api_connection_pool_size = 2
+    handler = AsyncHandler(mock_config)
+    waiting = WaitingComponent(SimpleQueue(), threading.Event(), mock_config)
+    triggering = TriggeringComponent(SimpleQueue(), threading.Event(), mock_config)
+    handler.add(waiting)
+    handler.add(triggering)
+
+    async def run():
+        # Stops once waiting component stopped, as triggering component waits for stop
+        task = asyncio.create_task(handler.run())
+        while not waiting.should_stop:
+            await asyncio.sleep(0.01)
+        handler.stop()
+        return await asyncio.wait_for(task, 1)
+
+    assert asyncio.run(run()) == 0
+    assert waiting.runs == 2
@@ -0,0 +1,94 @@
+from unittest.mock import MagicMock
+
+from kubernetes import client
+
+from klutch.cache import HpaCache
+from klutch.cache import HpaCacheSet
+
+
+def get_mock_hpa(name="test-hpa", namespace="test-ns"):
+    mock_hpa = MagicMock(spec=client.models.v1_horizontal_pod_autoscaler.V1HorizontalPodAutoscaler)
+    mock_hpa.metadata.name = name
+    mock_hpa.metadata.namespace = namespace
+    return mock_hpa
+
+
+def test_replace():
+    hpa_a = get_mock_hpa(name="a")
+    hpa_b = get_mock_hpa(name="b")
+    cache = HpaCache()
+    assert not cache.is_synced()
+
+    cache.replace([hpa_a, hpa_b], "100")
+
+    assert cache.is_synced()
+    assert cache.resource_version == "100"
+    assert cache.list() == [hpa_a, hpa_b]
+    assert cache.get("test-ns", "b") is hpa_b
+    assert cache.get("other-ns", "b") is None
+
+
+def test_apply():
+    hpa_a = get_mock_hpa(name="a")
+    hpa_a_modified = get_mock_hpa(name="a")
+    hpa_b = get_mock_hpa(name="b")
+    cache = HpaCache()
+    cache.replace([hpa_a], "100")
+
+    cache.apply("ADDED", hpa_b, "101")
+    cache.apply("MODIFIED", hpa_a_modified, "102")
+    assert cache.get("test-ns", "a") is hpa_a_modified
+    assert len(cache) == 2
+
+    cache.apply("DELETED", hpa_b, "103")
+    assert cache.list() == [hpa_a_modified]
+
+    cache.apply("BOOKMARK", None, "104")
+    assert cache.resource_version == "104"
+
+
+def test_invalidate():
+    cache = HpaCache()
+    cache.replace([get_mock_hpa()], "100")
+
+    cache.invalidate()
+
+    assert not cache.is_synced()
+    assert cache.resource_version is None
+
+
+def test_stores_only_hpas_matching_predicate():
+    hpa_a = get_mock_hpa(name="a")
+    hpa_b = get_mock_hpa(name="b")
+    hpa_b_disabled = get_mock_hpa(name="b")
+    enabled = {hpa_a, hpa_b}
+    cache = HpaCache(lambda h: h in enabled)
+    cache.replace([hpa_a, get_mock_hpa(name="c")], "100")
+    assert cache.list() == [hpa_a]
+
+    cache.apply("ADDED", hpa_b, "101")
+    cache.apply("ADDED", get_mock_hpa(name="d"), "102")
+    assert len(cache) == 2
+
+    # No longer matching: dropped
+    cache.apply("MODIFIED", hpa_b_disabled, "103")
+    assert cache.list() == [hpa_a]
+    assert cache.resource_version == "103"
+
+
+def test_cache_set():
+    hpa_a = get_mock_hpa(name="a", namespace="ns-a")
+    hpa_b = get_mock_hpa(name="b", namespace="ns-b")
+    cache_a = HpaCache(namespace="ns-a")
+    cache_b = HpaCache(namespace="ns-b")
+    cache_set = HpaCacheSet([cache_a, cache_b])
+
+    cache_a.replace([hpa_a], "100")
+    assert not cache_set.is_synced()
+    cache_b.replace([hpa_b], "200")
+    assert cache_set.is_synced()
+
+    assert cache_set.list() == [hpa_a, hpa_b]
+    assert cache_set.get("ns-b", "b") is hpa_b
+    assert cache_set.get("ns-c", "b") is None
+    assert len(cache_set) == 2
@@ -0,0 +1,15 @@
+from klutch.clock import VirtualClock
+
+
+def test_virtual_clock():
+    virtual_clock = VirtualClock(100)
+    assert virtual_clock.time() == virtual_clock.monotonic() == 100
+
+    # Sleeping advances the clock instead of blocking
+    virtual_clock.sleep(60)
+    assert virtual_clock.time() == 160
+
+    virtual_clock.advance_to(150)
+    assert virtual_clock.time() == 160
+    virtual_clock.advance_to(170)
+    assert virtual_clock.time() == 170
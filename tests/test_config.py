@@ -0,0 +1,56 @@
+import io
+import socket
+
+import pytest
+from nx_config import fill_config  # type: ignore
+from nx_config.format import Format  # type: ignore
+
+from klutch.config import configure_kubernetes
+from klutch.config import create_api_client
+from klutch.config import KlutchConfig
+
+
+def fill_from_yaml(yaml: str) -> KlutchConfig:
+    config = KlutchConfig()
+    fill_config(config, stream=io.StringIO(yaml), fmt=Format.yaml, env_prefix="KLUTCH_TEST")
+    return config
+
+
+@pytest.mark.parametrize("hpa_opt_in", ["annotation", "label", "any"])
+def test_hpa_opt_in_valid(hpa_opt_in):
+    config = fill_from_yaml(f"common:\n  klutch_namespace: test-ns\n  hpa_opt_in: {hpa_opt_in}\n")
+    assert config.common.hpa_opt_in == hpa_opt_in
+
+
+def test_hpa_opt_in_invalid():
+    with pytest.raises(ValueError, match="hpa_opt_in"):
+        fill_from_yaml("common:\n  klutch_namespace: test-ns\n  hpa_opt_in: foobar\n")
+
+
+@pytest.mark.parametrize("option, value", [("runtime", "greenlets"), ("api_content_type", "yaml")])
+def test_choice_invalid(option, value):
+    with pytest.raises(ValueError, match=option):
+        fill_from_yaml(f"common:\n  klutch_namespace: test-ns\n  {option}: {value}\n")
+
+
+@pytest.mark.parametrize("option, value", [("api_qps", "-1.0"), ("api_burst", "0")])
+def test_rate_limit_invalid(option, value):
+    with pytest.raises(ValueError, match=option):
+        fill_from_yaml(f"common:\n  klutch_namespace: test-ns\n  {option}: {value}\n")
+
+
+@pytest.mark.parametrize("tcp_keepalive", [True, False])
+def test_create_api_client(kubeconfig, monkeypatch, tcp_keepalive):
+    monkeypatch.setenv("KUBECONFIG", str(kubeconfig))
+    config = fill_from_yaml(
+        f"common:\n  klutch_namespace: test-ns\n  api_connection_pool_size: 7\n  api_tcp_keepalive: {tcp_keepalive}\n"
+    )
+    configure_kubernetes()
+
+    api_client = create_api_client(config)
+
+    assert api_client.configuration.host == "https://kubernetest.test.local:1234"
+    pool = api_client.rest_client.pool_manager.connection_from_url(api_client.configuration.host)
+    assert pool.pool.maxsize == 7
+    socket_options = pool.conn_kw.get("socket_options", [])
+    assert ((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1) in socket_options) is tcp_keepalive
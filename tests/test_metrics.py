@@ -0,0 +1,77 @@
+import threading
+import urllib.error
+import urllib.request
+from queue import SimpleQueue
+
+import pytest
+
+from klutch import metrics
+from klutch.threads import MetricsServer
+
+
+def test_expose_histogram():
+    histogram = metrics.Histogram("test_duration_seconds", "Test duration.", ("action",), buckets=(0.1, 1))
+    try:
+        histogram.observe(0.05, action="a")
+        histogram.observe(0.5, action="a")
+        histogram.observe(5, action="a")
+
+        assert histogram.expose() == [
+            "# HELP test_duration_seconds Test duration.",
+            "# TYPE test_duration_seconds histogram",
+            'test_duration_seconds_bucket{action="a",le="0.1"} 1',
+            'test_duration_seconds_bucket{action="a",le="1"} 2',
+            'test_duration_seconds_bucket{action="a",le="+Inf"} 3',
+            'test_duration_seconds_sum{action="a"} 5.55',
+            'test_duration_seconds_count{action="a"} 3',
+        ]
+        assert histogram.count(action="a") == 3
+        assert histogram.sum(action="a") == 5.55
+    finally:
+        metrics.REGISTRY.remove(histogram)
+
+
+def test_expose_counter_and_gauge():
+    counter = metrics.Counter("test_total", "Test counter.")
+    gauge = metrics.Gauge("test_gauge", "Test gauge.")
+    try:
+        assert counter.expose()[2:] == ["test_total 0"]
+        counter.inc()
+        counter.inc(2)
+        assert counter.expose()[2:] == ["test_total 3"]
+
+        gauge.set_function(lambda: None)
+        assert gauge.expose()[2:] == []
+        gauge.set_function(lambda: 1.5)
+        assert gauge.expose()[2:] == ["test_gauge 1.5"]
+    finally:
+        metrics.REGISTRY.remove(counter)
+        metrics.REGISTRY.remove(gauge)
+
+
+def test_timed():
+    @metrics.timed
+    def failing_test_action():
+        raise RuntimeError("failing")
+
+    with pytest.raises(RuntimeError):
+        failing_test_action()
+
+    assert metrics.ACTION_DURATION.count(action="failing_test_action") == 1
+    assert metrics.ACTION_ERRORS.value(action="failing_test_action") == 1
+
+
+def test_metrics_server(mock_config):
+    mock_config.metrics.address = "127.0.0.1"
+    mock_config.metrics.port = 0
+    thread = MetricsServer(SimpleQueue(), threading.Event(), mock_config)
+    thread.set_up()
+    try:
+        url = "http://127.0.0.1:{}".format(thread.httpd.server_address[1])
+        with urllib.request.urlopen(url + "/metrics") as resp:
+            assert resp.headers["Content-type"] == metrics.CONTENT_TYPE
+            assert "# TYPE klutch_action_duration_seconds histogram" in resp.read().decode()
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(url + "/other")
+    finally:
+        thread.tear_down()
@@ -0,0 +1,70 @@
+import pytest
+
+from .conftest import REFERENCE_TS
+from klutch.models import HorizontalPodAutoscaler
+from klutch.models import hpa_from_dict
+from klutch.models import hpa_list_from_dict
+from klutch.status import HpaStatus
+from klutch.status import StatusData
+
+
+def test_hpa_from_dict():
+    hpa = hpa_from_dict(
+        {
+            "apiVersion": "autoscaling/v1",
+            "kind": "HorizontalPodAutoscaler",
+            "metadata": {
+                "name": "test-hpa",
+                "namespace": "test-ns",
+                "uid": "abc",
+                "resourceVersion": "5",
+                "creationTimestamp": "2017-07-14T02:40:00Z",
+                "annotations": {"klutch.it/enabled": "1"},
+                "managedFields": [{"manager": "kubectl"}],
+            },
+            "spec": {
+                "scaleTargetRef": {"kind": "Deployment", "name": "test", "apiVersion": "apps/v1"},
+                "minReplicas": 2,
+                "maxReplicas": 10,
+                "targetCPUUtilizationPercentage": 80,
+            },
+            "status": {"currentReplicas": 4, "desiredReplicas": 5},
+        }
+    )
+
+    assert hpa.metadata.name == "test-hpa"
+    assert hpa.metadata.uid == "abc"
+    assert hpa.metadata.resource_version == "5"
+    assert hpa.metadata.creation_timestamp.timestamp() == REFERENCE_TS
+    assert hpa.metadata.annotations == {"klutch.it/enabled": "1"}
+    assert hpa.metadata.labels == {}
+    assert hpa.spec.scale_target_ref.name == "test"
+    assert (hpa.spec.min_replicas, hpa.spec.max_replicas) == (2, 10)
+    assert (hpa.status.current_replicas, hpa.status.desired_replicas) == (4, 5)
+
+
+def test_hpa_list_from_dict():
+    hpa_list = hpa_list_from_dict(
+        {"metadata": {"resourceVersion": "100", "continue": "next"}, "items": [{"metadata": {"name": "a"}}]}
+    )
+
+    assert hpa_list.metadata.resource_version == "100"
+    assert hpa_list.metadata._continue == "next"
+    assert hpa_list.items[0].metadata.name == "a"
+    # Defaults for fields missing in response
+    assert hpa_list.items[0].spec.min_replicas == 1
+    assert hpa_list.items[0].status.current_replicas == 0
+
+
+@pytest.mark.parametrize(
+    "obj",
+    [
+        HorizontalPodAutoscaler(),
+        HpaStatus(name="a", namespace="b", status=StatusData(1, 2, 3, 4)),
+        StatusData(1, 2, 3, 4),
+    ],
+)
+def test_slotted(obj):
+    assert not hasattr(obj, "__dict__")
+    with pytest.raises(AttributeError):
+        obj.unknown = 1
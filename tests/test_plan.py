@@ -0,0 +1,33 @@
+from klutch.models import HorizontalPodAutoscaler
+from klutch.models import ObjectMeta
+from klutch.plan import ScalePlan
+from klutch.plan import ScaleTarget
+from klutch.status import HpaStatus
+from klutch.status import StatusData
+
+
+def get_hpa(name, resource_version):
+    return HorizontalPodAutoscaler(metadata=ObjectMeta(name=name, namespace="ns", resource_version=resource_version))
+
+
+def get_target(name, resource_version):
+    return ScaleTarget(
+        resource_version=resource_version,
+        hpa_status=HpaStatus(name=name, namespace="ns", status=StatusData(2, 4, 8, 0)),
+        patch={"spec": {"minReplicas": 8}},
+        intended_min_replicas=8,
+    )
+
+
+def test_get_matches_resource_version():
+    plan = ScalePlan()
+    assert plan.age() is None
+    target = get_target("a", "1")
+    plan.replace({("ns", "a"): target})
+
+    assert len(plan) == 1
+    assert plan.age() >= 0
+    assert plan.get(get_hpa("a", "1")) is target
+    # Changed since target was calculated
+    assert plan.get(get_hpa("a", "2")) is None
+    assert plan.get(get_hpa("b", "1")) is None
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+
+from klutch.pool import map_concurrently
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_map_concurrently(concurrency):
+    def func(i):
+        if i == 3:
+            raise ValueError("three")
+        return i * 2
+
+    results = {item: (result, exception) for item, result, exception in map_concurrently(func, range(6), concurrency)}
+
+    assert set(results) == set(range(6))
+    assert results[2] == (4, None)
+    assert results[3][0] is None
+    assert isinstance(results[3][1], ValueError)
+
+
+@pytest.mark.parametrize("concurrency", [1, 3])
+def test_map_concurrently_consumes_lazily(concurrency):
+    lock = threading.Lock()
+    in_flight = []
+    max_in_flight = []
+
+    def func(i):
+        with lock:
+            in_flight.append(i)
+            max_in_flight.append(len(in_flight))
+        threading.Event().wait(0.01)
+        with lock:
+            in_flight.remove(i)
+
+    consumed = []
+
+    def items():
+        for i in range(20):
+            consumed.append(i)
+            yield i
+
+    yielded = 0
+    for _ in map_concurrently(func, items(), concurrency):
+        yielded += 1
+        # Items not yet yielded are in flight: never more than concurrency
+        assert len(consumed) - yielded <= concurrency - 1
+
+    assert yielded == 20
+    assert max(max_in_flight) <= concurrency
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+def test_map_concurrently_yields_in_flight_results_when_items_fail(concurrency):
+    def items():
+        yield 1
+        yield 2
+        raise RuntimeError("listing failed")
+
+    results = []
+    with pytest.raises(RuntimeError):
+        for item, result, exception in map_concurrently(lambda i: i * 2, items(), concurrency):
+            results.append((item, result))
+
+    assert sorted(results) == [(1, 2), (2, 4)]
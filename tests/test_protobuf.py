@@ -0,0 +1,152 @@
+import struct
+from datetime import datetime
+from datetime import timezone
+
+import pytest
+
+from .conftest import REFERENCE_TS
+from klutch import protobuf
+
+
+def _varint(value):
+    if value < 0:
+        value += 1 << 64
+    out = b""
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out += bytes([byte | 0x80])
+        else:
+            return out + bytes([byte])
+
+
+def field(number, value):
+    """Encode protobuf field: int as varint, str/bytes as length-delimited."""
+    if isinstance(value, int):
+        return _varint(number << 3) + _varint(value)
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    return _varint(number << 3 | 2) + _varint(len(value)) + value
+
+
+def envelope(raw):
+    return protobuf.MAGIC + field(1, field(1, "v1") + field(2, "Kind")) + field(2, raw)
+
+
+def encode_object_meta(name, namespace, resource_version="1", annotations=None, labels=None):
+    data = field(1, name) + field(3, namespace) + field(5, f"uid-{name}") + field(6, resource_version)
+    data += field(8, field(1, REFERENCE_TS) + field(2, 0))
+    for key, value in (labels or {}).items():
+        data += field(11, field(1, key) + field(2, value))
+    for key, value in (annotations or {}).items():
+        data += field(12, field(1, key) + field(2, value))
+    return data
+
+
+def encode_hpa(name="test-hpa", namespace="test-ns", min_repl=2, max_repl=10, current_repl=4, **meta):
+    spec = field(1, field(1, "Deployment") + field(2, name) + field(3, "apps/v1"))
+    spec += field(2, min_repl) + field(3, max_repl) + field(4, 80)
+    status = field(1, 7) + field(3, current_repl) + field(4, current_repl)
+    return field(1, encode_object_meta(name, namespace, **meta)) + field(2, spec) + field(3, status)
+
+
+def encode_config_map(name="test-cm", namespace="test-ns", data=None, **meta):
+    encoded = field(1, encode_object_meta(name, namespace, **meta))
+    for key, value in (data or {}).items():
+        encoded += field(2, field(1, key) + field(2, value))
+    return encoded
+
+
+def encode_list(items, resource_version="100", _continue=""):
+    data = field(1, field(2, resource_version) + field(3, _continue))
+    for item in items:
+        data += field(2, item)
+    return envelope(data)
+
+
+def encode_watch_frame(event_type, raw):
+    event = field(1, event_type) + field(2, field(1, envelope(raw)))
+    return struct.pack(">I", len(event)) + event
+
+
+def reader(data):
+    """Return read function, returning at most 3 bytes per call like a slow stream."""
+    pos = 0
+
+    def read(amount):
+        nonlocal pos
+        chunk = data[pos : pos + min(amount, 3)]
+        pos += len(chunk)
+        return chunk
+
+    return read
+
+
+def test_decode_hpa_list():
+    hpa_list = protobuf.decode_hpa_list(
+        encode_list(
+            [
+                encode_hpa("a", annotations={"klutch.it/enabled": "1"}, labels={"app": "a"}),
+                encode_hpa("b", min_repl=3, resource_version="5"),
+            ],
+            resource_version="100",
+            _continue="next",
+        )
+    )
+    assert hpa_list.metadata.resource_version == "100"
+    assert hpa_list.metadata._continue == "next"
+    a, b = hpa_list.items
+    assert a.metadata.name == "a"
+    assert a.metadata.namespace == "test-ns"
+    assert a.metadata.uid == "uid-a"
+    assert a.metadata.creation_timestamp == datetime.fromtimestamp(REFERENCE_TS, tz=timezone.utc)
+    assert a.metadata.annotations == {"klutch.it/enabled": "1"}
+    assert a.metadata.labels == {"app": "a"}
+    assert a.spec.scale_target_ref.kind == "Deployment"
+    assert a.spec.scale_target_ref.api_version == "apps/v1"
+    assert a.spec.min_replicas == 2
+    assert a.spec.max_replicas == 10
+    assert a.status.current_replicas == 4
+    assert b.metadata.resource_version == "5"
+    assert b.spec.min_replicas == 3
+    assert b.metadata.annotations == {}
+
+
+def test_decode_hpa_list_last_page():
+    hpa_list = protobuf.decode_hpa_list(encode_list([]))
+    assert hpa_list.metadata._continue is None
+    assert hpa_list.items == []
+
+
+def test_decode_config_map_list():
+    cm_list = protobuf.decode_config_map_list(encode_list([encode_config_map("status", data={"status": "[]"})]))
+    assert cm_list.items[0].metadata.name == "status"
+    assert cm_list.items[0].data == {"status": "[]"}
+
+
+def test_decode_rejects_json():
+    with pytest.raises(ValueError):
+        protobuf.decode_hpa(b'{"kind": "HorizontalPodAutoscaler"}')
+
+
+def test_decode_watch_events():
+    stream = (
+        encode_watch_frame("ADDED", encode_hpa("a", resource_version="2"))
+        + encode_watch_frame("BOOKMARK", field(1, field(6, "3")))
+        + encode_watch_frame("ERROR", field(3, "Failure") + field(6, 410))
+    )
+    frames = list(protobuf.iter_frames(reader(stream)))
+    assert len(frames) == 3
+
+    event_type, hpa, code = protobuf.decode_watch_event(frames[0], protobuf.decode_hpa)
+    assert (event_type, hpa.metadata.name, hpa.metadata.resource_version, code) == ("ADDED", "a", "2", None)
+    event_type, hpa, _ = protobuf.decode_watch_event(frames[1], protobuf.decode_hpa)
+    assert (event_type, hpa.metadata.resource_version) == ("BOOKMARK", "3")
+    assert protobuf.decode_watch_event(frames[2], protobuf.decode_hpa) == ("ERROR", None, 410)
+
+
+def test_iter_frames_truncated():
+    stream = encode_watch_frame("ADDED", encode_hpa())
+    with pytest.raises(ValueError):
+        list(protobuf.iter_frames(reader(stream[:-1])))
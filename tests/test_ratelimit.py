@@ -0,0 +1,39 @@
+import time
+
+from klutch.ratelimit import RateLimiter
+
+
+def test_allows_burst_then_limits_rate():
+    limiter = RateLimiter(qps=20, burst=5)
+    started = time.monotonic()
+    for _ in range(5):
+        limiter.acquire()
+    assert time.monotonic() - started < 0.05
+
+    for _ in range(2):
+        limiter.acquire()
+    # Two more tokens at 20 per second
+    assert time.monotonic() - started >= 0.09
+
+
+def test_backoff_pauses_and_lowers_rate():
+    limiter = RateLimiter(qps=100, burst=10)
+    limiter.backoff(retry_after=0.1)
+    assert limiter.rate == 50
+
+    started = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - started >= 0.1
+
+
+def test_success_recovers_rate():
+    limiter = RateLimiter(qps=100, burst=10)
+    limiter.backoff(retry_after=0)
+    limiter.backoff(retry_after=0)
+    assert limiter.rate == 25
+
+    limiter.success()
+    assert limiter.rate == 30
+    for _ in range(20):
+        limiter.success()
+    assert limiter.rate == 100
@@ -0,0 +1,34 @@
+from klutch.retry import RetryQueue
+
+
+def test_backoff_until_deadline(virtual_clock):
+    queue = RetryQueue(initial_delay=1, max_delay=4)
+
+    assert queue.add("a", "item", timeout=10)
+    assert queue.due() == []
+    assert queue.next_delay() == 1
+
+    virtual_clock.advance(1)
+    assert queue.due() == [("a", "item")]
+    # Delay doubles on each failed attempt, up to max_delay
+    assert queue.add("a", "item", timeout=10)
+    assert queue.next_delay() == 2
+    virtual_clock.advance(2)
+    assert queue.add("a", "item", timeout=10)
+    assert queue.next_delay() == 4
+    virtual_clock.advance(4)
+    # Next attempt would be after deadline
+    assert not queue.add("a", "item", timeout=10)
+    assert len(queue) == 0
+    assert queue.next_delay() is None
+
+
+def test_done():
+    queue = RetryQueue()
+    queue.add("a", "item-a", timeout=10)
+    queue.add("b", "item-b", timeout=10)
+
+    queue.done("a")
+    queue.done("unknown")
+
+    assert queue.keys() == ["b"]
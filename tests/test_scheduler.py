@@ -0,0 +1,135 @@
+import threading
+import time
+
+from klutch.scheduler import jittered
+from klutch.scheduler import Scheduler
+
+
+def run_in_thread(scheduler, timeout=1):
+    result = {}
+    thread = threading.Thread(target=lambda: result.update(finished=scheduler.run(timeout)))
+    thread.start()
+    return thread, result
+
+
+def test_jittered():
+    assert jittered(10, 0) == 10
+    assert all(10 <= jittered(10, 0.1) <= 11 for _ in range(100))
+
+
+def test_runs_jobs_by_deadline():
+    scheduler = Scheduler()
+    calls = []
+
+    def job(name, delay):
+        def func():
+            calls.append(name)
+            if name == "slow":
+                scheduler.stop()
+            return delay
+
+        return func
+
+    scheduler.add("slow", job("slow", 10), delay=0.05)
+    scheduler.add("fast", job("fast", 0.01))
+
+    assert scheduler.run()
+    assert calls[0] == "fast"
+    assert calls.count("slow") == 1
+    assert calls.count("fast") > 1
+
+
+def test_job_returning_none_is_not_rescheduled():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.add("once", lambda: calls.append(1))
+    thread, result = run_in_thread(scheduler)
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join(1)
+
+    assert result["finished"]
+    assert calls == [1]
+
+
+def test_wake_runs_job_immediately():
+    scheduler = Scheduler()
+    calls = []
+    scheduler.add("waiting", lambda: calls.append(time.monotonic()) or 60, events=("trigger",))
+    thread, result = run_in_thread(scheduler)
+    time.sleep(0.05)
+    scheduler.wake("other")
+    time.sleep(0.05)
+    assert len(calls) == 1
+
+    scheduler.wake("trigger")
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join(1)
+
+    assert result["finished"]
+    assert len(calls) == 2
+
+
+def test_wake_while_running_runs_job_again():
+    scheduler = Scheduler()
+    calls = []
+    release = threading.Event()
+
+    def job():
+        calls.append(1)
+        if len(calls) == 1:
+            release.wait(1)
+        return 60
+
+    scheduler.add("job", job, events=("trigger",))
+    thread, result = run_in_thread(scheduler)
+    time.sleep(0.05)
+    scheduler.wake("trigger")
+    release.set()
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join(1)
+
+    assert len(calls) == 2
+
+
+def test_stop_interrupts_wait():
+    scheduler = Scheduler()
+    scheduler.add("idle", lambda: 60)
+    thread, result = run_in_thread(scheduler)
+    time.sleep(0.05)
+    started = time.monotonic()
+    scheduler.stop()
+    thread.join(1)
+
+    assert not thread.is_alive()
+    assert time.monotonic() - started < 0.5
+    assert result["finished"]
+
+
+def test_failing_job_stops_scheduler():
+    scheduler = Scheduler()
+    calls = []
+
+    def failing():
+        raise RuntimeError("failing job")
+
+    scheduler.add("other", lambda: calls.append(1) or 0.01)
+    scheduler.add("failing", failing, delay=0.05)
+
+    assert not scheduler.run()
+    assert calls
+
+
+def test_running_job_exceeding_timeout():
+    scheduler = Scheduler()
+    release = threading.Event()
+    scheduler.add("blocking", lambda: release.wait(1) and None)
+    thread, result = run_in_thread(scheduler, timeout=0.05)
+    time.sleep(0.05)
+    scheduler.stop()
+    thread.join(1)
+    release.set()
+
+    assert not result["finished"]
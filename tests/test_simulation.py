@@ -0,0 +1,130 @@
+import io
+import json
+
+import pytest
+from nx_config import fill_config
+from nx_config.format import Format
+
+from klutch import clock
+from klutch.clock import SystemClock
+from klutch.config import KlutchConfig
+from klutch.simulation import Simulation
+
+
+CONFIG = """
+common:
+  klutch_namespace: klutch
+  duration: 300
+  reconcile_interval: 10
+trigger_config_map:
+  watch: false
+  scan_interval: 10
+"""
+
+
+@pytest.fixture
+def config():
+    config = KlutchConfig()
+    fill_config(config, stream=io.StringIO(CONFIG), fmt=Format.yaml)
+    return config
+
+
+def min_replicas(simulation, name):
+    return simulation.cluster.hpa("ns", name)["spec"]["minReplicas"]
+
+
+def test_sequence_lifecycle(config):
+    with Simulation(config) as simulation:
+        simulation.cluster.add_hpa("ns", "a", min_replicas=2, current_replicas=4, scale_percentage=200)
+        simulation.cluster.add_hpa("ns", "b", min_replicas=1, current_replicas=2, scale_percentage=150)
+        simulation.add_components()
+        assert isinstance(clock.get_clock(), type(simulation.clock))
+        started_at = simulation.clock.time()
+
+        simulation.run(5)
+        assert min_replicas(simulation, "a") == 2
+
+        simulation.trigger()
+        simulation.run(1)
+        assert min_replicas(simulation, "a") == 8
+        assert min_replicas(simulation, "b") == 3
+        status = json.loads(simulation.cluster.hpa("ns", "a")["metadata"]["annotations"]["klutch.it/status"])
+        assert status["appliedAt"] == int(started_at + 5)
+
+        # Reconcile restores minReplicas changed by another client
+        simulation.at(1, lambda: simulation.cluster.patch_hpa("ns", "a", {"spec": {"minReplicas": 2}}))
+        simulation.run(10)
+        assert min_replicas(simulation, "a") == 8
+
+        # Reverted once duration expired
+        simulation.run(300)
+        assert min_replicas(simulation, "a") == 2
+        assert min_replicas(simulation, "b") == 1
+        assert "klutch.it/status" not in simulation.cluster.hpa("ns", "a")["metadata"]["annotations"]
+        assert not simulation.is_active_event.is_set()
+        assert simulation.clock.time() == started_at + 316
+        simulation.tear_down()
+    assert isinstance(clock.get_clock(), SystemClock)
+
+
+def test_trigger_config_map(config):
+    with Simulation(config) as simulation:
+        simulation.cluster.add_hpa("ns", "a")
+        simulation.add_components()
+        simulation.run(1)
+
+        simulation.at(2, simulation.cluster.add_trigger)
+        # Found by next scan of TriggerConfigMap
+        simulation.run(5)
+        assert min_replicas(simulation, "a") == 2
+        simulation.run(5)
+        assert min_replicas(simulation, "a") == 8
+        assert simulation.cluster.counts["DELETE configmaps"] == 1
+
+
+def test_deterministic(config):
+    def run():
+        with Simulation(config) as simulation:
+            for i in range(10):
+                simulation.cluster.add_hpa("ns", f"hpa-{i}")
+            simulation.add_components()
+            for _ in range(3):
+                simulation.trigger()
+                simulation.run(310)
+            return simulation.cluster.counts, simulation.cluster.hpas()
+
+    counts, hpas = run()
+    assert (counts, hpas) == run()
+    # Per sequence: Scale up, 30 reconciles and revert of each HPA
+    assert counts["PATCH horizontalpodautoscalers"] == 3 * 10 * 32
+
+
+def test_ramp_down():
+    config = KlutchConfig()
+    fill_config(
+        config,
+        stream=io.StringIO(CONFIG.replace("common:", "common:\n  ramp_down_duration: 120\n  ramp_down_steps: 4")),
+        fmt=Format.yaml,
+    )
+    with Simulation(config) as simulation:
+        simulation.cluster.add_hpa("ns", "a", min_replicas=2, current_replicas=4, scale_percentage=200)
+        simulation.cluster.add_hpa("ns", "b", min_replicas=1, current_replicas=2, scale_percentage=150)
+        simulation.add_components()
+        started_at = simulation.clock.time()
+        simulation.trigger()
+        simulation.run(299)
+        assert (min_replicas(simulation, "a"), min_replicas(simulation, "b")) == (8, 3)
+
+        # Steps of 30s, "a" (scaled up first) staggered to step down after "b"
+        expected = [(315, (7, 3)), (330, (7, 2)), (345, (5, 2)), (375, (4, 2)), (390, (4, 1)), (405, (2, 1))]
+        for at, replicas in expected:
+            simulation.run(started_at + at - 1 - simulation.clock.time())
+            assert (min_replicas(simulation, "a"), min_replicas(simulation, "b")) != replicas
+            simulation.run(1)
+            assert (min_replicas(simulation, "a"), min_replicas(simulation, "b")) == replicas
+        # Reverted at last step, while sequence still active until ramp down ends
+        assert "klutch.it/status" not in simulation.cluster.hpa("ns", "a")["metadata"]["annotations"]
+        assert simulation.is_active_event.is_set()
+        simulation.run(15)
+        assert not simulation.is_active_event.is_set()
+        simulation.tear_down()
@@ -0,0 +1,60 @@
+import base64
+import json
+from datetime import datetime
+from unittest.mock import MagicMock
+
+from kubernetes import client
+
+from .conftest import REFERENCE_TS
+from klutch.status import decode_status_list
+from klutch.status import encode_status_list
+from klutch.status import HpaStatus
+from klutch.status import sequence_status_from_cm
+from klutch.status import sequence_status_from_cms
+from klutch.status import StatusData
+
+
+def get_status_list(count, offset=0):
+    return [HpaStatus(name=f"hpa-{i}", namespace="ns", status=StatusData(1, 2, 4, i)) for i in range(offset, count)]
+
+
+def get_status_cm(data=None, binary_data=None, shard=None, created_at=REFERENCE_TS):
+    cm = MagicMock(spec=client.models.v1_config_map.V1ConfigMap)
+    cm.metadata.creation_timestamp = datetime.fromtimestamp(created_at)
+    cm.metadata.annotations = {"klutch.it/status-shard": str(shard)} if shard is not None else None
+    cm.data = data
+    cm.binary_data = binary_data
+    return cm
+
+
+def test_encode_status_list_is_compact():
+    status_list = get_status_list(1000)
+    encoded = encode_status_list(status_list)
+
+    assert decode_status_list(encoded) == status_list
+    # Raw bytes, as decoded from protobuf
+    assert decode_status_list(base64.b64decode(encoded)) == status_list
+    assert len(encoded) < len(json.dumps([s.dict() for s in status_list])) / 10
+
+
+def test_sequence_status_from_cm_legacy_json():
+    status_list = get_status_list(2)
+    status_cm = get_status_cm(data={"status": json.dumps([s.dict() for s in status_list])})
+
+    sequence_status = sequence_status_from_cm(status_cm)
+
+    assert sequence_status.started_at_ts == datetime.fromtimestamp(REFERENCE_TS).timestamp()
+    assert sequence_status.status_list == status_list
+
+
+def test_sequence_status_from_cms_reassembles_shards(mock_config):
+    shards = [
+        get_status_cm(binary_data={"status": encode_status_list(get_status_list(4, 2))}, shard=1),
+        get_status_cm(binary_data={"status": encode_status_list(get_status_list(2))}, shard=0, created_at=1),
+        get_status_cm(binary_data={"status": encode_status_list(get_status_list(5, 4))}, shard=2),
+    ]
+
+    sequence_status = sequence_status_from_cms(mock_config, shards)
+
+    assert sequence_status.started_at_ts == datetime.fromtimestamp(1).timestamp()
+    assert sequence_status.status_list == get_status_list(5)
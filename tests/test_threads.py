@@ -1,6 +1,8 @@
+import json
 import logging
 import threading
 import time
+from dataclasses import asdict
 from datetime import datetime
 from queue import Empty
 from queue import SimpleQueue
@@ -11,12 +13,22 @@ import pytest
 from kubernetes import client
 
 from .conftest import REFERENCE_TS
+from .test_plan import get_hpa
+from klutch import metrics
+from klutch.cache import HpaCache
 from klutch.config import config as klutch_config
+from klutch.status import HpaStatus
 from klutch.status import SequenceStatus
+from klutch.status import StatusData
+from klutch.scheduler import TRIGGER
+from klutch.plan import ScalePlan
 from klutch.threads import BaseThread
+from klutch.threads import PlanScale
+from klutch.threads import ProcessOrphans
 from klutch.threads import ProcessScaler
 from klutch.threads import TriggerConfigMap
 from klutch.threads import TriggerWebHook
+from klutch.threads import WatchHpas
 
 
 thread_classes = [
@@ -24,6 +36,7 @@ thread_classes = [
     ProcessScaler,
     TriggerConfigMap,
     TriggerWebHook,
+    WatchHpas,
 ]
 
 
@@ -41,6 +54,14 @@ class TestBaseThread:
 
         assert queue.get(block=False)
 
+    @pytest.mark.parametrize("thread_class", thread_classes)
+    def test_trigger_wakes_scheduler(self, mock_config, thread_class):
+        thread = thread_class(SimpleQueue(), threading.Event(), mock_config)
+        thread.scheduler = Mock()
+        thread._trigger()
+
+        thread.scheduler.wake.assert_called_once_with(TRIGGER)
+
     @pytest.mark.parametrize("thread_class", thread_classes)
     def test_is_active(self, mock_config, thread_class):
         is_active_event = threading.Event()
@@ -82,3 +103,446 @@ class TestProcessScaler:
         thread.sequence_status = sequence_status
 
         assert thread._is_status_duration_expired() == expected
+
+    @pytest.mark.parametrize("concurrency", [1, 3])
+    def test_start_sequence(self, mock_config, monkeypatch, concurrency):
+        mock_config.common.patch_concurrency = concurrency
+        hpas = [Mock(name=f"hpa-{i}") for i in range(5)]
+        for i, hpa in enumerate(hpas):
+            hpa.status_data.namespace = "test-ns"
+            hpa.status_data.name = f"hpa-{i}"
+            hpa.metadata.resource_version = str(100 + i)
+        failing_hpa = hpas[2]
+
+        def mock_scale_hpa(config, hpa, logger, target=None):
+            if hpa is failing_hpa:
+                raise client.exceptions.ApiException(status=500)
+            return hpa.status_data, hpa
+
+        mock_create_cm_status = Mock()
+        mock_update_cm_status = Mock()
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", Mock(return_value=iter(hpas)))
+        monkeypatch.setattr("klutch.threads.actions.scale_hpa", mock_scale_hpa)
+        monkeypatch.setattr("klutch.threads.actions.create_cm_status", mock_create_cm_status)
+        monkeypatch.setattr("klutch.threads.actions.update_cm_status", mock_update_cm_status)
+        monkeypatch.setattr("klutch.threads.sequence_status_from_cm", Mock(return_value=SequenceStatus(0, [])))
+
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        thread._start_sequence()
+
+        # Status written before scaling up, then updated
+        assert mock_create_cm_status.call_args.args[1] == []
+        status_list = mock_update_cm_status.call_args.args[1]
+        assert sorted(status_list, key=id) == sorted([h.status_data for h in hpas if h is not failing_hpa], key=id)
+        assert thread._is_active()
+        # Versions of patched HPAs are known to match status, not needing reconcile
+        assert len(thread.reconciled_versions) == 4
+        for hpa in hpas:
+            if hpa is not failing_hpa:
+                key = (hpa.status_data.namespace, hpa.status_data.name)
+                assert thread.reconciled_versions[key] == hpa.metadata.resource_version
+
+    def test_retries_failed_scale_up(self, mock_config, monkeypatch):
+        mock_config.common.reconcile_interval = 10
+        mock_config.common.patch_concurrency = 1
+        hpa = get_hpa("failing", "1")
+        hpa_status = HpaStatus(name="failing", namespace="ns", status=StatusData(2, 4, 8, 0))
+        mock_scale_hpa = Mock(side_effect=[client.exceptions.ApiException(status=503), (hpa_status, hpa)])
+        mock_update_cm_status = Mock()
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", Mock(return_value=[hpa]))
+        monkeypatch.setattr("klutch.threads.actions.scale_hpa", mock_scale_hpa)
+        monkeypatch.setattr("klutch.threads.actions.create_cm_status", Mock())
+        monkeypatch.setattr("klutch.threads.actions.update_cm_status", mock_update_cm_status)
+        monkeypatch.setattr("klutch.threads.sequence_status_from_cm", Mock(return_value=SequenceStatus(0, [])))
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        thread.retry_queue.initial_delay = 0
+
+        thread._start_sequence()
+        assert thread.retry_queue.keys() == [("scale", "ns", "failing")]
+        monkeypatch.setattr(thread, "_is_status_duration_expired", Mock(return_value=False))
+        monkeypatch.setattr(thread, "_continue_sequence", Mock())
+        assert thread.run_once() == 10
+
+        assert len(thread.retry_queue) == 0
+        assert thread.sequence_status.status_list == [hpa_status]
+        assert thread.reconciled_versions[("ns", "failing")] == "1"
+        mock_update_cm_status.assert_called_once_with(mock_config, [hpa_status], 0)
+
+    @pytest.mark.parametrize("status, should_retry", [(500, True), (404, False)])
+    def test_retries_failed_revert(self, mock_config, monkeypatch, status, should_retry):
+        hpa_status = HpaStatus(name="failing", namespace="ns", status=StatusData(2, 4, 8, 0))
+        mock_revert_hpa = Mock(side_effect=[client.exceptions.ApiException(status=status), None])
+        monkeypatch.setattr("klutch.threads.actions.revert_hpa", mock_revert_hpa)
+        monkeypatch.setattr("klutch.threads.actions.delete_cm_status", Mock())
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        thread.retry_queue.initial_delay = 0
+        thread._set_active(SequenceStatus(0, [hpa_status]))
+
+        thread._end_sequence()
+        assert len(thread.retry_queue) == (1 if should_retry else 0)
+        assert not thread._is_active()
+
+        thread.run_once()
+        assert mock_revert_hpa.call_count == (2 if should_retry else 1)
+        assert len(thread.retry_queue) == 0
+
+    def test_end_sequence_skips_hpas_reverted_by_ramp_down(self, mock_config, monkeypatch):
+        mock_config.common.ramp_down_steps = 2
+        status_list = [HpaStatus(name=name, namespace="ns", status=StatusData(2, 4, 8, 0)) for name in "abc"]
+        mock_revert_hpa = Mock()
+        monkeypatch.setattr("klutch.threads.actions.revert_hpa", mock_revert_hpa)
+        monkeypatch.setattr("klutch.threads.actions.delete_cm_status", Mock())
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        thread._set_active(SequenceStatus(0, status_list))
+        thread.ramp_down_steps = {("ns", "a"): 2, ("ns", "b"): 1}
+
+        thread._end_sequence()
+
+        assert [c.args[1].name for c in mock_revert_hpa.call_args_list] == ["b", "c"]
+        assert thread.ramp_down_steps == {}
+
+    def test_continue_sequence_skips_unchanged_cached_hpas(self, mock_config, monkeypatch):
+        mock_config.common.patch_concurrency = 2
+        status_list = [
+            HpaStatus(name=name, namespace="test-ns", status=StatusData(2, 2, 4, REFERENCE_TS))
+            for name in ["unchanged", "changed", "uncached"]
+        ]
+        cached_hpas = {}
+        for name, version in [("unchanged", "10"), ("changed", "21")]:
+            cached_hpas[name] = Mock()
+            cached_hpas[name].metadata.namespace = "test-ns"
+            cached_hpas[name].metadata.name = name
+            cached_hpas[name].metadata.resource_version = version
+        hpa_cache = HpaCache()
+        hpa_cache.replace(cached_hpas.values(), "100")
+
+        reconciled = {}
+
+        def mock_reconcile_hpa(config, hpa_status, logger, hpa=None):
+            reconciled[hpa_status.name] = hpa
+            patched_hpa = Mock()
+            patched_hpa.metadata.resource_version = "30"
+            return patched_hpa
+
+        monkeypatch.setattr("klutch.threads.actions.reconcile_hpa", mock_reconcile_hpa)
+
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config, hpa_cache=hpa_cache)
+        thread.sequence_status = SequenceStatus(REFERENCE_TS, status_list)
+        thread.reconciled_versions = {("test-ns", "unchanged"): "10", ("test-ns", "changed"): "20"}
+        thread._continue_sequence()
+
+        assert reconciled == {"changed": cached_hpas["changed"], "uncached": None}
+        assert thread.reconciled_versions[("test-ns", "changed")] == "30"
+
+    def test_start_sequence_logs_validation_errors_as_warning(self, mock_config, monkeypatch, caplog):
+        mock_config.common.patch_concurrency = 1
+        hpas = [Mock(name="invalid"), Mock(name="failing")]
+
+        def mock_scale_hpa(config, hpa, logger, target=None):
+            if hpa is hpas[0]:
+                raise ValueError("Already has been scaled up.")
+            raise client.exceptions.ApiException(status=500)
+
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", Mock(return_value=iter(hpas)))
+        monkeypatch.setattr("klutch.threads.actions.scale_hpa", mock_scale_hpa)
+        monkeypatch.setattr("klutch.threads.actions.hpa_repr", lambda h: h._mock_name)
+        monkeypatch.setattr("klutch.threads.actions.create_cm_status", Mock())
+        monkeypatch.setattr("klutch.threads.sequence_status_from_cm", Mock(return_value=SequenceStatus(0, [])))
+
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        with caplog.at_level(logging.WARNING):
+            thread._start_sequence()
+
+        records = {r.getMessage().split(":")[0]: r for r in caplog.records if "scaling up" in r.getMessage()}
+        assert records["Not scaling up invalid"].levelno == logging.WARNING
+        assert records["Not scaling up invalid"].exc_info is None
+        assert records["Error scaling up failing"].levelno == logging.ERROR
+        assert records["Error scaling up failing"].exc_info is not None
+
+    def test_start_sequence_checkpoints_in_batches(self, mock_config, monkeypatch):
+        mock_config.common.patch_concurrency = 1
+        mock_config.common.status_checkpoint_size = 2
+        mock_config.common.status_checkpoint_interval = 60.0
+        hpas = [get_hpa(f"hpa-{i}", "1") for i in range(5)]
+        checkpoints = []
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", Mock(return_value=iter(hpas)))
+        monkeypatch.setattr(
+            "klutch.threads.actions.scale_hpa",
+            lambda config, hpa, logger, target=None: (
+                HpaStatus(hpa.metadata.name, "ns", StatusData(1, 2, 4, 0)),
+                hpa,
+            ),
+        )
+        monkeypatch.setattr("klutch.threads.actions.create_cm_status", Mock())
+        monkeypatch.setattr(
+            "klutch.threads.actions.update_cm_status",
+            lambda config, status_list, start: checkpoints.append((start, len(status_list))),
+        )
+        monkeypatch.setattr("klutch.threads.sequence_status_from_cm", Mock(return_value=SequenceStatus(0, [])))
+
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        first_patch_count = metrics.TRIGGER_TO_FIRST_PATCH.count()
+        last_patch_count = metrics.TRIGGER_TO_LAST_PATCH.count()
+        thread._start_sequence(time.monotonic())
+
+        # Only HPAs scaled up since previous checkpoint need to be written
+        assert checkpoints == [(0, 2), (2, 4), (4, 5)]
+        assert metrics.TRIGGER_TO_FIRST_PATCH.count() == first_patch_count + 1
+        assert metrics.TRIGGER_TO_LAST_PATCH.count() == last_patch_count + 1
+
+    def test_start_sequence_scales_up_in_priority_waves(self, mock_config, monkeypatch, caplog):
+        mock_config.common.patch_concurrency = 3
+        mock_config.common.status_checkpoint_size = 100
+        mock_config.common.status_checkpoint_interval = 60.0
+        hpas = [get_hpa(f"hpa-{i}", "1") for i in range(6)]
+        for hpa, priority in zip(hpas, ["1", None, "5", "1", None, "5"]):
+            hpa.metadata.annotations = {"klutch.it/priority": priority} if priority else None
+        in_flight = []
+        waves = []
+
+        def mock_scale_hpa(config, hpa, logger, target=None):
+            in_flight.append(hpa.metadata.name)
+            return HpaStatus(hpa.metadata.name, "ns", StatusData(1, 2, 4, 0)), hpa
+
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", Mock(return_value=iter(hpas)))
+        monkeypatch.setattr("klutch.threads.actions.scale_hpa", mock_scale_hpa)
+        monkeypatch.setattr("klutch.threads.actions.create_cm_status", Mock())
+        monkeypatch.setattr("klutch.threads.actions.update_cm_status", Mock())
+        monkeypatch.setattr("klutch.threads.sequence_status_from_cm", Mock(return_value=SequenceStatus(0, [])))
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        original_scale_up_wave = thread._scale_up_wave
+
+        def scale_up_wave(wave_hpas, scale_plan, triggered_at):
+            # Previous wave completed before starting the next one
+            waves.append(sorted(in_flight))
+            return original_scale_up_wave(wave_hpas, scale_plan, triggered_at)
+
+        monkeypatch.setattr(thread, "_scale_up_wave", scale_up_wave)
+        wave_count = metrics.TRIGGER_TO_WAVE_PATCHED.count(priority="5")
+        with caplog.at_level(logging.INFO):
+            thread._start_sequence(time.monotonic())
+
+        assert waves == [[], ["hpa-2", "hpa-5"], ["hpa-0", "hpa-2", "hpa-3", "hpa-5"]]
+        assert [s.name for s in thread.sequence_status.status_list][:2] in (["hpa-2", "hpa-5"], ["hpa-5", "hpa-2"])
+        assert len(thread.sequence_status.status_list) == 6
+        assert metrics.TRIGGER_TO_WAVE_PATCHED.count(priority="5") == wave_count + 1
+        assert "Scaled up wave of priority 5: 2 HorizontalPodAutoscalers, 0 failed" in caplog.text
+
+    def test_start_up_recovers_unrecorded_hpas(self, mock_config, monkeypatch):
+        mock_config.common.hpa_annotation_status = "kl-status"
+        recorded = HpaStatus("recorded", "ns", StatusData(1, 2, 4, 100))
+        status_cm = Mock()
+        monkeypatch.setattr("klutch.threads.actions.find_cm_status", Mock(return_value=[status_cm]))
+        monkeypatch.setattr(
+            "klutch.threads.sequence_status_from_cms", Mock(return_value=SequenceStatus(100, [recorded]))
+        )
+
+        def annotated_hpa(name, applied_at):
+            hpa = get_hpa(name, "1")
+            hpa.metadata.namespace = "ns"
+            hpa.metadata.annotations = {"kl-status": json.dumps(asdict(StatusData(1, 2, 4, applied_at)))}
+            return hpa
+
+        hpas = [annotated_hpa("recorded", 100), annotated_hpa("unrecorded", 110), annotated_hpa("earlier", 90)]
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", Mock(return_value=hpas))
+        mock_update_cm_status = Mock()
+        monkeypatch.setattr("klutch.threads.actions.update_cm_status", mock_update_cm_status)
+
+        thread = ProcessScaler(SimpleQueue(), threading.Event(), mock_config)
+        thread.set_up()
+
+        assert thread._is_active()
+        assert [s.name for s in thread.sequence_status.status_list] == ["recorded", "unrecorded"]
+        mock_update_cm_status.assert_called_once_with(mock_config, thread.sequence_status.status_list, 1)
+
+    def test_run_once_waits_for_trigger(self, mock_config, monkeypatch):
+        mock_config.common.reconcile_interval = 10
+        queue = SimpleQueue()
+        thread = ProcessScaler(queue, threading.Event(), mock_config)
+        mock_start_sequence = Mock()
+        monkeypatch.setattr(thread, "_start_sequence", mock_start_sequence)
+
+        assert thread.run_once() == thread.queue_wait
+        mock_start_sequence.assert_not_called()
+
+        queue.put(("test", 100.0))
+        assert thread.run_once() == 10
+        mock_start_sequence.assert_called_once_with(100.0)
+
+
+class TestPlanScale:
+    def test_recalculates_changed_hpas_only(self, mock_config, monkeypatch):
+        mock_config.common.scale_plan_interval = 5
+        hpa_cache = HpaCache()
+        scale_plan = ScalePlan()
+        thread = PlanScale(SimpleQueue(), threading.Event(), mock_config, hpa_cache=hpa_cache, scale_plan=scale_plan)
+        hpas = [get_hpa("a", "1"), get_hpa("b", "1"), get_hpa("invalid", "1")]
+
+        def mock_plan_scale_hpa(config, hpa):
+            if hpa.metadata.name == "invalid":
+                raise ValueError("invalid")
+            return Mock(resource_version=hpa.metadata.resource_version)
+
+        mock_plan = Mock(side_effect=mock_plan_scale_hpa)
+        monkeypatch.setattr("klutch.threads.actions.plan_scale_hpa", mock_plan)
+
+        # Waits for cache to be synced
+        assert thread.run_once() == 5
+        assert scale_plan.age() is None
+
+        hpa_cache.replace(hpas, "100")
+        assert thread.run_once() == 5
+        assert mock_plan.call_count == 3
+        assert len(scale_plan) == 2
+
+        hpa_cache.apply("MODIFIED", get_hpa("a", "2"), "101")
+        mock_plan.reset_mock()
+        thread.run_once()
+        assert [c.args[1].metadata.name for c in mock_plan.call_args_list] == ["a", "invalid"]
+        assert scale_plan.get(get_hpa("a", "2")) is not None
+
+
+class TestProcessOrphans:
+    def test_scans_every_interval_unless_active(self, mock_config, monkeypatch, virtual_clock):
+        mock_config.common.scan_orphans_interval = 300
+        mock_find_hpas = Mock(return_value=[])
+        monkeypatch.setattr("klutch.threads.actions.find_hpas", mock_find_hpas)
+        is_active_event = threading.Event()
+        thread = ProcessOrphans(SimpleQueue(), is_active_event, mock_config)
+
+        virtual_clock.advance(100)
+        assert thread.run_once() == 200
+        mock_find_hpas.assert_not_called()
+
+        virtual_clock.advance(200)
+        assert thread.run_once() == 300
+        assert mock_find_hpas.call_count == 1
+
+        # Scan is postponed while a scaling sequence is active
+        virtual_clock.advance(300)
+        is_active_event.set()
+        assert thread.run_once() == 300
+        is_active_event.clear()
+        virtual_clock.advance(100)
+        assert thread.run_once() == 200
+        assert mock_find_hpas.call_count == 1
+
+
+class TestWatchHpas:
+    def test_relists_on_gone(self, mock_config, monkeypatch):
+        mock_config.common.watch_timeout = 5
+        hpa_cache = HpaCache()
+        thread = WatchHpas(SimpleQueue(), threading.Event(), mock_config, hpa_cache=hpa_cache)
+
+        mock_list_hpas = Mock(return_value=([], "100"))
+        watched_versions = []
+
+        def mock_watch_hpas(config, resource_version, timeout_seconds, namespace=None):
+            watched_versions.append(resource_version)
+            if len(watched_versions) == 1:
+                yield "BOOKMARK", None, "101"
+                raise client.exceptions.ApiException(status=410)
+            thread.stop()
+            yield "BOOKMARK", None, "201"
+
+        monkeypatch.setattr("klutch.threads.actions.list_hpas", mock_list_hpas)
+        monkeypatch.setattr("klutch.threads.actions.watch_hpas", mock_watch_hpas)
+
+        thread.run()
+
+        assert mock_list_hpas.call_count == 2
+        assert watched_versions == ["100", "100"]
+        assert hpa_cache.is_synced()
+        assert hpa_cache.resource_version == "201"
+
+
+class TestTriggerConfigMap:
+    @pytest.fixture
+    def thread(self, mock_config):
+        mock_config.trigger_config_map.scan_interval = 0
+        mock_config.trigger_config_map.watch = True
+        mock_config.trigger_config_map.watch_retry_interval = 60
+        mock_config.common.watch_timeout = 5
+        return TriggerConfigMap(SimpleQueue(), threading.Event(), mock_config)
+
+    def test_triggers_on_watched_trigger(self, thread, monkeypatch):
+        mock_cm = MagicMock(spec=client.models.v1_config_map.V1ConfigMap)
+        watched_versions = []
+
+        def mock_watch_cm_triggers(config, resource_version, timeout_seconds):
+            watched_versions.append(resource_version)
+            yield "ADDED", mock_cm, "101"
+            yield "DELETED", mock_cm, "102"
+            thread.stop()
+
+        monkeypatch.setattr("klutch.threads.actions.list_cm_triggers", Mock(return_value=([], "100")))
+        monkeypatch.setattr("klutch.threads.actions.watch_cm_triggers", mock_watch_cm_triggers)
+        monkeypatch.setattr("klutch.threads.actions.validate_cm_trigger", Mock(return_value=True))
+        mock_delete = Mock()
+        monkeypatch.setattr("klutch.threads.actions.delete_cm_trigger", mock_delete)
+
+        thread.run()
+
+        assert watched_versions == ["100"]
+        assert thread.queue.get(block=False)
+        assert thread.queue.empty()
+        mock_delete.assert_called_once_with(mock_cm)
+
+    def test_falls_back_to_scanning_on_watch_failure(self, thread, monkeypatch):
+        mock_watch = Mock(side_effect=client.exceptions.ApiException(status=500))
+        scans = []
+
+        def mock_list_cm_triggers(config):
+            scans.append(1)
+            if len(scans) == 3:
+                thread.stop()
+            return [], "100"
+
+        monkeypatch.setattr("klutch.threads.actions.list_cm_triggers", mock_list_cm_triggers)
+        monkeypatch.setattr("klutch.threads.actions.watch_cm_triggers", mock_watch)
+
+        thread.run()
+
+        # Initial scan before watching, followed by scans while in fallback period
+        assert len(scans) == 3
+        assert mock_watch.call_count == 1
+        assert thread.watch_failed_at is not None
+
+    @pytest.mark.parametrize("delete_status", [404, 409])
+    def test_delete_error_does_not_fail_watch(self, thread, monkeypatch, delete_status):
+        mock_cm = MagicMock(spec=client.models.v1_config_map.V1ConfigMap)
+        mock_watch_calls = []
+
+        def mock_watch_cm_triggers(config, resource_version, timeout_seconds):
+            mock_watch_calls.append(resource_version)
+            yield "ADDED", mock_cm, "101"
+            thread.stop()
+
+        monkeypatch.setattr("klutch.threads.actions.list_cm_triggers", Mock(return_value=([], "100")))
+        monkeypatch.setattr("klutch.threads.actions.watch_cm_triggers", mock_watch_cm_triggers)
+        monkeypatch.setattr("klutch.threads.actions.validate_cm_trigger", Mock(return_value=True))
+        monkeypatch.setattr(
+            "klutch.threads.actions.delete_cm_trigger",
+            Mock(side_effect=client.exceptions.ApiException(status=delete_status)),
+        )
+
+        thread.run()
+
+        assert thread.queue.get(block=False)
+        assert thread.watch_failed_at is None
+
+    def test_scan_error_in_fallback_does_not_stop_thread(self, thread, monkeypatch):
+        thread.config.trigger_config_map.watch = False
+        scans = []
+
+        def mock_list_cm_triggers(config):
+            scans.append(1)
+            if len(scans) == 2:
+                thread.stop()
+            raise client.exceptions.ApiException(status=500)
+
+        monkeypatch.setattr("klutch.threads.actions.list_cm_triggers", mock_list_cm_triggers)
+
+        thread.run()
+
+        assert len(scans) == 2